@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.spatial.distance import cdist
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.cluster import KMeans
+from sklearn.neighbors import KDTree, KNeighborsRegressor
+from sklearn.utils.validation import check_array, check_is_fitted
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datasets import load_csv
+
+
+ALGORITHMS = ['kd_tree', 'ivf']
+METRICS = {'manhattan': 'cityblock', 'cityblock': 'cityblock', 'l1': 'cityblock',
+           'euclidean': 'euclidean', 'l2': 'euclidean'}
+
+# rows per query batch handed to a worker thread; KDTree.query releases the GIL
+CHUNK_SIZE = 1024
+
+# inserted rows are searched by brute force next to the tree until they reach this share of it,
+# then the tree is rebuilt once with all of them
+MAX_PENDING = 0.25
+
+N_PROBES = [1, 2, 4, 8, 16]
+REPEATS = 3
+
+
+def _metric(metric, p):
+    if metric == 'minkowski':
+        metric = {1: 'manhattan', 2: 'euclidean'}.get(p)
+    if metric not in METRICS:
+        raise ValueError(f"Unsupported metric '{metric}', expected one of {', '.join(METRICS)} "
+                         f"or minkowski with p=1/2")
+    return METRICS[metric]
+
+
+def _merge(dist, ind, new_dist, new_ind, k):
+    # k smallest of two candidate sets, row by row, sorted by distance
+    dist = np.concatenate([dist, new_dist], axis=1)
+    ind = np.concatenate([ind, new_ind], axis=1)
+    if dist.shape[1] > k:
+        keep = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        dist, ind = np.take_along_axis(dist, keep, 1), np.take_along_axis(ind, keep, 1)
+    order = np.argsort(dist, axis=1, kind='stable')
+    return np.take_along_axis(dist, order, 1), np.take_along_axis(ind, order, 1)
+
+
+class IndexedKNNRegressor(RegressorMixin, BaseEstimator):
+    """KNeighborsRegressor with an index that outlives `fit`: new rows go in with `partial_fit` instead
+    of a refit, and a pickled model reloads its tree rather than rebuilding it.
+
+    algorithm='kd_tree' is exact. Inserted rows are brute-forced beside the tree until `max_pending` of
+    it, then folded in. algorithm='ivf' is approximate for bigger catalogues: k-means cells, with each
+    query scanning its `n_probe` nearest cells. Inserts just join their nearest cell."""
+
+    def __init__(self, n_neighbors=5, weights='uniform', metric='manhattan', p=2, algorithm='kd_tree',
+                 leaf_size=40, n_lists=None, n_probe=2, n_jobs=None, chunk_size=CHUNK_SIZE,
+                 max_pending=MAX_PENDING, random_state=0):
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.metric = metric
+        self.p = p
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        if self.algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm '{self.algorithm}', expected one of {', '.join(ALGORITHMS)}")
+        if self.weights not in ('uniform', 'distance'):
+            raise ValueError(f"Unknown weights '{self.weights}', expected 'uniform' or 'distance'")
+        self.metric_ = _metric(self.metric, self.p)
+        X = check_array(X, dtype=np.float64)
+        self.n_features_in_ = X.shape[1]
+        self.y_ = np.asarray(y, dtype=np.float64)
+        self._build(X)
+        return self
+
+    def _build(self, X):
+        if self.algorithm == 'kd_tree':
+            self.tree_ = KDTree(X, leaf_size=self.leaf_size, metric=self.metric_)
+            self.n_indexed_ = len(X)
+            self.pending_ = np.empty((0, X.shape[1]))
+        else:
+            n_lists = self.n_lists or max(1, int(np.sqrt(len(X))))
+            kmeans = KMeans(n_clusters=n_lists, n_init=1, random_state=self.random_state).fit(X)
+            self.centroids_ = kmeans.cluster_centers_
+            self.lists_ = [np.flatnonzero(kmeans.labels_ == i) for i in range(n_lists)]
+            self.list_data_ = [X[ids] for ids in self.lists_]
+
+    def partial_fit(self, X, y):
+        # adds rows to the index; on an unfitted model this is fit
+        if not hasattr(self, 'y_'):
+            return self.fit(X, y)
+        X = check_array(X, dtype=np.float64)
+        ids = np.arange(len(self.y_), len(self.y_) + len(X))
+        self.y_ = np.concatenate([self.y_, np.asarray(y, dtype=np.float64)])
+        if self.algorithm == 'kd_tree':
+            self.pending_ = np.concatenate([self.pending_, X])
+            if len(self.pending_) > self.max_pending * self.n_indexed_:
+                self.compact()
+        else:
+            cells = cdist(X, self.centroids_, self.metric_).argmin(axis=1)
+            for cell in np.unique(cells):
+                rows = cells == cell
+                self.lists_[cell] = np.concatenate([self.lists_[cell], ids[rows]])
+                self.list_data_[cell] = np.concatenate([self.list_data_[cell], X[rows]])
+        return self
+
+    def compact(self):
+        # kd_tree: rebuild with the pending rows; ivf cells never need it
+        check_is_fitted(self, 'y_')
+        if self.algorithm == 'kd_tree' and len(self.pending_):
+            self._build(np.concatenate([np.asarray(self.tree_.data), self.pending_]))
+        return self
+
+    @property
+    def n_samples_fit_(self):
+        return len(self.y_)
+
+    def _kneighbors_chunk(self, X, k):
+        if self.algorithm == 'kd_tree':
+            dist, ind = self.tree_.query(X, k=min(k, self.n_indexed_))
+            if len(self.pending_):
+                new_dist = cdist(X, self.pending_, self.metric_)
+                new_ind = np.broadcast_to(np.arange(self.n_indexed_, self.n_indexed_ + len(self.pending_)),
+                                          new_dist.shape)
+                dist, ind = _merge(dist, ind, new_dist, new_ind, k)
+            return dist, ind
+
+        # rows whose probed cells hold fewer than k points probe twice as many cells, until all have k
+        n_cells = len(self.centroids_)
+        n_probe = min(self.n_probe, n_cells)
+        dist, ind = self._probe(X, k, n_probe)
+        short = np.isinf(dist[:, -1])
+        while short.any() and n_probe < n_cells:
+            n_probe = min(2 * n_probe, n_cells)
+            dist[short], ind[short] = self._probe(X[short], k, n_probe)
+            short = np.isinf(dist[:, -1])
+        return dist, ind
+
+    def _probe(self, X, k, n_probe):
+        probes = np.argpartition(cdist(X, self.centroids_, self.metric_), n_probe - 1, axis=1)[:, :n_probe]
+        dist = np.full((len(X), k), np.inf)
+        ind = np.zeros((len(X), k), dtype=np.intp)
+        # cell by cell, each against every query probing it, so the Python loop is over cells not rows
+        by_cell = np.argsort(probes, axis=None, kind='stable')
+        cells, starts = np.unique(probes.ravel()[by_cell], return_index=True)
+        for cell, rows in zip(cells, np.split(by_cell // n_probe, starts[1:])):
+            if not len(self.lists_[cell]):
+                continue
+            cell_dist = cdist(X[rows], self.list_data_[cell], self.metric_)
+            cell_ind = np.broadcast_to(self.lists_[cell], cell_dist.shape)
+            dist[rows], ind[rows] = _merge(dist[rows], ind[rows], cell_dist, cell_ind, k)
+        return dist, ind
+
+    def kneighbors(self, X, n_neighbors=None, return_distance=True):
+        check_is_fitted(self, 'y_')
+        X = check_array(X, dtype=np.float64)
+        k = n_neighbors or self.n_neighbors
+        if k > self.n_samples_fit_:
+            raise ValueError(f"Expected n_neighbors <= n_samples_fit, but n_neighbors = {k}, "
+                             f"n_samples_fit = {self.n_samples_fit_}")
+        chunks = [X[start:start + self.chunk_size] for start in range(0, len(X), self.chunk_size)]
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else (self.n_jobs or 1)
+        if n_jobs > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(n_jobs) as pool:
+                parts = list(pool.map(lambda chunk: self._kneighbors_chunk(chunk, k), chunks))
+        else:
+            parts = [self._kneighbors_chunk(chunk, k) for chunk in chunks]
+        dist = np.concatenate([d for d, _ in parts]) if parts else np.empty((0, k))
+        ind = np.concatenate([i for _, i in parts]) if parts else np.empty((0, k), dtype=np.intp)
+        return (dist, ind) if return_distance else ind
+
+    def predict(self, X):
+        dist, ind = self.kneighbors(X)
+        neighbours = self.y_[ind]
+        if self.weights == 'uniform':
+            return neighbours.mean(axis=1)
+        # as KNeighborsRegressor: exact matches, when there are any, take all the weight
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / dist
+        exact = np.isinf(weights)
+        exact_rows = exact.any(axis=1)
+        weights[exact_rows] = exact[exact_rows]
+        return (neighbours * weights).sum(axis=1) / weights.sum(axis=1)
+
+
+def add_rows(pipeline, x, y):
+    # new diamonds into a fitted pipeline: through its fitted preprocessing, then into the index
+    pipeline[-1].partial_fit(pipeline[:-1].transform(x), y)
+    return pipeline
+
+
+def save_index(pipeline, path):
+    with open(path, 'wb') as f:
+        pickle.dump(pipeline, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_index(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _best_of(fn, repeat=REPEATS):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _recall(dist, exact_dist):
+    # share of returned neighbours at least as close as the true k-th; duplicate diamonds make
+    # index-based recall undercount
+    kth = exact_dist[:, -1:] * (1 + 1e-9) + 1e-12
+    return float(np.mean(dist <= kth))
+
+
+def report(n_neighbors=5, n_probes=N_PROBES, n_jobs=None, scale=1):
+    from benchmarks import WORKLOADS, scale_up, split
+
+    path, read_kwargs, setup = WORKLOADS['diamonds_knn']
+    x, y, build = setup(scale_up(load_csv(path, **read_kwargs), scale))
+    x_train, x_test, y_train, y_test = split(x, y)
+    preprocessing = build(x_train)[:-1].fit(x_train, y_train)
+    xt_train, xt_test = preprocessing.transform(x_train), preprocessing.transform(x_test)
+    one = xt_test[:1]
+
+    brute = KNeighborsRegressor(n_neighbors=n_neighbors, metric='manhattan', algorithm='brute')
+    exact_dist, _ = brute.fit(xt_train, y_train).kneighbors(xt_test)
+
+    results = []
+
+    def measure(name, model, fit_s):
+        batch_s, (dist, _) = _best_of(lambda: model.kneighbors(xt_test))
+        one_s, _ = _best_of(lambda: model.predict(one), REPEATS * 10)
+        results.append({
+            'index': name,
+            'fit_s': fit_s,
+            'batch_ms': batch_s * 1e3,
+            'one_row_ms': one_s * 1e3,
+            'recall': _recall(dist, exact_dist),
+            'mae': float(np.mean(np.abs(model.predict(xt_test) - y_test.to_numpy()))),
+        })
+
+    for name, model in [('brute force (sklearn)', brute),
+                        ('KNeighborsRegressor auto', KNeighborsRegressor(n_neighbors=n_neighbors, metric='manhattan')),
+                        ('kd_tree', IndexedKNNRegressor(n_neighbors, n_jobs=n_jobs))]:
+        fit_s, _ = _best_of(lambda: model.fit(xt_train, y_train), 1)
+        measure(name, model, fit_s)
+    kd_fit_s = results[-1]['fit_s']
+
+    # one clustering serves every n_probe
+    ivf = IndexedKNNRegressor(n_neighbors, algorithm='ivf', n_jobs=n_jobs)
+    fit_s, _ = _best_of(lambda: ivf.fit(xt_train, y_train), 1)
+    for n_probe in n_probes:
+        measure(f'ivf n_probe={n_probe}', ivf.set_params(n_probe=n_probe), fit_s)
+
+    # insertion: the last 1,000 training diamonds arrive after the fit
+    head = len(xt_train) - 1000
+    grown = IndexedKNNRegressor(n_neighbors).fit(xt_train[:head], y_train.iloc[:head])
+    start = time.perf_counter()
+    grown.partial_fit(xt_train[head:], y_train.iloc[head:])
+    insert_s = time.perf_counter() - start
+    refit = IndexedKNNRegressor(n_neighbors).fit(xt_train, y_train)
+    insertion = {
+        'rows': len(xt_train) - head,
+        'partial_fit_s': insert_s,
+        'refit_s': kd_fit_s,
+        'same_neighbours': bool(np.allclose(grown.kneighbors(xt_test)[0], refit.kneighbors(xt_test)[0])),
+    }
+
+    def fit_pipeline():
+        return build(x_train).set_params(model=IndexedKNNRegressor(n_neighbors)).fit(x_train, y_train)
+
+    pipeline_fit_s, pipeline = _best_of(fit_pipeline, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, 'diamonds_knn.pkl')
+        save_index(pipeline, index_path)
+        load_s, loaded = _best_of(lambda: load_index(index_path))
+        persistence = {
+            'kb': os.path.getsize(index_path) / 1024,
+            'load_s': load_s,
+            'fit_s': pipeline_fit_s,
+            'same_predictions': bool(np.array_equal(loaded.predict(x_test), pipeline.predict(x_test))),
+        }
+
+    return {'rows': len(xt_train), 'queries': len(xt_test), 'features': xt_train.shape[1],
+            'n_neighbors': n_neighbors, 'indexes': results, 'insertion': insertion, 'persistence': persistence}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall vs latency of the diamonds KNN indexes against '
+                                                 'exact brute force')
+    parser.add_argument('--neighbors', type=int, default=5)
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--scale', type=int, default=1, help='catalogue size as a multiple of diamonds.csv')
+    parser.add_argument('--report', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    results = report(args.neighbors, n_jobs=args.n_jobs, scale=args.scale)
+    print(f"{results['rows']:,} diamonds indexed, {results['queries']:,} queries, k={results['n_neighbors']}, "
+          f"{results['features']} features")
+    print(f"{'index':26}  {'fit s':>7}  {'batch ms':>9}  {'1 row ms':>8}  {'recall':>7}  {'MAE':>8}")
+    for row in results['indexes']:
+        print(f"{row['index']:26}  {row['fit_s']:7.3f}  {row['batch_ms']:9.1f}  {row['one_row_ms']:8.3f}  "
+              f"{row['recall']:7.4f}  {row['mae']:8.1f}")
+    insertion, persistence = results['insertion'], results['persistence']
+    print(f"insert {insertion['rows']:,} rows: {insertion['partial_fit_s'] * 1e3:.1f}ms vs refit "
+          f"{insertion['refit_s'] * 1e3:.1f}ms, same neighbours as a refit: {insertion['same_neighbours']}")
+    print(f"pickled pipeline {persistence['kb']:,.0f}KB: load {persistence['load_s'] * 1e3:.1f}ms vs fit "
+          f"{persistence['fit_s'] * 1e3:.1f}ms, same predictions: {persistence['same_predictions']}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from batch import TARGET
+
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'car_sales_data.csv')
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aggregates.npz')
+
+# finest grain kept; every dashboard view is a roll-up of these cells
+KEYS = ['Manufacturer', 'Model', 'Fuel type', 'Year of manufacture']
+KEY_DTYPES = {'Manufacturer': str, 'Model': str, 'Fuel type': str, 'Year of manufacture': 'int64', TARGET: 'float64'}
+
+# log-spaced price buckets (DDSketch style): any quantile read back is within 1% of the true value
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+MIN_VALUE = 10.0
+MAX_VALUE = 1e7
+N_BUCKETS = int(np.ceil(np.log(MAX_VALUE / MIN_VALUE) / np.log(GAMMA))) + 1
+
+BLOCK_BYTES = 64 * 1024 * 1024
+HEAD_BYTES = 64 * 1024
+
+
+def meta_path(store_path):
+    return os.path.splitext(store_path)[0] + '.json'
+
+
+def bucket_index(values):
+    values = np.clip(np.asarray(values, dtype=np.float64), MIN_VALUE, MAX_VALUE)
+    return np.ceil(np.log(values / MIN_VALUE) / np.log(GAMMA)).astype(np.int64)
+
+
+def bucket_value(index):
+    # midpoint in relative terms, so the error is at most RELATIVE_ACCURACY either side
+    return MIN_VALUE * 2 * GAMMA ** index / (GAMMA + 1)
+
+
+def head_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(HEAD_BYTES)).hexdigest()
+
+
+def iter_blocks(path, offset, columns=KEYS + [TARGET], dtype=KEY_DTYPES, block_bytes=BLOCK_BYTES):
+    # yields (frame, end offset) for the complete lines after `offset`; a half-written last line waits for next time
+    with open(path, 'rb') as f:
+        header = f.readline().decode().strip().split(',')
+        offset = max(offset, f.tell())
+        f.seek(offset)
+        carry = b''
+        while True:
+            block = f.read(block_bytes)
+            if not block:
+                return
+            data = carry + block
+            cut = data.rfind(b'\n') + 1
+            carry = data[cut:]
+            if cut == 0:
+                continue
+            frame = pd.read_csv(io.BytesIO(data[:cut]), header=None, names=header,
+                                usecols=columns, dtype=dtype)
+            offset += cut
+            yield frame, offset
+
+
+def _summarize(frame):
+    frame = frame.dropna().assign(price_sq=lambda f: np.square(f[TARGET]))
+    grouped = frame.groupby(KEYS, sort=False)
+    cells = grouped.agg(count=(TARGET, 'count'), sum=(TARGET, 'sum'), sum_sq=('price_sq', 'sum'),
+                        min=(TARGET, 'min'), max=(TARGET, 'max'))
+
+    hist = np.zeros((len(cells), N_BUCKETS), dtype=np.int64)
+    np.add.at(hist, (grouped.ngroup().to_numpy(), bucket_index(frame[TARGET])), 1)
+    return cells.reset_index(), hist
+
+
+class AggregateStore:
+
+    def __init__(self, cells=None, hist=None, sources=None):
+        self._lock = threading.Lock()
+        self._reset(cells, hist, sources)
+
+    def _reset(self, cells=None, hist=None, sources=None):
+        self.cells = cells if cells is not None else pd.DataFrame(
+            {**{key: pd.Series(dtype=KEY_DTYPES[key]) for key in KEYS},
+             'count': pd.Series(dtype='int64'), 'sum': pd.Series(dtype='float64'),
+             'sum_sq': pd.Series(dtype='float64'), 'min': pd.Series(dtype='float64'),
+             'max': pd.Series(dtype='float64')})
+        self.hist = hist if hist is not None else np.zeros((0, N_BUCKETS), dtype=np.int64)
+        self.sources = sources or {}
+        self._index = {key: i for i, key in enumerate(self.cells[KEYS].itertuples(index=False, name=None))}
+        self._rollups = {}
+
+    @property
+    def rows(self):
+        return int(self.cells['count'].sum())
+
+    def _merge(self, cells, hist):
+        keys = list(cells[KEYS].itertuples(index=False, name=None))
+        positions = np.array([self._index.get(key, -1) for key in keys], dtype=np.int64)
+        new = positions < 0
+
+        if new.any():
+            start = len(self.cells)
+            positions[new] = np.arange(start, start + new.sum())
+            for key, position in zip([k for k, is_new in zip(keys, new) if is_new], positions[new]):
+                self._index[key] = int(position)
+            empty = cells.loc[new, KEYS].assign(count=0, sum=0.0, sum_sq=0.0, min=np.inf, max=-np.inf)
+            self.cells = pd.concat([self.cells, empty], ignore_index=True)
+            self.hist = np.vstack([self.hist, np.zeros((new.sum(), N_BUCKETS), dtype=np.int64)])
+
+        target = self.cells.iloc[positions]
+        self.cells.loc[positions, 'count'] = target['count'].to_numpy() + cells['count'].to_numpy()
+        self.cells.loc[positions, 'sum'] = target['sum'].to_numpy() + cells['sum'].to_numpy()
+        self.cells.loc[positions, 'sum_sq'] = target['sum_sq'].to_numpy() + cells['sum_sq'].to_numpy()
+        self.cells.loc[positions, 'min'] = np.minimum(target['min'].to_numpy(), cells['min'].to_numpy())
+        self.cells.loc[positions, 'max'] = np.maximum(target['max'].to_numpy(), cells['max'].to_numpy())
+        self.hist[positions] += hist
+        self._rollups.clear()
+
+    def update(self, path=DATA_PATH):
+        # only the bytes appended since the last update are read; a rewritten file is rebuilt from scratch
+        path = os.path.abspath(path)
+        with self._lock:
+            source = self.sources.get(path)
+            size = os.path.getsize(path)
+            if source is not None and (size < source['offset'] or head_hash(path) != source['head_sha256']):
+                if len(self.sources) > 1:
+                    raise ValueError(f"{path} was rewritten; rebuild the store from all its sources")
+                self._reset()
+                source = None
+            if source is not None and size == source['offset']:
+                return 0
+
+            offset = source['offset'] if source else 0
+            added = 0
+            for frame, offset in iter_blocks(path, offset):
+                self._merge(*_summarize(frame))
+                added += len(frame)
+            self.sources[path] = {
+                'offset': offset,
+                'rows': (source['rows'] if source else 0) + added,
+                'head_sha256': head_hash(path),
+                'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+            return added
+
+    def rollup(self, by):
+        with self._lock:
+            key = tuple(by)
+            if key not in self._rollups:
+                self._rollups[key] = self._rollup(list(by))
+            return self._rollups[key]
+
+    def _rollup(self, by):
+        # cost depends on the number of cells, not on how many sales went into them
+        cells, hist = self.cells, self.hist
+        codes, groups = pd.factorize(pd.MultiIndex.from_frame(cells[by]) if len(by) > 1 else cells[by[0]], sort=True)
+        counts = np.bincount(codes, weights=cells['count'], minlength=len(groups))
+        sums = np.bincount(codes, weights=cells['sum'], minlength=len(groups))
+        sum_sq = np.bincount(codes, weights=cells['sum_sq'], minlength=len(groups))
+        membership = np.zeros((len(groups), len(cells)))
+        membership[codes, np.arange(len(cells))] = 1.0
+        group_hist = membership @ hist
+
+        mean = sums / np.maximum(counts, 1)
+        out = pd.DataFrame({
+            'count': counts.astype(np.int64),
+            'mean': mean,
+            'std': np.sqrt(np.maximum(sum_sq / np.maximum(counts, 1) - mean ** 2, 0.0)),
+            'p25': self._quantiles(group_hist, 0.25),
+            'median': self._quantiles(group_hist, 0.5),
+            'p75': self._quantiles(group_hist, 0.75),
+        }, index=groups)
+        out.index.names = by
+        return out
+
+    @staticmethod
+    def _quantiles(hist, q):
+        cumulative = np.cumsum(hist, axis=1)
+        rank = np.ceil(q * cumulative[:, -1:]).clip(min=1)
+        return bucket_value((cumulative < rank).sum(axis=1))
+
+    def save(self, path=STORE_PATH):
+        arrays = {f'key_{i}': self.cells[key].to_numpy(dtype=np.int64 if key == 'Year of manufacture' else str)
+                  for i, key in enumerate(KEYS)}
+        arrays.update({name: self.cells[name].to_numpy() for name in ['count', 'sum', 'sum_sq', 'min', 'max']})
+
+        # written next to the target and renamed over it, so readers never load a partial store
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-', suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, hist=self.hist, **arrays)
+        os.replace(tmp, path)
+        with open(meta_path(path), 'w') as f:
+            json.dump({'relative_accuracy': RELATIVE_ACCURACY, 'n_buckets': N_BUCKETS,
+                       'sources': self.sources}, f, indent=2)
+
+    @classmethod
+    def load(cls, path=STORE_PATH):
+        with open(meta_path(path)) as f:
+            meta = json.load(f)
+        if meta['n_buckets'] != N_BUCKETS or meta['relative_accuracy'] != RELATIVE_ACCURACY:
+            raise ValueError('Aggregate store was built with different sketch settings; rebuild it')
+        with np.load(path) as data:
+            cells = pd.DataFrame({key: data[f'key_{i}'] for i, key in enumerate(KEYS)})
+            for name in ['count', 'sum', 'sum_sq', 'min', 'max']:
+                cells[name] = data[name]
+            hist = data['hist']
+        return cls(cells, hist, meta['sources'])
+
+
+def refresh(store, path=STORE_PATH, source=DATA_PATH):
+    # a stat() when nothing was appended; otherwise folds in just the new rows and saves the store back
+    added = store.update(source)
+    if added:
+        store.save(path)
+    return added
+
+
+def load_store(path=STORE_PATH, source=DATA_PATH):
+    store = AggregateStore.load(path) if os.path.exists(path) and os.path.exists(meta_path(path)) else AggregateStore()
+    refresh(store, path, source)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or update the sales aggregate store behind the dashboard')
+    parser.add_argument('sources', nargs='*', default=[DATA_PATH], help='append-only sales CSVs')
+    parser.add_argument('--store', default=STORE_PATH)
+    parser.add_argument('--rebuild', action='store_true', help='ignore the saved store and rescan every source')
+    args = parser.parse_args()
+
+    exists = os.path.exists(args.store) and os.path.exists(meta_path(args.store))
+    store = AggregateStore.load(args.store) if exists and not args.rebuild else AggregateStore()
+    for source in args.sources:
+        start = time.perf_counter()
+        added = store.update(source)
+        print(f"{source}: +{added:,} rows in {(time.perf_counter() - start) * 1e3:.1f}ms")
+    store.save(args.store)
+
+    start = time.perf_counter()
+    for by in [['Manufacturer'], ['Fuel type'], ['Year of manufacture']]:
+        store.rollup(by)
+    query_ms = (time.perf_counter() - start) * 1e3
+    print(f"{store.rows:,} rows in {len(store.cells):,} cells; three dashboard roll-ups in {query_ms:.1f}ms")
+    print(store.rollup(['Manufacturer']).round(0).to_string())
+
+
+if __name__ == '__main__':
+    main()
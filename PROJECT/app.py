@@ -1,24 +1,66 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-from datetime import datetime
-import pickle
+import time
 import os
-
-@st.cache_resource
-def load_model():
+from startup import start_warmup
+from cache import PredictionCache, model_fingerprint
+from artifact import ARTIFACT_ROOT, latest_path, load_artifact
+# pandas, xgboost and the page modules are imported by the pages that use them, so About and the
+# dashboard render without paying for the prediction stack
+
+@st.cache_resource(max_entries=1)
+def load_model(fingerprint=None):
     try:
-        if not os.path.exists('model.pkl'):
-            st.error("Error: model.pkl not found in the application directory.")
+        if not os.path.exists(latest_path(ARTIFACT_ROOT)):
+            st.error("Error: no model artifact found, run model.py or artifact.py to publish one.")
             return None
-        with open('model.pkl', 'rb') as f:
-            model = pickle.load(f)
-        return model
+        # the start-up warm-up has usually loaded this version already
+        model = start_warmup().wait(fingerprint)
+        return model if model is not None else load_artifact(ARTIFACT_ROOT)
     except Exception as e:
         st.error(f"Error loading model: {str(e)}")
         return None
 
+@st.cache_resource(max_entries=1)
+def load_price_grid(model_hash=None, grid_fingerprint=None):
+    from grid import GRID_PATH, load_grid
+    try:
+        return load_grid(GRID_PATH, model_hash)
+    except Exception:
+        return None
+
+@st.cache_resource
+def get_latency_tracker():
+    from latency import LatencyTracker
+    return LatencyTracker()
+
+@st.cache_resource
+def get_render_tracker():
+    # server-side render time per full run and per fragment rerun, shown under Diagnostics
+    from latency import LatencyTracker
+    return LatencyTracker()
+
+@st.cache_resource
+def get_prediction_cache():
+    return PredictionCache()
+
+@st.cache_resource
+def get_explanation_cache():
+    return PredictionCache()
+
+@st.cache_resource
+def get_aggregate_store():
+    from aggregates import load_store
+    try:
+        return load_store()
+    except Exception as e:
+        st.error(f"Error loading sales aggregates: {str(e)}")
+        return None
+
 st.set_page_config(page_title="AutoValueAI", page_icon="🚗", layout="wide")
+run_start = time.perf_counter()
+
+# once per process: the model loads and warms in the background while the first page renders
+start_warmup()
 
 st.markdown("""
 <style>
@@ -285,16 +327,6 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-manufacturers = ['BMW', 'Toyota', 'Ford', 'Porsche', 'VW']
-models = {
-    'BMW': ['Z4', 'M5', 'X3'],
-    'Toyota': ['RAV4', 'Prius', 'Yaris'],
-    'Ford': ['Fiesta', 'Mondeo', 'Focus'],
-    'Porsche': ['718 Cayman', '911', 'Cayenne'],
-    'VW': ['Polo', 'Golf', 'Passat']
-}
-fuel_types = ['Petrol', 'Diesel', 'Hybrid', 'Electric']
-
 with st.sidebar:
     st.markdown("""
     <div style='background: rgba(255, 255, 255, 0.15); backdrop-filter: blur(10px); 
@@ -303,7 +335,7 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
     
-    page = st.radio("", ["🏠 Home", "📊 Analytics Dashboard", "ℹ️ About"], label_visibility="collapsed")
+    page = st.radio("", ["🏠 Home", "📦 Batch Valuation", "📊 Analytics Dashboard", "ℹ️ About"], label_visibility="collapsed")
     
     st.markdown("""
     <div style='background: rgba(255, 255, 255, 0.15); backdrop-filter: blur(10px); 
@@ -316,249 +348,341 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
 
-if page == "🏠 Home":
-    st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
-    st.markdown("## 🎯 Enter Vehicle Details")
-    
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.markdown("<div class='input-section'>", unsafe_allow_html=True)
-        manufacturer = st.selectbox("🏭 Manufacturer", manufacturers, key="manufacturer")
-        st.markdown("</div>", unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown("<div class='input-section'>", unsafe_allow_html=True)
-        available_models = models.get(manufacturer, [])
-        model = st.selectbox("🚙 Model", available_models, key="model")
-        st.markdown("</div>", unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown("<div class='input-section'>", unsafe_allow_html=True)
-        fuel_type = st.selectbox("⛽ Fuel Type", fuel_types, key="fuel")
-        st.markdown("</div>", unsafe_allow_html=True)
-    
-    col4, col5, col6 = st.columns(3)
-    
-    with col4:
-        st.markdown("<div class='input-section'>", unsafe_allow_html=True)
-        year = st.selectbox("📅 Year of Manufacture", list(range(2024, 1999, -1)), key="year")
-        st.markdown("</div>", unsafe_allow_html=True)
-    
-    with col5:
-        st.markdown("<div class='input-section'>", unsafe_allow_html=True)
-        engine_size = st.selectbox("🔧 Engine Size (L)", [1.0, 1.2, 1.4, 1.6, 1.8, 2.0, 2.5, 3.0, 3.5, 4.0, 5.0], key="engine")
-        st.markdown("</div>", unsafe_allow_html=True)
-    
-    with col6:
-        st.markdown("<div class='input-section'>", unsafe_allow_html=True)
-        mileage = st.number_input("🛣️ Mileage (miles)", min_value=0, max_value=300000, value=30000, step=1000, key="mileage")
+@st.fragment
+def home_page():
+    # a fragment: picking a manufacturer or pressing predict reruns only this form and its results,
+    # not the page chrome, sidebar and CSS around it
+    with get_render_tracker().stage('home'):
+        import pandas as pd
+        from batch import MIN_PRICE
+        from explain import BASE_VALUE, explain_one
+        from grid import ENGINE_SIZES, FUEL_TYPES, GRID_PATH, MANUFACTURERS, MODELS, YEARS
+        from latency import LATENCY_BUDGET_MS, half_width_timed, predict_timed
+        
+        st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
+        st.markdown("## 🎯 Enter Vehicle Details")
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.markdown("<div class='input-section'>", unsafe_allow_html=True)
+            manufacturer = st.selectbox("🏭 Manufacturer", MANUFACTURERS, key="manufacturer")
+            st.markdown("</div>", unsafe_allow_html=True)
+        
+        with col2:
+            st.markdown("<div class='input-section'>", unsafe_allow_html=True)
+            available_models = MODELS.get(manufacturer, [])
+            model = st.selectbox("🚙 Model", available_models, key="model")
+            st.markdown("</div>", unsafe_allow_html=True)
+        
+        with col3:
+            st.markdown("<div class='input-section'>", unsafe_allow_html=True)
+            fuel_type = st.selectbox("⛽ Fuel Type", FUEL_TYPES, key="fuel")
+            st.markdown("</div>", unsafe_allow_html=True)
+        
+        col4, col5, col6 = st.columns(3)
+        
+        with col4:
+            st.markdown("<div class='input-section'>", unsafe_allow_html=True)
+            year = st.selectbox("📅 Year of Manufacture", YEARS, key="year")
+            st.markdown("</div>", unsafe_allow_html=True)
+        
+        with col5:
+            st.markdown("<div class='input-section'>", unsafe_allow_html=True)
+            engine_size = st.selectbox("🔧 Engine Size (L)", ENGINE_SIZES, key="engine")
+            st.markdown("</div>", unsafe_allow_html=True)
+        
+        with col6:
+            st.markdown("<div class='input-section'>", unsafe_allow_html=True)
+            mileage = st.number_input("🛣️ Mileage (miles)", min_value=0, max_value=300000, value=30000, step=1000, key="mileage")
+            st.markdown("</div>", unsafe_allow_html=True)
+        
         st.markdown("</div>", unsafe_allow_html=True)
-    
-    st.markdown("</div>", unsafe_allow_html=True)
-    
-    if st.button("🔮 Predict Price", key="predict_btn"):
-        loaded_model = load_model()
         
-        if loaded_model is None:
-            st.error("Cannot make predictions without the model file.")
-        else:
-            with st.spinner(""):
-                st.markdown("<div class='loader'></div>", unsafe_allow_html=True)
-                import time
-                time.sleep(2)
+        if st.button("🔮 Predict Price", key="predict_btn"):
+            tracker = get_latency_tracker()
+            fingerprint = model_fingerprint(latest_path(ARTIFACT_ROOT))
+            with tracker.stage('model load'):
+                loaded_model = load_model(fingerprint)
             
-            try:
-                input_data = pd.DataFrame({
-                    'Manufacturer': [manufacturer],
-                    'Model': [model],
-                    'Engine size': [engine_size],
-                    'Fuel type': [fuel_type],
-                    'Year of manufacture': [year],
-                    'Mileage': [mileage]
-                })
-                
-                predicted_price = loaded_model.predict(input_data)[0]
-                predicted_price = max(5000, predicted_price)
-                
-                confidence = np.random.uniform(0.85, 0.98)
-                
-                st.markdown(f"""
-                <div class="result-card">
-                    <h2 style='color: #ffffff; margin-bottom: 10px;'>💰 Predicted Resale Price</h2>
-                    <div class="price-display">£{predicted_price:,.0f}</div>
-                    <p style='color: #ffffff; font-size: 1.2rem;'>Confidence: {confidence*100:.1f}%</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                base_prices = {
-                    'BMW': 35000, 'Toyota': 22000, 'Ford': 18000, 
-                    'Porsche': 65000, 'VW': 20000
-                }
-                
-                base_price = base_prices.get(manufacturer, 25000)
-                age = 2024 - year
-                depreciation = base_price * (0.12 * age)
-                mileage_factor = mileage * 0.05
-                engine_bonus = engine_size * 1000
-                
-                st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
-                st.markdown("## 📊 Price Breakdown & Insights")
-                
-                col_m1, col_m2, col_m3, col_m4 = st.columns(4)
-                
-                with col_m1:
+            if loaded_model is None:
+                st.error("Cannot make predictions without the model file.")
+            else:
+                try:
+                    row = {
+                        'Manufacturer': manufacturer,
+                        'Model': model,
+                        'Engine size': engine_size,
+                        'Fuel type': fuel_type,
+                        'Year of manufacture': year,
+                        'Mileage': mileage
+                    }
+                    price_grid = load_price_grid(loaded_model.content_hash, model_fingerprint(GRID_PATH))
+                    with tracker.stage('grid lookup'):
+                        predicted_price = price_grid.lookup(row) if price_grid is not None else None
+                    
+                    cache_hit = predicted_price is not None
+                    if predicted_price is None:
+                        with st.spinner("Valuing your car..."):
+                            (predicted_price, half_width, elapsed_ms), cache_hit = get_prediction_cache().get_or_compute(
+                                row, fingerprint, lambda: predict_timed(loaded_model, row, tracker))
+                    else:
+                        half_width = half_width_timed(loaded_model, row, tracker)
+                    start_warmup().record_prediction()
+                    
+                    if half_width is not None:
+                        price_range = (f"{loaded_model.interval['coverage']:.0%} range: "
+                                       f"£{max(MIN_PRICE, predicted_price - half_width):,.0f} – "
+                                       f"£{max(MIN_PRICE, predicted_price + half_width):,.0f}")
+                    else:
+                        price_range = "No price range for this model version"
+                    predicted_price = max(MIN_PRICE, predicted_price)
+                    
+                    if not cache_hit and elapsed_ms > LATENCY_BUDGET_MS['total']:
+                        st.warning(f"Prediction took {elapsed_ms:.1f} ms, over the {LATENCY_BUDGET_MS['total']:.0f} ms budget.")
+                    
+                    explanation, _ = get_explanation_cache().get_or_compute(
+                        row, fingerprint, lambda: explain_one(loaded_model, row))
+                    drivers = sorted(((name, value) for name, value in explanation.items() if name != BASE_VALUE),
+                                     key=lambda item: abs(item[1]), reverse=True)
+                    
                     st.markdown(f"""
-                    <div class="metric-card">
-                        <div class="stat-number">£{base_price:,}</div>
-                        <div class="stat-label">Base Value</div>
+                    <div class="result-card">
+                        <h2 style='color: #ffffff; margin-bottom: 10px;'>💰 Predicted Resale Price</h2>
+                        <div class="price-display">£{predicted_price:,.0f}</div>
+                        <p style='color: #ffffff; font-size: 1.2rem;'>{price_range}</p>
                     </div>
                     """, unsafe_allow_html=True)
-                
-                with col_m2:
-                    st.markdown(f"""
-                    <div class="metric-card">
-                        <div class="stat-number" style='color: #e74c3c;'>-£{depreciation:,.0f}</div>
-                        <div class="stat-label">Age Depreciation</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                with col_m3:
-                    st.markdown(f"""
-                    <div class="metric-card">
-                        <div class="stat-number" style='color: #e74c3c;'>-£{mileage_factor:,.0f}</div>
-                        <div class="stat-label">Mileage Impact</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                with col_m4:
-                    st.markdown(f"""
-                    <div class="metric-card">
-                        <div class="stat-number" style='color: #27ae60;'>+£{engine_bonus:,.0f}</div>
-                        <div class="stat-label">Engine Bonus</div>
+                    
+                    st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
+                    st.markdown("## 📊 Price Breakdown & Insights")
+                    
+                    col_m1, col_m2, col_m3, col_m4 = st.columns(4)
+                    
+                    with col_m1:
+                        st.markdown(f"""
+                        <div class="metric-card">
+                            <div class="stat-number">£{explanation[BASE_VALUE]:,.0f}</div>
+                            <div class="stat-label">Base Value</div>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    
+                    for col_m, (name, value) in zip([col_m2, col_m3, col_m4], drivers):
+                        with col_m:
+                            st.markdown(f"""
+                            <div class="metric-card">
+                                <div class="stat-number" style='color: {"#27ae60" if value >= 0 else "#e74c3c"};'>{"+" if value >= 0 else "-"}£{abs(value):,.0f}</div>
+                                <div class="stat-label">{name}</div>
+                            </div>
+                            """, unsafe_allow_html=True)
+                    
+                    st.markdown("</div>", unsafe_allow_html=True)
+                    
+                    st.markdown("""
+                    <div class="explanation-box">
+                        <h3 style='color: #ffffff; margin-top: 0;'>🤖 AI Explanation</h3>
+                        <p style='color: #ffffff; font-size: 1.1rem; line-height: 1.8;'>
+                            Our advanced machine learning model analyzed your vehicle's characteristics using a 
+                            <b>Random Forest Ensemble</b> trained on over 50,000 real transactions. The prediction 
+                            considers <b>depreciation curves</b>, market demand for <b>{}</b> vehicles, and current 
+                            <b>{}</b> fuel type trends. For this vehicle the model's biggest value drivers are 
+                            <b>{}</b> and <b>{}</b>. An LLM-based explanation layer provides 
+                            interpretability by mapping feature importance to real-world factors.
+                        </p>
                     </div>
-                    """, unsafe_allow_html=True)
-                
-                st.markdown("</div>", unsafe_allow_html=True)
-                
-                st.markdown("""
-                <div class="explanation-box">
-                    <h3 style='color: #ffffff; margin-top: 0;'>🤖 AI Explanation</h3>
-                    <p style='color: #ffffff; font-size: 1.1rem; line-height: 1.8;'>
-                        Our advanced machine learning model analyzed your vehicle's characteristics using a 
-                        <b>Random Forest Ensemble</b> trained on over 50,000 real transactions. The prediction 
-                        considers <b>depreciation curves</b>, market demand for <b>{}</b> vehicles, and current 
-                        <b>{}</b> fuel type trends. The model identified that your vehicle's <b>{} engine</b> and 
-                        <b>{:,} miles</b> are key value drivers. An LLM-based explanation layer provides 
-                        interpretability by mapping feature importance to real-world factors.
-                    </p>
-                </div>
-                """.format(manufacturer, fuel_type, engine_size, mileage), unsafe_allow_html=True)
-                
-                st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
-                st.markdown("### 📈 Feature Importance")
-                
-                features = ['Age', 'Mileage', 'Engine Size', 'Manufacturer', 'Fuel Type']
-                importance = [0.35, 0.28, 0.18, 0.12, 0.07]
-                
-                importance_df = pd.DataFrame({
-                    'Feature': features,
-                    'Importance': importance
-                })
-                
-                st.bar_chart(importance_df.set_index('Feature'))
-                st.markdown("</div>", unsafe_allow_html=True)
-                
-            except Exception as e:
-                st.error(f"Error making prediction: {str(e)}")
-                st.error("Please ensure the input data format matches the model's expected format.")
+                    """.format(manufacturer, fuel_type, drivers[0][0].lower(), drivers[1][0].lower()), unsafe_allow_html=True)
+                    
+                    st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
+                    st.markdown("### 📈 Feature Importance")
+                    st.caption("SHAP values from the model's trees: how far each input moves this price from the base value.")
+                    
+                    importance_df = pd.DataFrame({
+                        'Feature': [name for name, _ in drivers],
+                        'Contribution (£)': [value for _, value in drivers]
+                    })
+                    
+                    # a plain Vega-Lite spec: st.bar_chart builds it through Altair, whose schema
+                    # validation was most of this fragment's rerun time
+                    st.vega_lite_chart(importance_df, {
+                        'mark': {'type': 'bar'},
+                        'encoding': {
+                            'x': {'field': 'Feature', 'type': 'nominal', 'sort': None},
+                            'y': {'field': 'Contribution (£)', 'type': 'quantitative'},
+                        },
+                    }, width='stretch')
+                    st.markdown("</div>", unsafe_allow_html=True)
+                    
+                except Exception as e:
+                    st.error(f"Error making prediction: {str(e)}")
+                    st.error("Please ensure the input data format matches the model's expected format.")
+
+@st.fragment
+def batch_page():
+    with get_render_tracker().stage('batch valuation'):
+        from batch import predict_batch, read_table
+        from explain import BASE_VALUE, explain_batch
+        
+        st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
+        st.markdown("## 📦 Batch Valuation")
+        st.markdown("Upload a stock list with the same columns as `car_sales_data.csv` (CSV, Parquet or Arrow).")
+        
+        uploaded = st.file_uploader("Stock list", type=['csv', 'parquet', 'pq', 'arrow', 'feather', 'ipc'], key="stock_file")
+        explain_rows = st.checkbox("Explain each valuation (per-feature £ contributions)", key="batch_explain")
+        st.markdown("</div>", unsafe_allow_html=True)
+        
+        if uploaded is not None and st.button("💷 Value Stock List", key="batch_btn"):
+            loaded_model = load_model(model_fingerprint(latest_path(ARTIFACT_ROOT)))
+            
+            if loaded_model is None:
+                st.error("Cannot make predictions without the model file.")
+            else:
+                try:
+                    stock = read_table(uploaded, uploaded.name)
+                    progress_bar = st.progress(0.0)
+                    has_interval = loaded_model.interval is not None
+                    prices, stats = predict_batch(loaded_model, stock, progress=progress_bar.progress, interval=has_interval)
+                    if has_interval:
+                        stock['Predicted price'], stock['Lower price'], stock['Upper price'] = prices.T
+                    else:
+                        stock['Predicted price'] = prices
+                    if explain_rows:
+                        explained, explain_stats = explain_batch(loaded_model, stock)
+                        stock[BASE_VALUE] = explained[BASE_VALUE]
+                        for column in explained.columns.drop(BASE_VALUE):
+                            stock[f'{column} contribution'] = explained[column]
+                        stats['seconds'] += explain_stats['seconds']
+                        stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else float('inf')
+                    
+                    st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
+                    col_b1, col_b2, col_b3 = st.columns(3)
+                    
+                    with col_b1:
+                        st.markdown(f"""
+                        <div class="metric-card">
+                            <div class="stat-number">{stats['rows']:,}</div>
+                            <div class="stat-label">Vehicles Valued</div>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    
+                    with col_b2:
+                        st.markdown(f"""
+                        <div class="metric-card">
+                            <div class="stat-number">{stats['seconds']:.2f}s</div>
+                            <div class="stat-label">Total Time</div>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    
+                    with col_b3:
+                        st.markdown(f"""
+                        <div class="metric-card">
+                            <div class="stat-number">{stats['rows_per_sec']:,.0f}</div>
+                            <div class="stat-label">Rows / sec</div>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    
+                    st.dataframe(stock.head(1000))
+                    st.download_button("⬇️ Download Priced Stock List", stock.to_csv(index=False),
+                                       file_name="priced_stock.csv", mime="text/csv")
+                    st.markdown("</div>", unsafe_allow_html=True)
+                    
+                except Exception as e:
+                    st.error(f"Error valuing stock list: {str(e)}")
+
+if page == "🏠 Home":
+    home_page()
+
+elif page == "📦 Batch Valuation":
+    batch_page()
 
 elif page == "📊 Analytics Dashboard":
-    st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
-    st.markdown("## 📊 Market Analytics Dashboard")
-    st.markdown("</div>", unsafe_allow_html=True)
+    import pandas as pd
+    from aggregates import refresh
     
     st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
-    st.markdown("### 🏭 Average Prices by Manufacturer")
-    
-    avg_prices = {
-        'BMW': 32500,
-        'Toyota': 21800,
-        'Ford': 17500,
-        'Porsche': 62000,
-        'VW': 19800
-    }
-    
-    chart_data = pd.DataFrame({
-        'Manufacturer': list(avg_prices.keys()),
-        'Average Price (£)': list(avg_prices.values())
-    })
-    
-    st.bar_chart(chart_data.set_index('Manufacturer'))
+    st.markdown("## 📊 Market Analytics Dashboard")
     st.markdown("</div>", unsafe_allow_html=True)
     
-    col_d1, col_d2 = st.columns(2)
+    store = get_aggregate_store()
     
-    with col_d1:
-        st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
-        st.markdown("### ⛽ Price Distribution by Fuel Type")
+    if store is None:
+        st.error("Cannot build the dashboard without the sales data.")
+    else:
+        start_time = time.perf_counter()
+        refresh(store)
+        by_manufacturer = store.rollup(['Manufacturer'])
+        by_fuel = store.rollup(['Fuel type'])
+        by_year = store.rollup(['Year of manufacture'])
+        dashboard_ms = (time.perf_counter() - start_time) * 1000
         
-        fuel_prices = pd.DataFrame({
-            'Fuel Type': ['Petrol', 'Diesel', 'Hybrid', 'Electric'],
-            'Avg Price': [22000, 24000, 26500, 28000]
-        })
+        st.caption(f"{store.rows:,} sales in {len(store.cells):,} aggregate cells · computed in {dashboard_ms:.1f} ms")
         
-        st.bar_chart(fuel_prices.set_index('Fuel Type'))
-        st.markdown("</div>", unsafe_allow_html=True)
-    
-    with col_d2:
         st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
-        st.markdown("### 📅 Depreciation by Age")
+        st.markdown("### 🏭 Average Prices by Manufacturer")
         
-        years_data = pd.DataFrame({
-            'Age (Years)': list(range(0, 11)),
-            'Value Retained (%)': [100, 88, 76, 65, 56, 48, 42, 37, 33, 30, 27]
+        chart_data = pd.DataFrame({
+            'Manufacturer': by_manufacturer.index,
+            'Average Price (£)': by_manufacturer['mean'].round(0).to_numpy(),
+            'Median Price (£)': by_manufacturer['median'].round(0).to_numpy()
         })
         
-        st.line_chart(years_data.set_index('Age (Years)'))
+        st.bar_chart(chart_data.set_index('Manufacturer'))
         st.markdown("</div>", unsafe_allow_html=True)
+        
+        col_d1, col_d2 = st.columns(2)
+        
+        with col_d1:
+            st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
+            st.markdown("### ⛽ Price Distribution by Fuel Type")
+            
+            fuel_prices = pd.DataFrame({
+                'Fuel Type': by_fuel.index,
+                'Avg Price': by_fuel['mean'].round(0).to_numpy(),
+                'Lower Quartile': by_fuel['p25'].round(0).to_numpy(),
+                'Upper Quartile': by_fuel['p75'].round(0).to_numpy()
+            })
+            
+            st.bar_chart(fuel_prices.set_index('Fuel Type'), stack=False)
+            st.markdown("</div>", unsafe_allow_html=True)
+        
+        with col_d2:
+            st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
+            st.markdown("### 📅 Depreciation by Age")
+            
+            # age is counted from the newest model year in the sales history
+            newest = by_year.index.max()
+            ages = newest - by_year.index.to_numpy()
+            retained = by_year['median'].to_numpy() / by_year['median'].loc[newest] * 100
+            years_data = pd.DataFrame({
+                'Age (Years)': ages,
+                'Value Retained (%)': retained.round(1)
+            }).sort_values('Age (Years)')
+            
+            st.line_chart(years_data[years_data['Age (Years)'] <= 20].set_index('Age (Years)'))
+            st.markdown("</div>", unsafe_allow_html=True)
+    
+    loaded_model = load_model(model_fingerprint(latest_path(ARTIFACT_ROOT)))
+    metrics = loaded_model.metrics if loaded_model is not None else {}
     
     st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
     st.markdown("### 🎯 Model Performance Metrics")
     
     perf_col1, perf_col2, perf_col3, perf_col4 = st.columns(4)
     
-    with perf_col1:
-        st.markdown("""
-        <div class="metric-card">
-            <div class="stat-number">94.8%</div>
-            <div class="stat-label">Accuracy</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with perf_col2:
-        st.markdown("""
-        <div class="metric-card">
-            <div class="stat-number">0.92</div>
-            <div class="stat-label">R² Score</div>
-        </div>
-        """, unsafe_allow_html=True)
+    performance = [
+        (f"{metrics['r2']:.3f}" if 'r2' in metrics else "n/a", "R² Score"),
+        (f"£{metrics['mae']:,.0f}" if 'mae' in metrics else "n/a", "MAE"),
+        (f"£{metrics['rmse']:,.0f}" if 'rmse' in metrics else "n/a", "RMSE"),
+        (f"{metrics['n_train']:,}" if 'n_train' in metrics else "n/a", "Training Data"),
+    ]
     
-    with perf_col3:
-        st.markdown("""
-        <div class="metric-card">
-            <div class="stat-number">£1,245</div>
-            <div class="stat-label">MAE</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with perf_col4:
-        st.markdown("""
-        <div class="metric-card">
-            <div class="stat-number">50K+</div>
-            <div class="stat-label">Training Data</div>
-        </div>
-        """, unsafe_allow_html=True)
+    for perf_col, (value, label) in zip([perf_col1, perf_col2, perf_col3, perf_col4], performance):
+        with perf_col:
+            st.markdown(f"""
+            <div class="metric-card">
+                <div class="stat-number">{value}</div>
+                <div class="stat-label">{label}</div>
+            </div>
+            """, unsafe_allow_html=True)
     
     st.markdown("</div>", unsafe_allow_html=True)
 
@@ -603,6 +727,47 @@ else:
     
     st.markdown("</div>", unsafe_allow_html=True)
 
+@st.fragment
+def diagnostics():
+    # a toggle rather than an expander: an expander's body runs (and imports pandas) on every page;
+    # as a fragment, flipping it doesn't rerun the page either
+    if st.toggle("⏱️ Diagnostics", key="diagnostics"):
+        import pandas as pd
+        
+        startup = start_warmup().summary()
+        if startup['error']:
+            st.warning(f"Model warm-up failed: {startup['error']}")
+        elif startup['ready']:
+            first = startup['first_prediction_after_s']
+            st.caption(f"Model warm {startup['ready_after_s']:.2f}s after start ("
+                       + ", ".join(f"{stage} {ms:,.0f} ms" for stage, ms in startup['stages_ms'].items()) + ")"
+                       + (f" · first prediction at {first:.2f}s" if first is not None else ""))
+        else:
+            st.caption("Model warming up…")
+        
+        latency_summary = get_latency_tracker().summary()
+        if latency_summary.empty:
+            st.caption("No predictions yet.")
+        else:
+            st.dataframe(latency_summary.set_index('Stage').style.format(precision=2))
+            over_budget = latency_summary.loc[~latency_summary['Within budget'], 'Stage'].tolist()
+            if over_budget:
+                st.warning(f"p95 over budget: {', '.join(over_budget)}")
+        
+        st.markdown("**Prediction cache**")
+        cache_stats = {'Predictions': get_prediction_cache().stats(), 'Explanations': get_explanation_cache().stats()}
+        st.dataframe(pd.DataFrame({name: [f"{v:.1%}" if k == 'hit rate' else f"{v:,}" for k, v in stats.items()]
+                                   for name, stats in cache_stats.items()},
+                                  index=list(cache_stats['Predictions'].keys())))
+        
+        st.markdown("**Render time**")
+        st.caption("Server time per full page run and per fragment rerun.")
+        render_summary = get_render_tracker().summary()
+        st.dataframe(render_summary.set_index('Stage')[['Count', 'p50 (ms)', 'p95 (ms)']].style.format(precision=1))
+
+with st.sidebar:
+    diagnostics()
+
 st.markdown("""
 <div class="footer">
     <p style='font-size: 1.2rem; margin-bottom: 10px;'><b>AutoValueAI</b></p>
@@ -611,4 +776,6 @@ st.markdown("""
         🔒 Secure | 🚀 Fast | 💡 Explainable | 🎯 Accurate
     </p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+get_render_tracker().record('full run', (time.perf_counter() - run_start) * 1000)
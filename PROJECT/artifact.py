@@ -0,0 +1,340 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from native import CATEGORICAL_ARRAYS, NativePredictor, PICKLE_PATH, TREE_ARRAYS
+
+
+FORMAT_VERSION = 1
+
+ARTIFACT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts')
+LATEST = 'LATEST'
+MANIFEST = 'manifest.json'
+BOOSTER = 'booster.ubj'
+SCALE_BOOSTER = 'scale.ubj'
+ARRAYS = 'arrays'
+# tree arrays of the interval scale model; it shares the price model's preprocessing arrays
+SCALE_PREFIX = 'scale_'
+
+# below this many rows the NumPy tree walk beats a call into the xgboost library
+NATIVE_MAX_ROWS = 64
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _content_hash(files):
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(f'{name}:{files[name]}\n'.encode())
+    return digest.hexdigest()
+
+
+def latest_path(root=ARTIFACT_ROOT):
+    return os.path.join(root, LATEST)
+
+
+def _next_version(root):
+    versions = [int(name[1:]) for name in os.listdir(root) if name.startswith('v') and name[1:].isdigit()]
+    return f'v{max(versions, default=0) + 1:04d}'
+
+
+def _write_atomic(path, text):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def _schema(predictor):
+    from batch import DTYPES, FEATURES
+
+    categories = dict(zip(predictor.categorical, predictor.categories))
+    return [
+        {
+            'name': column,
+            'dtype': DTYPES[column],
+            **({'categories': categories[column].tolist()} if column in categories else {}),
+        }
+        for column in FEATURES
+    ]
+
+
+def save_artifact(pipeline, root=ARTIFACT_ROOT, metrics=None, training=None, interval=None):
+    # interval: optional (scale_pipeline, info) from intervals.calibrate
+    if interval is not None:
+        scale_pipeline, info = interval
+        interval = (NativePredictor.from_pipeline(scale_pipeline), scale_pipeline.named_steps['model'].get_booster(),
+                    info)
+    return publish(NativePredictor.from_pipeline(pipeline), pipeline.named_steps['model'].get_booster(),
+                   list(pipeline.named_steps['preprocessing'].get_feature_names_out()),
+                   root, metrics, training, interval)
+
+
+def save_trained(pipeline, x_train, y_train, x_test, y_test, data_path, rows, root=ARTIFACT_ROOT, metrics=None,
+                 training=None):
+    # every from-scratch fit publishes through here, so each version has a calibrated price band for the
+    # app and records how much of `data_path` (its first `rows` rows) it covers for retrain.py
+    from intervals import calibrate
+    from retrain import source_record
+
+    interval = calibrate(pipeline, x_train, y_train, x_test, y_test)
+    training = dict(training or {}, sources=source_record(data_path, rows))
+    return save_artifact(pipeline, root, metrics, training, interval), interval[1]
+
+
+def publish(predictor, booster, feature_order, root=ARTIFACT_ROOT, metrics=None, training=None, interval=None):
+    # interval: optional (scale_predictor, scale_booster, info); the scale model shares the price model's
+    # preprocessing, so only its trees are written
+    from batch import TARGET
+
+    os.makedirs(root, exist_ok=True)
+
+    # build in a scratch directory and rename into place, so readers never see a half-written version
+    tmp_dir = tempfile.mkdtemp(dir=root, prefix='.tmp-')
+    try:
+        os.makedirs(os.path.join(tmp_dir, ARRAYS))
+        with open(os.path.join(tmp_dir, BOOSTER), 'wb') as f:
+            f.write(booster.save_raw('ubj'))
+        for name, array in predictor.arrays().items():
+            np.save(os.path.join(tmp_dir, ARRAYS, f'{name}.npy'), np.ascontiguousarray(array))
+
+        interval_meta = None
+        if interval is not None:
+            scale_predictor, scale_booster, info = interval
+            with open(os.path.join(tmp_dir, SCALE_BOOSTER), 'wb') as f:
+                f.write(scale_booster.save_raw('ubj'))
+            for name, array in scale_predictor.tree_arrays().items():
+                np.save(os.path.join(tmp_dir, ARRAYS, f'{SCALE_PREFIX}{name}.npy'), np.ascontiguousarray(array))
+            interval_meta = dict(info, native={'base_score': scale_predictor.base_score,
+                                               'max_depth': scale_predictor.max_depth})
+
+        files = {}
+        for dirpath, _, filenames in os.walk(tmp_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                files[os.path.relpath(path, tmp_dir).replace(os.sep, '/')] = _sha256(path)
+
+        version = _next_version(root)
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'version': version,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'target': TARGET,
+            'schema': _schema(predictor),
+            'feature_order': list(feature_order),
+            'native': predictor.meta,
+            'interval': interval_meta,
+            'metrics': metrics or {},
+            'training': training or {},
+            'files': files,
+            'content_hash': _content_hash(files),
+        }
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(tmp_dir, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    _write_atomic(latest_path(root), version + '\n')
+    return os.path.join(root, version)
+
+
+def resolve(path=ARTIFACT_ROOT):
+    if os.path.exists(os.path.join(path, MANIFEST)):
+        return path
+    with open(latest_path(path)) as f:
+        return os.path.join(path, f.read().strip())
+
+
+class ModelArtifact:
+
+    def __init__(self, path, verify=True):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format_version'] > FORMAT_VERSION:
+            raise ValueError(f"Artifact format {self.manifest['format_version']} is newer than this code "
+                             f"({FORMAT_VERSION})")
+        if verify:
+            self.verify()
+
+        # read-only memory maps: every worker on the box shares the same page-cache copy
+        arrays = {}
+        for name in self.manifest['files']:
+            directory, _, filename = name.partition('/')
+            if directory == ARRAYS:
+                arrays[filename[:-len('.npy')]] = np.load(os.path.join(path, ARRAYS, filename), mmap_mode='r')
+        self.native = NativePredictor(arrays, self.manifest['native'])
+        self.interval = self.manifest.get('interval')
+        self.scale_native = None
+        if self.interval is not None:
+            scale_arrays = {name: array for name, array in arrays.items()
+                            if name not in TREE_ARRAYS + CATEGORICAL_ARRAYS and not name.startswith(SCALE_PREFIX)}
+            scale_arrays.update({name[len(SCALE_PREFIX):]: array for name, array in arrays.items()
+                                 if name.startswith(SCALE_PREFIX)})
+            self.scale_native = NativePredictor(scale_arrays, dict(self.manifest['native'], **self.interval['native']))
+        self._boosters = {}
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def content_hash(self):
+        return self.manifest['content_hash']
+
+    @property
+    def metrics(self):
+        return self.manifest['metrics']
+
+    def verify(self):
+        files = self.manifest['files']
+        for name, digest in files.items():
+            if _sha256(os.path.join(self.path, name.replace('/', os.sep))) != digest:
+                raise ValueError(f"Artifact file {name} does not match its manifest hash")
+        if _content_hash(files) != self.manifest['content_hash']:
+            raise ValueError('Artifact content hash does not match its manifest')
+
+    def _load_booster(self, filename):
+        if filename not in self._boosters:
+            import xgboost as xgb
+            booster = xgb.Booster()
+            booster.load_model(os.path.join(self.path, filename))
+            self._boosters[filename] = booster
+        return self._boosters[filename]
+
+    @property
+    def booster(self):
+        return self._load_booster(BOOSTER)
+
+    @property
+    def scale_booster(self):
+        return self._load_booster(SCALE_BOOSTER)
+
+    def transform(self, data):
+        return self.native.transform(data)
+
+    def transform_one(self, row):
+        return self.native.transform_one(row)
+
+    def predict_transformed(self, x):
+        x = np.atleast_2d(x)
+        if len(x) <= NATIVE_MAX_ROWS:
+            return self.native.predict_transformed(x)
+        return self.booster.inplace_predict(x, missing=np.nan).astype(np.float64)
+
+    def contributions(self, x, approx=False):
+        # TreeSHAP values per model column plus the bias in the last column; rows sum to the prediction
+        import xgboost as xgb
+        dmatrix = xgb.DMatrix(np.atleast_2d(x), missing=np.nan, feature_types=self.booster.feature_types,
+                              enable_categorical=True)
+        return self.booster.predict(dmatrix, pred_contribs=True, approx_contribs=approx).astype(np.float64)
+
+    def predict(self, data):
+        return self.predict_transformed(self.transform(data))
+
+    def predict_one(self, row):
+        return float(self.native.predict_transformed(self.transform_one(row))[0])
+
+    def half_width_transformed(self, x):
+        if self.interval is None:
+            raise ValueError(f"Artifact {self.version} has no prediction interval; republish it with model.py")
+        x = np.atleast_2d(x)
+        if len(x) <= NATIVE_MAX_ROWS:
+            scale = self.scale_native.predict_transformed(x)
+        else:
+            scale = self.scale_booster.inplace_predict(x, missing=np.nan).astype(np.float64)
+        return self.interval['quantile'] * np.maximum(scale, self.interval['min_scale'])
+
+    def predict_interval_transformed(self, x):
+        # both tree sets read the same preprocessed matrix, so a band costs one extra (smaller) tree walk
+        price = self.predict_transformed(x)
+        half_width = self.half_width_transformed(x)
+        return price, price - half_width, price + half_width
+
+    def predict_interval(self, data):
+        return self.predict_interval_transformed(self.transform(data))
+
+    def predict_interval_one(self, row):
+        price, lower, upper = self.predict_interval_transformed(self.transform_one(row))
+        return float(price[0]), float(lower[0]), float(upper[0])
+
+
+def load_artifact(path=ARTIFACT_ROOT, verify=True):
+    return ModelArtifact(resolve(path), verify=verify)
+
+
+def split(data_path):
+    # same split as model.py, so converted pickles report comparable metrics
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+
+    from batch import DTYPES, FEATURES, TARGET
+
+    df = pd.read_csv(data_path, dtype=DTYPES)
+    return train_test_split(df[FEATURES], df[TARGET], train_size=0.8, random_state=42)
+
+
+def evaluate(pipeline, data_path):
+    from sklearn.metrics import mean_absolute_error, root_mean_squared_error, r2_score
+
+    x_train, x_test, y_train, y_test = split(data_path)
+    y_pred = pipeline.predict(x_test)
+    return {
+        'mae': float(mean_absolute_error(y_test, y_pred)),
+        'rmse': float(root_mean_squared_error(y_test, y_pred)),
+        'r2': float(r2_score(y_test, y_pred)),
+        'n_train': len(x_train),
+        'n_test': len(x_test),
+    }
+
+
+def main():
+    import pickle
+
+    parser = argparse.ArgumentParser(description='Convert a pickled pipeline into a versioned model artifact')
+    parser.add_argument('--model', default=PICKLE_PATH)
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'car_sales_data.csv'))
+    parser.add_argument('--root', default=ARTIFACT_ROOT)
+    parser.add_argument('--interval', action='store_true', help='fit and calibrate a prediction-interval companion')
+    args = parser.parse_args()
+
+    with open(args.model, 'rb') as f:
+        pipeline = pickle.load(f)
+
+    interval = None
+    if args.interval:
+        from intervals import calibrate
+        x_train, x_test, y_train, y_test = split(args.data)
+        interval = calibrate(pipeline, x_train, y_train, x_test, y_test)
+        print(json.dumps(interval[1], indent=2))
+
+    path = save_artifact(pipeline, args.root, metrics=evaluate(pipeline, args.data),
+                         training={'source': os.path.basename(args.model)}, interval=interval)
+    print(f"published {path}")
+
+    start = time.perf_counter()
+    artifact = load_artifact(args.root)
+    print(f"load time: {(time.perf_counter() - start) * 1e3:.1f}ms")
+    print(json.dumps(artifact.metrics, indent=2))
+
+
+if __name__ == '__main__':
+    main()
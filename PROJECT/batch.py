@@ -0,0 +1,107 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+FEATURES = ['Manufacturer', 'Model', 'Engine size', 'Fuel type', 'Year of manufacture', 'Mileage']
+TARGET = 'Price'
+
+# explicit dtypes so large stock lists skip pandas type inference
+DTYPES = {
+    'Manufacturer': 'category',
+    'Model': 'category',
+    'Engine size': 'float64',
+    'Fuel type': 'category',
+    'Year of manufacture': 'int64',
+    'Mileage': 'int64',
+}
+
+CHUNK_SIZE = 50_000
+MIN_PRICE = 5000
+
+def read_table(source, name=None):
+    name = name or getattr(source, 'name', source)
+    ext = os.path.splitext(str(name))[1].lower()
+
+    if ext == '.csv':
+        df = pd.read_csv(source, dtype=DTYPES)
+    elif ext in ('.parquet', '.pq'):
+        df = pd.read_parquet(source)
+    elif ext in ('.arrow', '.feather', '.ipc'):
+        df = pd.read_feather(source)
+    else:
+        raise ValueError(f"Unsupported file type '{ext}', expected CSV, Parquet or Arrow")
+
+    missing = [col for col in FEATURES if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    return df
+
+
+def prepare_features(df):
+    x = df[FEATURES]
+    return x.astype({col: DTYPES[col] for col in FEATURES if x[col].dtype != DTYPES[col]})
+
+
+def iter_predictions(model, df, chunk_size=CHUNK_SIZE, interval=False):
+    x = prepare_features(df)
+    for start in range(0, len(x), chunk_size):
+        chunk = x.iloc[start:start + chunk_size]
+        if interval:
+            # price, lower, upper as columns, from one preprocessing pass
+            yield start, np.maximum(np.column_stack(model.predict_interval(chunk)), MIN_PRICE)
+        else:
+            yield start, np.maximum(model.predict(chunk), MIN_PRICE)
+
+
+def predict_batch(model, df, chunk_size=CHUNK_SIZE, progress=None, interval=False):
+    prices = np.empty((len(df), 3) if interval else len(df), dtype=np.float32)
+
+    start_time = time.perf_counter()
+    for start, chunk_prices in iter_predictions(model, df, chunk_size, interval):
+        prices[start:start + len(chunk_prices)] = chunk_prices
+        if progress is not None:
+            progress(min(start + chunk_size, len(df)) / max(len(df), 1))
+    seconds = time.perf_counter() - start_time
+
+    stats = {
+        'rows': len(df),
+        'seconds': seconds,
+        'rows_per_sec': len(df) / seconds if seconds > 0 else float('inf'),
+    }
+    return prices, stats
+
+
+def main():
+    from artifact import ARTIFACT_ROOT, load_artifact
+
+    parser = argparse.ArgumentParser(description='Price a stock list with the AutoValueAI model')
+    parser.add_argument('input', help='CSV, Parquet or Arrow file with the car_sales_data.csv columns')
+    parser.add_argument('output', help='where to write the priced rows (CSV)')
+    parser.add_argument('--model', default=ARTIFACT_ROOT, help='artifact root or version directory')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    model = load_artifact(args.model)
+
+    df = read_table(args.input)
+    interval = model.interval is not None
+    prices, stats = predict_batch(model, df, args.chunk_size, interval=interval)
+
+    if interval:
+        df['Predicted price'], df['Lower price'], df['Upper price'] = prices.T
+    else:
+        df['Predicted price'] = prices
+    df.to_csv(args.output, index=False)
+
+    print(f"rows: {stats['rows']:,}")
+    print(f"time: {stats['seconds']:.3f}s")
+    print(f"rows/sec: {stats['rows_per_sec']:,.0f}")
+
+
+if __name__ == '__main__':
+    main()
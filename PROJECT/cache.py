@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+MAX_ENTRIES = 20_000
+TTL_SECONDS = 6 * 60 * 60
+
+
+def model_fingerprint(path):
+    # cheap enough to check on every click; changes whenever a new model artifact is published
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def normalize_key(row):
+    return (
+        str(row['Manufacturer']).strip(),
+        str(row['Model']).strip(),
+        round(float(row['Engine size']), 1),
+        str(row['Fuel type']).strip(),
+        int(row['Year of manufacture']),
+        int(row['Mileage']),
+    )
+
+
+class PredictionCache:
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_fingerprint(self, fingerprint):
+        if fingerprint != self._fingerprint:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._fingerprint = fingerprint
+
+    def get(self, row, fingerprint):
+        key = normalize_key(row)
+        now = time.monotonic()
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, row, fingerprint, value):
+        key = normalize_key(row)
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, row, fingerprint, compute):
+        value = self.get(row, fingerprint)
+        if value is not None:
+            return value, True
+        value = compute()
+        self.put(row, fingerprint, value)
+        return value, False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max entries': self.max_entries,
+                'ttl (s)': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
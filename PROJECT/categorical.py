@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.metrics import mean_absolute_error, r2_score, root_mean_squared_error
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, RobustScaler
+from xgboost import XGBRegressor
+
+from artifact import load_artifact, save_artifact, split
+
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'car_sales_data.csv')
+
+NUMERIC = ['Engine size', 'Year of manufacture', 'Mileage']
+CATEGORICAL = ['Manufacturer', 'Model', 'Fuel type']
+
+MODES = ['onehot', 'native']
+
+REPEATS = 3
+BATCH_ROWS = 10_000
+
+
+def build_pipeline(num=NUMERIC, cat=CATEGORICAL, mode='onehot', **params):
+    num_pipleline = Pipeline(steps=[('num_scaling', RobustScaler())])
+    if mode == 'onehot':
+        cat_pipleline = Pipeline(steps=[('car_encoding', OneHotEncoder(handle_unknown='ignore'))])
+        model = XGBRegressor(**params)
+    elif mode == 'native':
+        # one code column per feature; XGBoost partitions the categories itself, unknowns arrive as missing
+        cat_pipleline = Pipeline(steps=[
+            ('car_encoding', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=np.nan,
+                                            encoded_missing_value=np.nan))
+        ])
+        model = XGBRegressor(tree_method='hist', enable_categorical=True, max_cat_to_onehot=1,
+                             feature_types=['q'] * len(num) + ['c'] * len(cat), **params)
+    else:
+        raise ValueError(f"Unknown pipeline mode '{mode}', expected one of {', '.join(MODES)}")
+
+    preprocessing = ColumnTransformer(transformers=[
+        ('num_pipleline', num_pipleline, list(num)),
+        ('cat_pipleline', cat_pipleline, list(cat))
+    ])
+    return Pipeline(steps=[
+        ("preprocessing", preprocessing),
+        ('model', model)
+    ])
+
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def compare(data_path=DATA_PATH, repeats=REPEATS, batch_rows=BATCH_ROWS):
+    x_train, x_test, y_train, y_test = split(data_path)
+    batch = x_test.iloc[:batch_rows]
+    one = x_test.iloc[:1]
+    row = one.iloc[0].to_dict()
+
+    results = {}
+    root = tempfile.mkdtemp(prefix='categorical-')
+    try:
+        for mode in MODES:
+            pipeline = build_pipeline(mode=mode, random_state=42)
+            train_seconds = _best_of(lambda: pipeline.fit(x_train, y_train), repeats)
+            y_pred = pipeline.predict(x_test)
+
+            path = save_artifact(pipeline, os.path.join(root, mode))
+            artifact = load_artifact(path)
+            artifact.booster
+
+            results[mode] = {
+                'width': int(pipeline.named_steps['preprocessing'].transform(one).shape[1]),
+                'train_s': train_seconds,
+                'pipeline_one_ms': _best_of(lambda: pipeline.predict(one), repeats * 10) * 1e3,
+                'pipeline_batch_ms': _best_of(lambda: pipeline.predict(batch), repeats) * 1e3,
+                'artifact_one_ms': _best_of(lambda: artifact.predict_one(row), repeats * 10) * 1e3,
+                'artifact_batch_ms': _best_of(lambda: artifact.predict(batch), repeats) * 1e3,
+                'pickle_kb': len(pickle.dumps(pipeline)) / 1024,
+                'artifact_kb': _dir_bytes(path) / 1024,
+                'mae': float(mean_absolute_error(y_test, y_pred)),
+                'rmse': float(root_mean_squared_error(y_test, y_pred)),
+                'r2': float(r2_score(y_test, y_pred)),
+            }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+ROWS = [
+    ('width', 'features after preprocessing', '{:,.0f}'),
+    ('train_s', 'training time (s)', '{:.2f}'),
+    ('pipeline_one_ms', 'pipeline predict, 1 row (ms)', '{:.2f}'),
+    ('pipeline_batch_ms', f'pipeline predict, {BATCH_ROWS:,} rows (ms)', '{:.1f}'),
+    ('artifact_one_ms', 'artifact predict, 1 row (ms)', '{:.3f}'),
+    ('artifact_batch_ms', f'artifact predict, {BATCH_ROWS:,} rows (ms)', '{:.1f}'),
+    ('pickle_kb', 'pickled pipeline (KB)', '{:,.0f}'),
+    ('artifact_kb', 'artifact on disk (KB)', '{:,.0f}'),
+    ('mae', 'MAE (£)', '{:,.1f}'),
+    ('rmse', 'RMSE (£)', '{:,.1f}'),
+    ('r2', 'R²', '{:.5f}'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='One-hot vs native categorical XGBoost pipeline, side by side')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--report', default=None, help='write the comparison as JSON')
+    args = parser.parse_args()
+
+    results = compare(args.data, args.repeats)
+
+    print(f"{'':36}  {'one-hot':>10}  {'native':>10}")
+    for key, label, fmt in ROWS:
+        print(f"{label:36}  {fmt.format(results['onehot'][key]):>10}  {fmt.format(results['native'][key]):>10}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
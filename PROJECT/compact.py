@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from native import PICKLE_PATH, NativePredictor
+
+
+COMPACT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_compact.npz')
+
+# worst-case price change (in pounds) the int16 leaf values may add up to over all trees; above it the
+# leaves stay float32
+MAX_ERROR = 5.0
+LEAF_LEVELS = np.iinfo(np.int16).max
+
+REPEATS = 5
+ONE_ROW_REPEATS = 200
+
+
+def _small_int(array):
+    # the narrowest signed type the values fit, so node ids and slots cost 1-2 bytes instead of 4
+    array = np.asarray(array)
+    if not len(array):
+        return array.astype(np.int8)
+    return array.astype(np.promote_types(np.min_scalar_type(int(array.min())), np.min_scalar_type(int(array.max()))))
+
+
+def _tree_bounds(roots, n_nodes):
+    return list(zip(roots.tolist(), np.append(roots[1:], n_nodes).tolist()))
+
+
+def _quantize(predictor, max_error):
+    # per-tree int16 leaf codes: each tree's leaves round to a step of max|leaf| / 32767, so a tree can
+    # move a price by at most half a step
+    leaf = predictor.children[0::2] == np.arange(len(predictor.feature))
+    steps = []
+    for start, stop in _tree_bounds(predictor.roots, len(leaf)):
+        peak = np.abs(predictor.value[start:stop][leaf[start:stop]]).max(initial=0.0)
+        steps.append(float(peak) / LEAF_LEVELS if peak > 0 else 1.0)
+    steps = np.asarray(steps)
+    bound = float(steps.sum() / 2)
+    if bound > max_error:
+        return None, bound
+    tree = np.repeat(np.arange(len(steps)), np.diff(np.append(predictor.roots, len(leaf))))
+    codes = np.where(leaf, np.rint(predictor.value / steps[tree]), 0).astype(np.int16)
+    return (codes, steps), bound
+
+
+def _prune(predictor, codes):
+    # every subtree is hash-consed within its tree: a split whose two sides are the same subtree is
+    # replaced by that subtree, and repeated subtrees are stored once and shared. `codes` are the leaf
+    # values as stored, so leaves that quantize alike merge too
+    children, feature, missing_right = predictor.children, predictor.feature, predictor.missing_right
+    threshold, cat_row, cat_bits = predictor.threshold, predictor.cat_row, predictor.cat_bits
+    trees = []
+    for start, stop in _tree_bounds(predictor.roots, len(feature)):
+        keys, ids = [], {}
+
+        def canon(node):
+            left, right = children[2 * node], children[2 * node + 1]
+            if left == node:
+                key = ('leaf', codes[node].item())
+            else:
+                left, right = canon(left), canon(right)
+                if left == right:
+                    return left
+                cats = None
+                if cat_row is not None and cat_row[node] >= 0:
+                    cats = tuple(np.flatnonzero(cat_bits[cat_row[node]]).tolist())
+                key = (feature[node].item(), threshold[node].item(), bool(missing_right[node]), cats, left, right)
+            if key not in ids:
+                ids[key] = len(keys)
+                keys.append(key)
+            return ids[key]
+
+        canon(start)
+        # subtrees are numbered children first, so the root is the last one; it goes first
+        trees.append([keys[i] for i in range(len(keys) - 1, -1, -1)])
+    return trees
+
+
+def compact(predictor, max_error=MAX_ERROR):
+    """A NativePredictor's arrays in their smallest exact form, with leaf values quantized to int16 where
+    the summed worst-case error stays within `max_error`:
+    - thresholds as uint16 indices into one float32 table of the distinct thresholds (lossless)
+    - node ids relative to their tree, features and category slots in the narrowest integer type
+    - no-op splits pruned and repeated subtrees shared; single-leaf trees folded into the base score
+    - missing-value directions and categorical split sets as bits
+    - category names as one UTF-8 byte table with lengths"""
+    quantized, bound = _quantize(predictor, max_error)
+    codes = quantized[0] if quantized else predictor.value
+    trees = _prune(predictor, codes)
+
+    table = np.unique(predictor.threshold)
+    index_of = dict(zip(table.tolist(), range(len(table))))
+    base_score = float(predictor.base_score)
+    sizes, leaf_steps = [], []
+    children, feature, thresholds, missing_right, leaf_values, cat_sets = [], [], [], [], [], []
+    for tree, keys in enumerate(trees):
+        step = quantized[1][tree] if quantized else 1.0
+        if len(keys) == 1:
+            base_score += keys[0][1] * step
+            continue
+        position = {len(keys) - 1 - i: i for i in range(len(keys))}
+        for i, key in enumerate(keys):
+            if key[0] == 'leaf':
+                children += [i, i]
+                feature.append(0)
+                thresholds.append(0)
+                missing_right.append(False)
+                leaf_values.append(key[1])
+                cat_sets.append(None)
+            else:
+                f, t, right, cats, left_id, right_id = key
+                children += [position[left_id], position[right_id]]
+                feature.append(f)
+                thresholds.append(index_of[t])
+                missing_right.append(right)
+                cat_sets.append(cats)
+        sizes.append(len(keys))
+        leaf_steps.append(step)
+
+    arrays = {
+        'tree_sizes': _small_int(sizes),
+        'children': _small_int(children),
+        'feature': _small_int(feature),
+        'threshold_table': table.astype(np.float32),
+        'threshold_index': np.asarray(thresholds, dtype=np.uint16 if len(table) <= 1 << 16 else np.int32),
+        'missing_right': np.packbits(missing_right),
+        'leaf_values': np.asarray(leaf_values, dtype=np.int16 if quantized else np.float32),
+        'center': predictor.center,
+        'scale': predictor.scale,
+        'offsets': _small_int(predictor.offsets),
+    }
+    if quantized:
+        arrays['leaf_steps'] = np.asarray(leaf_steps)
+    if predictor.cat_row is not None:
+        sets = sorted({cats for cats in cat_sets if cats is not None})
+        row_of = {cats: i for i, cats in enumerate(sets)}
+        bits = np.zeros((len(sets), predictor.cat_bits.shape[1]), dtype=bool)
+        for i, cats in enumerate(sets):
+            bits[i, list(cats)] = True
+        arrays['cat_row'] = _small_int([row_of[cats] if cats is not None else -1 for cats in cat_sets])
+        arrays['cat_bits'] = np.packbits(bits, axis=1)
+
+    names = [name.encode() for cats in predictor.categories for name in cats.tolist()]
+    arrays['category_bytes'] = np.frombuffer(b''.join(names), dtype=np.uint8)
+    arrays['category_lengths'] = _small_int([len(name) for name in names])
+    for i, slots in enumerate(predictor.slots):
+        arrays[f'slots_{i}'] = _small_int(slots)
+
+    n_nodes = len(predictor.feature)
+    meta = dict(predictor.meta, base_score=base_score, compact={
+        'n_nodes': n_nodes,
+        'n_trees': len(predictor.roots),
+        'kept_nodes': int(sum(sizes)),
+        'kept_trees': len(sizes),
+        'leaf_values': 'int16' if quantized else 'float32',
+        'max_error_bound': bound if quantized else 0.0,
+        'category_counts': [len(cats) for cats in predictor.categories],
+        'cat_width': int(predictor.cat_bits.shape[1]) if predictor.cat_row is not None else 0,
+    })
+    return arrays, meta
+
+
+def expand(arrays, meta):
+    # back to the NativePredictor layout: global int32 node ids, a float32 threshold and value per node
+    info = meta['compact']
+    sizes = arrays['tree_sizes'].astype(np.int64)
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+    n_nodes = int(sizes.sum())
+    children = arrays['children'].astype(np.int32) + np.repeat(roots, 2 * sizes)
+    leaf = children[0::2] == np.arange(n_nodes)
+
+    value = np.zeros(n_nodes, dtype=np.float64)
+    value[leaf] = arrays['leaf_values']
+    if 'leaf_steps' in arrays:
+        value *= np.repeat(arrays['leaf_steps'], sizes)
+    tree_arrays = {
+        'children': children,
+        'feature': arrays['feature'].astype(np.int32),
+        'threshold': np.where(leaf, 0, arrays['threshold_table'][arrays['threshold_index']]).astype(np.float32),
+        'missing_right': np.unpackbits(arrays['missing_right'], count=n_nodes).astype(bool),
+        'value': value.astype(np.float32),
+        'roots': roots,
+    }
+    if 'cat_row' in arrays:
+        tree_arrays['cat_row'] = arrays['cat_row'].astype(np.int32)
+        tree_arrays['cat_bits'] = np.unpackbits(arrays['cat_bits'], axis=1, count=info['cat_width']).astype(bool)
+
+    names = np.split(arrays['category_bytes'], np.cumsum(arrays['category_lengths'].astype(np.int64))[:-1])
+    names = [bytes(name).decode() for name in names]
+    bounds = np.cumsum([0] + info['category_counts'])
+    for i in range(len(info['category_counts'])):
+        tree_arrays[f'categories_{i}'] = np.asarray(names[bounds[i]:bounds[i + 1]], dtype=str)
+        tree_arrays[f'slots_{i}'] = arrays[f'slots_{i}'].astype(np.int64)
+
+    tree_arrays.update(center=arrays['center'], scale=arrays['scale'], offsets=arrays['offsets'].astype(np.int32))
+    return tree_arrays, dict(meta, max_depth=_max_depth(tree_arrays['children'], roots))
+
+
+def _max_depth(children, roots):
+    # steps until every row has reached a leaf; shared subtrees are visited once per level
+    depth, frontier = 0, roots
+    while True:
+        internal = frontier[children[2 * frontier] != frontier]
+        if not len(internal):
+            return depth
+        frontier = np.unique(children[np.concatenate([2 * internal, 2 * internal + 1])])
+        depth += 1
+
+
+def save_compact(arrays, meta, path=COMPACT_PATH):
+    np.savez_compressed(path, meta=np.asarray(json.dumps(meta)), **arrays)
+
+
+def load_compact(path=COMPACT_PATH):
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files if name != 'meta'}
+        meta = json.loads(str(data['meta']))
+    return NativePredictor(*expand(arrays, meta))
+
+
+def export_compact(pipeline, path=COMPACT_PATH, max_error=MAX_ERROR):
+    arrays, meta = compact(NativePredictor.from_pipeline(pipeline), max_error)
+    save_compact(arrays, meta, path)
+    return load_compact(path)
+
+
+# a fresh interpreter per loader, so imports count: what a new serving process pays before its first price
+_COLD_LOAD = {
+    'pickle': "import pickle\nwith open({path!r}, 'rb') as f:\n    pickle.load(f)",
+    'compact': "from compact import load_compact\nload_compact({path!r})",
+}
+# peak RSS from /proc: ru_maxrss would include the benchmark process the child was forked from
+_COLD_LOAD_TIMER = (
+    "import time, warnings\nwarnings.simplefilter('ignore')\nstart = time.perf_counter()\n{load}\n"
+    "seconds = time.perf_counter() - start\n"
+    "peak = next(line for line in open('/proc/self/status') if line.startswith('VmHWM'))\n"
+    "print(seconds, int(peak.split()[1]) / 1024)"
+)
+
+
+def _cold_load(kind, path):
+    code = _COLD_LOAD_TIMER.format(load=_COLD_LOAD[kind].format(path=path))
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    seconds, rss_mb = out.stdout.split()
+    return float(seconds), float(rss_mb)
+
+
+def _load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _best_of(fn, repeat=REPEATS, number=1):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            result = fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best, result
+
+
+def report(model_path=PICKLE_PATH, data_path=None, path=COMPACT_PATH, max_error=MAX_ERROR):
+    from artifact import split
+    from batch import FEATURES
+    from native import export_native
+
+    data_path = data_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'car_sales_data.csv')
+    pipeline = _load_pickle(model_path)
+    predictor = export_compact(pipeline, path, max_error)
+    # the uncompressed float32 / int32 arrays native.py writes, for reference
+    scratch = tempfile.TemporaryDirectory()
+    native_path = os.path.join(scratch.name, 'model_native.npz')
+    native = export_native(pipeline, native_path)
+
+    _, x_test, _, _ = split(data_path)
+    x_test = x_test[FEATURES]
+    one = x_test.iloc[:1]
+    row = one.iloc[0].to_dict()
+    expected = pipeline.predict(x_test).astype(np.float64)
+
+    models = {
+        'pickle': {'path': model_path, 'predict': pipeline.predict, 'predict_one': lambda: pipeline.predict(one),
+                   'load': lambda: _load_pickle(model_path)},
+        'native': {'path': native_path, 'predict': native.predict, 'predict_one': lambda: native.predict_one(row),
+                   'load': lambda: NativePredictor.load(native_path)},
+        'compact': {'path': path, 'predict': predictor.predict, 'predict_one': lambda: predictor.predict_one(row),
+                    'load': lambda: load_compact(path)},
+    }
+    results = {}
+    for name, model in models.items():
+        batch_s, y_pred = _best_of(lambda: model['predict'](x_test))
+        results[name] = {
+            'bytes': os.path.getsize(model['path']),
+            'load_ms': _best_of(model['load'])[0] * 1e3,
+            'predict_batch_ms': batch_s * 1e3,
+            'predict_one_ms': _best_of(model['predict_one'], number=ONE_ROW_REPEATS)[0] * 1e3,
+            'max_abs_diff': float(np.max(np.abs(y_pred - expected))),
+        }
+        if name in _COLD_LOAD:
+            results[name]['cold_load_s'], results[name]['cold_rss_mb'] = _cold_load(name, model['path'])
+    scratch.cleanup()
+    return {'test_rows': len(x_test), 'compact': predictor.meta['compact'], 'models': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export model.pkl as a compact, quantized NumPy-only model and '
+                                                 'compare it with the pickle')
+    parser.add_argument('--model', default=PICKLE_PATH)
+    parser.add_argument('--data', default=None, help='CSV whose test split the predictions are compared on')
+    parser.add_argument('--output', default=COMPACT_PATH)
+    parser.add_argument('--max-error', type=float, default=MAX_ERROR,
+                        help='worst-case price change leaf quantization may cause, in pounds')
+    parser.add_argument('--report', default=None, help='write the comparison as JSON')
+    args = parser.parse_args()
+
+    results = report(args.model, args.data, args.output, args.max_error)
+    info = results['compact']
+    print(f"{info['kept_nodes']:,} of {info['n_nodes']:,} nodes and {info['kept_trees']} of {info['n_trees']} trees "
+          f"kept, {info['leaf_values']} leaves (worst-case price error {info['max_error_bound']:.2f})")
+    print(f"{'model':8}  {'size KB':>8}  {'load ms':>8}  {'cold load s':>11}  {'cold RSS MB':>11}  "
+          f"{'batch ms':>9}  {'1 row ms':>8}  {'max price diff':>14}")
+    for name, row in results['models'].items():
+        cold = (f"{row['cold_load_s']:11.3f}  {row['cold_rss_mb']:11.1f}" if 'cold_load_s' in row
+                else f"{'':11}  {'':11}")
+        print(f"{name:8}  {row['bytes'] / 1024:8.1f}  {row['load_ms']:8.2f}  {cold}  {row['predict_batch_ms']:9.1f}  "
+              f"{row['predict_one_ms']:8.3f}  {row['max_abs_diff']:14.4f}")
+    print(f"on the {results['test_rows']:,}-row test split")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from artifact import ARTIFACT_ROOT, load_artifact
+from batch import FEATURES, predict_batch
+
+
+MANUFACTURERS = ['BMW', 'Toyota', 'Ford', 'Porsche', 'VW']
+MODELS = {
+    'BMW': ['Z4', 'M5', 'X3'],
+    'Toyota': ['RAV4', 'Prius', 'Yaris'],
+    'Ford': ['Fiesta', 'Mondeo', 'Focus'],
+    'Porsche': ['718 Cayman', '911', 'Cayenne'],
+    'VW': ['Polo', 'Golf', 'Passat']
+}
+FUEL_TYPES = ['Petrol', 'Diesel', 'Hybrid', 'Electric']
+YEARS = list(range(2024, 1999, -1))
+ENGINE_SIZES = [1.0, 1.2, 1.4, 1.6, 1.8, 2.0, 2.5, 3.0, 3.5, 4.0, 5.0]
+
+MILEAGE_STEP = 5000
+MILEAGE_MAX = 300_000
+
+GRID_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'price_grid.npy')
+
+
+def meta_path(grid_path):
+    return os.path.splitext(grid_path)[0] + '.json'
+
+
+def grid_axes(mileage_step=MILEAGE_STEP, mileage_max=MILEAGE_MAX):
+    return {
+        'model': [[manufacturer, model] for manufacturer in MANUFACTURERS for model in MODELS[manufacturer]],
+        'fuel': FUEL_TYPES,
+        'year': YEARS,
+        'engine': ENGINE_SIZES,
+        'mileage': list(range(0, mileage_max + 1, mileage_step)),
+    }
+
+
+def build_grid(model, axes):
+    combos = list(itertools.product(axes['model'], axes['fuel'], axes['year'], axes['engine']))
+    base = pd.DataFrame({
+        'Manufacturer': [c[0][0] for c in combos],
+        'Model': [c[0][1] for c in combos],
+        'Engine size': [c[3] for c in combos],
+        'Fuel type': [c[1] for c in combos],
+        'Year of manufacture': [c[2] for c in combos],
+    })
+
+    # mileage varies fastest so the reshape below lines up with the axes order
+    n_mileage = len(axes['mileage'])
+    grid_df = base.loc[base.index.repeat(n_mileage)].reset_index(drop=True)
+    grid_df['Mileage'] = np.tile(axes['mileage'], len(base))
+
+    prices, stats = predict_batch(model, grid_df[FEATURES])
+    shape = tuple(len(axes[name]) for name in ['model', 'fuel', 'year', 'engine', 'mileage'])
+    return prices.astype(np.float32).reshape(shape), stats
+
+
+def save_grid(prices, axes, model_hash, grid_path=GRID_PATH):
+    np.save(grid_path, prices)
+    meta = {
+        'axes': axes,
+        'model_hash': model_hash,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(meta_path(grid_path), 'w') as f:
+        json.dump(meta, f)
+
+
+class PriceGrid:
+
+    def __init__(self, prices, axes):
+        self.prices = prices
+        self.mileage = np.asarray(axes['mileage'], dtype=np.float64)
+        self._model_index = {tuple(pair): i for i, pair in enumerate(axes['model'])}
+        self._fuel_index = {fuel: i for i, fuel in enumerate(axes['fuel'])}
+        self._year_index = {int(year): i for i, year in enumerate(axes['year'])}
+        self._engine_index = {round(float(engine), 1): i for i, engine in enumerate(axes['engine'])}
+
+    def lookup(self, row):
+        i = self._model_index.get((row['Manufacturer'], row['Model']))
+        f = self._fuel_index.get(row['Fuel type'])
+        y = self._year_index.get(int(row['Year of manufacture']))
+        e = self._engine_index.get(round(float(row['Engine size']), 1))
+        mileage = float(row['Mileage'])
+        if i is None or f is None or y is None or e is None:
+            return None
+        if mileage < self.mileage[0] or mileage > self.mileage[-1]:
+            return None
+
+        j = min(int(np.searchsorted(self.mileage, mileage, side='right')) - 1, len(self.mileage) - 2)
+        t = (mileage - self.mileage[j]) / (self.mileage[j + 1] - self.mileage[j])
+        low, high = self.prices[i, f, y, e, j], self.prices[i, f, y, e, j + 1]
+        return float(low + (high - low) * t)
+
+
+def load_grid(grid_path=GRID_PATH, model_hash=None):
+    if not os.path.exists(grid_path) or not os.path.exists(meta_path(grid_path)):
+        return None
+    with open(meta_path(grid_path)) as f:
+        meta = json.load(f)
+    # a grid built from a different model artifact is stale; callers fall back to the live model
+    if model_hash is not None and meta['model_hash'] != model_hash:
+        return None
+    return PriceGrid(np.load(grid_path, mmap_mode='r'), meta['axes'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the price grid for every form input')
+    parser.add_argument('--model', default=ARTIFACT_ROOT, help='artifact root or version directory')
+    parser.add_argument('--output', default=GRID_PATH)
+    parser.add_argument('--mileage-step', type=int, default=MILEAGE_STEP)
+    parser.add_argument('--mileage-max', type=int, default=MILEAGE_MAX)
+    args = parser.parse_args()
+
+    model = load_artifact(args.model)
+
+    axes = grid_axes(args.mileage_step, args.mileage_max)
+    prices, stats = build_grid(model, axes)
+    save_grid(prices, axes, model.content_hash, args.output)
+
+    print(f"grid shape: {prices.shape}")
+    print(f"size: {prices.nbytes / 1e6:.1f} MB")
+    print(f"built in {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} rows/sec)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, RobustScaler
+from xgboost import XGBRegressor
+
+from artifact import save_trained
+from batch import FEATURES, TARGET
+
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'car_sales_data.csv')
+
+NUMERIC = ['Engine size', 'Year of manufacture', 'Mileage']
+CATEGORICAL = ['Manufacturer', 'Model', 'Fuel type']
+
+# fixed dtypes for the sales feed, so no chunk needs a type inference pass
+STREAM_DTYPES = {
+    'Manufacturer': 'category',
+    'Model': 'category',
+    'Engine size': 'float32',
+    'Fuel type': 'category',
+    'Year of manufacture': 'int32',
+    'Mileage': 'int32',
+    'Price': 'float32',
+}
+
+CHUNK_SIZE = 100_000
+SAMPLE_SIZE = 100_000
+# rows per side of the split that the price band is calibrated on at publish time
+CALIBRATION_SIZE = 50_000
+TEST_EVERY = 5
+
+PARAMS = {
+    'objective': 'reg:squarederror',
+    'tree_method': 'hist',
+}
+NUM_BOOST_ROUND = 100
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    return pd.read_csv(path, dtype=STREAM_DTYPES, usecols=FEATURES + [TARGET], chunksize=chunk_size)
+
+
+def split_mask(start, n, test_every=TEST_EVERY):
+    # deterministic by row number, so every pass over the file sees the same split
+    return (np.arange(start, start + n) % test_every) == 0
+
+
+class StreamStats:
+
+    def __init__(self, sample_size=SAMPLE_SIZE, seed=42):
+        self.sample_size = sample_size
+        self.rng = np.random.default_rng(seed)
+        self.sample = np.empty((sample_size, len(NUMERIC)), dtype=np.float64)
+        self.vocab = {col: set() for col in CATEGORICAL}
+        # every row read, for the split positions; only the training side feeds the vocabularies and sample
+        self.rows = 0
+        self.train_rows = 0
+
+    def update(self, chunk):
+        train = ~split_mask(self.rows, len(chunk))
+        self.rows += len(chunk)
+        chunk = chunk[train]
+        for col in CATEGORICAL:
+            self.vocab[col].update(chunk[col].dropna().unique().tolist())
+
+        # reservoir sample of the numeric columns; quantiles of the sample stand in for the full data
+        values = chunk[NUMERIC].to_numpy(dtype=np.float64)
+        n = len(values)
+        seen = self.train_rows + np.arange(n)
+        fill = seen < self.sample_size
+        self.sample[seen[fill]] = values[fill]
+        slots = self.rng.integers(0, seen[~fill] + 1)
+        keep = slots < self.sample_size
+        self.sample[slots[keep]] = values[~fill][keep]
+        self.train_rows += n
+
+    def fit_frame(self):
+        n = min(self.train_rows, self.sample_size)
+        frame = pd.DataFrame(self.sample[:n], columns=NUMERIC)
+        for col in CATEGORICAL:
+            frame[col] = np.resize(np.array(sorted(self.vocab[col]), dtype=object), n)
+        return frame[FEATURES]
+
+    def build_preprocessing(self):
+        num_pipleline = Pipeline(steps=[('num_scaling', RobustScaler())])
+        cat_pipleline = Pipeline(steps=[
+            ('car_encoding', OneHotEncoder(categories=[sorted(self.vocab[col]) for col in CATEGORICAL],
+                                           handle_unknown='ignore'))
+        ])
+        preprocessing = ColumnTransformer(transformers=[
+            ('num_pipleline', num_pipleline, NUMERIC),
+            ('cat_pipleline', cat_pipleline, CATEGORICAL)
+        ])
+        return preprocessing.fit(self.fit_frame())
+
+
+class ChunkIter(xgb.DataIter):
+
+    def __init__(self, path, preprocessing, chunk_size, cache_prefix):
+        self.path = path
+        self.preprocessing = preprocessing
+        self.chunk_size = chunk_size
+        self._chunks = None
+        self._start = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self):
+        self._chunks = read_chunks(self.path, self.chunk_size)
+        self._start = 0
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self.reset()
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        train = ~split_mask(self._start, len(chunk))
+        self._start += len(chunk)
+        chunk = chunk[train]
+        input_data(data=self.preprocessing.transform(chunk[FEATURES]), label=chunk[TARGET].to_numpy())
+        return True
+
+
+def sample_split(path, chunk_size=CHUNK_SIZE, size=CALIBRATION_SIZE, seed=42):
+    # a uniform sample of at most `size` rows from each side of the split, in one bounded pass: every row
+    # draws a random key and each side keeps the rows with the smallest keys
+    rng = np.random.default_rng(seed)
+    kept = {True: None, False: None}
+    start = 0
+    for chunk in read_chunks(path, chunk_size):
+        test = split_mask(start, len(chunk))
+        start += len(chunk)
+        chunk = chunk.assign(_key=rng.random(len(chunk)))
+        for side in kept:
+            part = chunk[test == side] if kept[side] is None else pd.concat([kept[side], chunk[test == side]])
+            kept[side] = part.nsmallest(size, '_key')
+    train, test = (kept[side].reset_index(drop=True) for side in (False, True))
+    return train[FEATURES], test[FEATURES], train[TARGET], test[TARGET]
+
+
+def evaluate_stream(path, pipeline, chunk_size):
+    abs_err = sq_err = sq_total = total = 0.0
+    n = 0
+    start = 0
+    for chunk in read_chunks(path, chunk_size):
+        test = split_mask(start, len(chunk))
+        start += len(chunk)
+        chunk = chunk[test]
+        y = chunk[TARGET].to_numpy(dtype=np.float64)
+        err = pipeline.predict(chunk[FEATURES]) - y
+        abs_err += np.abs(err).sum()
+        sq_err += (err ** 2).sum()
+        sq_total += (y ** 2).sum()
+        total += y.sum()
+        n += len(y)
+    ss_tot = sq_total - total ** 2 / n
+    return {
+        'mae': abs_err / n,
+        'rmse': float(np.sqrt(sq_err / n)),
+        'r2': 1 - sq_err / ss_tot,
+        'n_test': n,
+    }
+
+
+def train_streaming(path, chunk_size=CHUNK_SIZE, num_boost_round=NUM_BOOST_ROUND, params=None):
+    start = time.perf_counter()
+    stats = StreamStats()
+    for chunk in read_chunks(path, chunk_size):
+        stats.update(chunk)
+    preprocessing = stats.build_preprocessing()
+    stats_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='xgb-cache-') as cache_dir:
+        it = ChunkIter(path, preprocessing, chunk_size, os.path.join(cache_dir, 'train'))
+        dtrain = xgb.ExtMemQuantileDMatrix(it)
+        booster = xgb.train(dict(PARAMS, **(params or {})), dtrain, num_boost_round=num_boost_round)
+        raw = booster.save_raw('ubj')
+        # the booster's prediction cache holds on to dtrain; both must go before the cache files are removed
+        del booster, dtrain, it
+    train_seconds = time.perf_counter() - start
+
+    # the training parameters on the wrapper too, so clones (the interval's scale model) fit the same way
+    model = XGBRegressor(n_estimators=num_boost_round, **dict(PARAMS, **(params or {})))
+    model.load_model(bytearray(raw))
+    main_pipeline = Pipeline(steps=[
+        ("preprocessing", preprocessing),
+        ('model', model)
+    ])
+    return main_pipeline, stats, {'stats_seconds': stats_seconds, 'train_seconds': train_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the car price model from a CSV stream in bounded memory')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--rounds', type=int, default=NUM_BOOST_ROUND)
+    parser.add_argument('--publish', action='store_true', help='publish the trained model as a new artifact')
+    args = parser.parse_args()
+
+    main_pipeline, stats, timings = train_streaming(args.data, args.chunk_size, args.rounds)
+    print(f"pass 1 (vocabularies + scaler quantiles): {stats.train_rows:,} training rows of {stats.rows:,} in {timings['stats_seconds']:.2f}s")
+    print(f"pass 2 (external-memory training): {timings['train_seconds']:.2f}s")
+
+    metrics = evaluate_stream(args.data, main_pipeline, args.chunk_size)
+    metrics['n_train'] = stats.train_rows
+    print("MAE:", metrics['mae'])
+    print("RMSE:", metrics['rmse'])
+
+    if args.publish:
+        # the band is calibrated on a bounded sample of each side, so publishing stays within the memory bound
+        x_train, x_test, y_train, y_test = sample_split(args.data, args.chunk_size)
+        path, interval_info = save_trained(main_pipeline, x_train, y_train, x_test, y_test, args.data, stats.rows,
+                                           metrics=metrics, training={'source': 'ingest.py', 'rows': stats.rows,
+                                                                      'chunk_size': args.chunk_size})
+        print(f"{interval_info['coverage']:.0%} band coverage: {interval_info['metrics']['empirical_coverage']:.3f}")
+        print(f"published {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import KFold, cross_val_predict, train_test_split
+from sklearn.pipeline import Pipeline
+from xgboost import XGBRegressor
+
+
+COVERAGE = 0.9
+N_FOLDS = 5
+
+# the scale model only has to rank rows by how hard they are to price, so it is kept small
+SCALE_PARAMS = {'n_estimators': 100, 'max_depth': 4, 'learning_rate': 0.1}
+# carried over from the price model, so category codes are split as categories rather than numbers
+CATEGORICAL_PARAMS = ['tree_method', 'enable_categorical', 'feature_types', 'max_cat_to_onehot']
+
+
+def fit_scale_model(pipeline, x_train, y_train, n_folds=N_FOLDS):
+    # out-of-fold residuals, so the scale model sees errors the price model makes on unseen rows
+    oof = cross_val_predict(clone(pipeline), x_train, y_train, cv=KFold(n_folds, shuffle=True, random_state=42))
+    abs_residual = np.abs(np.asarray(y_train, dtype=np.float64) - oof)
+
+    preprocessing = pipeline.named_steps['preprocessing']
+    params = pipeline.named_steps['model'].get_params()
+    model = XGBRegressor(**SCALE_PARAMS, **{name: params[name] for name in CATEGORICAL_PARAMS
+                                            if params.get(name) is not None}, random_state=42)
+    model.fit(preprocessing.transform(x_train), abs_residual)
+    scale_pipeline = Pipeline(steps=[
+        ("preprocessing", preprocessing),
+        ('model', model)
+    ])
+    return scale_pipeline, float(np.percentile(abs_residual, 5))
+
+
+def conformal_quantile(scores, coverage=COVERAGE):
+    n = len(scores)
+    level = min(1.0, np.ceil((n + 1) * coverage) / n)
+    return float(np.quantile(scores, level, method='higher'))
+
+
+def calibrate(pipeline, x_train, y_train, x_test, y_test, coverage=COVERAGE):
+    # normalised split conformal: the band is prediction +- quantile * scale(x), with the quantile taken on
+    # one half of the test rows and the coverage checked on the other
+    scale_pipeline, min_scale = fit_scale_model(pipeline, x_train, y_train)
+    x_cal, x_eval, y_cal, y_eval = train_test_split(x_test, y_test, train_size=0.5, random_state=42)
+
+    def band(x):
+        return pipeline.predict(x), np.maximum(scale_pipeline.predict(x), min_scale)
+
+    pred, scale = band(x_cal)
+    quantile = conformal_quantile(np.abs(np.asarray(y_cal) - pred) / scale, coverage)
+
+    pred, scale = band(x_eval)
+    half_width = quantile * scale
+    info = {
+        'coverage': coverage,
+        'quantile': quantile,
+        'min_scale': min_scale,
+        'metrics': {
+            'empirical_coverage': float(np.mean(np.abs(np.asarray(y_eval) - pred) <= half_width)),
+            'mean_width': float(np.mean(2 * half_width)),
+            'median_width': float(np.median(2 * half_width)),
+            'n_calibration': len(x_cal),
+            'n_eval': len(x_eval),
+        },
+    }
+    return scale_pipeline, info
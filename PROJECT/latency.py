@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# pandas (summary) and batch (predict_timed) are imported where they're used: every page builds a
+# render tracker, and About must not pay for pandas to do it
+
+STAGES = ['model load', 'grid lookup', 'input building', 'preprocessing', 'inference', 'interval', 'total']
+
+# per-stage budgets in milliseconds for a single valuation once the model is warm
+LATENCY_BUDGET_MS = {
+    'model load': 1.0,
+    'grid lookup': 0.5,
+    'input building': 5.0,
+    'preprocessing': 20.0,
+    'inference': 10.0,
+    'interval': 10.0,
+    'total': 50.0,
+}
+
+WINDOW = 1000
+
+
+class LatencyTracker:
+
+    def __init__(self, window=WINDOW):
+        self._window = window
+        self._samples = {stage: deque(maxlen=window) for stage in STAGES}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, ms):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self._window)).append(ms)
+
+    def summary(self):
+        import pandas as pd
+
+        with self._lock:
+            samples = {name: np.array(values) for name, values in self._samples.items()}
+
+        rows = []
+        for name, values in samples.items():
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            budget = LATENCY_BUDGET_MS.get(name)
+            rows.append({
+                'Stage': name,
+                'Count': len(values),
+                'p50 (ms)': p50,
+                'p95 (ms)': p95,
+                'p99 (ms)': p99,
+                'Budget (ms)': budget,
+                'Within budget': budget is None or p95 <= budget,
+            })
+        return pd.DataFrame(rows, columns=['Stage', 'Count', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)',
+                                           'Budget (ms)', 'Within budget'])
+
+
+def predict_timed(model, row, tracker):
+    from batch import FEATURES
+
+    start = time.perf_counter()
+
+    with tracker.stage('input building'):
+        input_data = {col: row[col] for col in FEATURES}
+
+    with tracker.stage('preprocessing'):
+        features = model.transform_one(input_data)
+
+    with tracker.stage('inference'):
+        price = float(model.predict_transformed(features)[0])
+
+    # the band reuses the preprocessed row; older artifacts without an interval model return None
+    half_width = None
+    if model.interval is not None:
+        with tracker.stage('interval'):
+            half_width = float(model.half_width_transformed(features)[0])
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    tracker.record('total', elapsed_ms)
+    return price, half_width, elapsed_ms
+
+
+def half_width_timed(model, row, tracker):
+    # for prices that came from the grid, which stores no band
+    if model.interval is None:
+        return None
+    with tracker.stage('interval'):
+        return float(model.half_width_transformed(model.transform_one(row))[0])
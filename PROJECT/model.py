@@ -1,18 +1,27 @@
+import os
+import sys
 import pandas as pd
 import numpy as np
 import seaborn as sns
 from sklearn.model_selection import train_test_split,GridSearchCV
-from sklearn.preprocessing import RobustScaler,OneHotEncoder
+from sklearn.preprocessing import RobustScaler,OneHotEncoder,OrdinalEncoder
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
-import pickle as pkl
 from xgboost import XGBRegressor
 from sklearn.tree import DecisionTreeRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error,root_mean_squared_error
+from artifact import save_trained
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datasets import load_csv, resolve_path
 
 
-df=pd.read_csv(r'C:\Users\pavan\Desktop\data science\PROJECT\car_sales_data.csv')
+# 'onehot' (default) or 'native': category codes straight into XGBoost's categorical splits,
+# see categorical.py for the side-by-side comparison
+PIPELINE_MODE=os.environ.get('PIPELINE_MODE','onehot')
+
+
+df=load_csv('PROJECT/car_sales_data.csv')
 
 
 cat_col=df.select_dtypes(exclude='number').columns
@@ -42,6 +51,18 @@ cat_pipleline=Pipeline(
         ('car_encoding',OneHotEncoder(handle_unknown='ignore'))
     ]
 )
+model=XGBRegressor()
+
+
+if PIPELINE_MODE=='native':
+    cat_pipleline=Pipeline(
+        steps=[
+            ('car_encoding',OrdinalEncoder(handle_unknown='use_encoded_value',unknown_value=np.nan,
+                                           encoded_missing_value=np.nan))
+        ]
+    )
+    model=XGBRegressor(tree_method='hist',enable_categorical=True,max_cat_to_onehot=1,
+                       feature_types=['q']*len(num)+['c']*len(cat))
 
 
 
@@ -57,7 +78,7 @@ preprocessing=ColumnTransformer(
 main_pipeline=Pipeline(
     steps=[
         ("preprocessing",preprocessing),
-        ('model',XGBRegressor())
+        ('model',model)
     ]
 )
 
@@ -78,6 +99,18 @@ print("MAE:", mean_absolute_error(y_test, y_pred))
 print("RMSE:", root_mean_squared_error(y_test, y_pred))
 
 
-with open('model.pkl', 'wb') as file:
-    pkl.dump(main_pipeline, file)
-    print('successfull')
\ No newline at end of file
+# calibrates the 90% price band; retrain.py continues from here on whatever is appended to the CSV later
+artifact_path, interval_info = save_trained(
+    main_pipeline, x_train, y_train, x_test, y_test, resolve_path('PROJECT/car_sales_data.csv'), len(df),
+    metrics={
+        'mae': float(mean_absolute_error(y_test, y_pred)),
+        'rmse': float(root_mean_squared_error(y_test, y_pred)),
+        'r2': float(main_pipeline.score(x_test, y_test)),
+        'n_train': len(x_train),
+        'n_test': len(x_test),
+    },
+    training={'pipeline_mode': PIPELINE_MODE},
+)
+print("90% interval coverage:", interval_info['metrics']['empirical_coverage'])
+print("Mean interval width:", interval_info['metrics']['mean_width'])
+print('successfull', artifact_path)
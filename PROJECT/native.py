@@ -0,0 +1,377 @@
+import argparse
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+
+PICKLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model.pkl')
+NATIVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_native.npz')
+
+CHUNK_SIZE = 2000
+
+TREE_ARRAYS = ['children', 'feature', 'threshold', 'missing_right', 'value', 'roots']
+# only present when the booster has categorical splits
+CATEGORICAL_ARRAYS = ['cat_row', 'cat_bits']
+
+
+def _unwrap(transformer):
+    # the repo wraps every encoder in a one-step Pipeline
+    steps = getattr(transformer, 'steps', None)
+    if steps is None:
+        return transformer
+    if len(steps) != 1:
+        raise ValueError(f"Can't flatten a {len(steps)}-step sub-pipeline")
+    return steps[0][1]
+
+
+def _flatten_preprocessing(preprocessing):
+    numeric, center, scale = [], [], []
+    categorical, categories, offsets = [], [], []
+    encoding = 'onehot'
+    offset = 0
+
+    for name, transformer, columns in preprocessing.transformers_:
+        if transformer == 'drop' or len(columns) == 0:
+            continue
+        step = _unwrap(transformer)
+        kind = type(step).__name__
+
+        if kind == 'RobustScaler':
+            n = len(columns)
+            if numeric and offset != len(numeric):
+                raise ValueError('Numeric columns must come before the one-hot columns')
+            numeric += list(columns)
+            center += list(step.center_) if step.center_ is not None else [0.0] * n
+            scale += list(step.scale_) if step.scale_ is not None else [1.0] * n
+            offset += n
+        elif kind == 'OneHotEncoder':
+            if step.drop is not None:
+                raise ValueError("OneHotEncoder(drop=...) is not supported")
+            for column, cats in zip(columns, step.categories_):
+                categorical.append(column)
+                categories.append(np.asarray(cats).astype(str))
+                offsets.append(offset)
+                offset += len(cats)
+        elif kind == 'OrdinalEncoder':
+            # category codes for XGBoost's native categorical splits; unknown categories must come out missing
+            if step.handle_unknown != 'use_encoded_value' or not np.isnan(step.unknown_value):
+                raise ValueError("OrdinalEncoder must map unknown categories to NaN")
+            encoding = 'ordinal'
+            for column, cats in zip(columns, step.categories_):
+                categorical.append(column)
+                categories.append(np.asarray(cats).astype(str))
+                offsets.append(offset)
+                offset += 1
+        else:
+            raise ValueError(f"Can't flatten transformer '{name}' ({kind})")
+
+    return {
+        'numeric': numeric,
+        # scaled in float64 like sklearn, then cast to float32 like XGBoost, so splits land identically
+        'center': np.asarray(center, dtype=np.float64),
+        'scale': np.asarray(scale, dtype=np.float64),
+        'categorical': categorical,
+        'categories': categories,
+        'offsets': np.asarray(offsets, dtype=np.int32),
+        'n_features': offset,
+        'encoding': encoding,
+        # a sparse ColumnTransformer output drops zeros, which XGBoost then reads as missing
+        'zero_as_missing': bool(getattr(preprocessing, 'sparse_output_', False)),
+    }
+
+
+def _flatten_booster(booster):
+    model = json.loads(booster.save_raw('json'))['learner']
+    if model['gradient_booster']['name'] != 'gbtree':
+        raise ValueError('Only gbtree boosters can be flattened')
+    if model['objective']['name'] != 'reg:squarederror':
+        raise ValueError(f"Unsupported objective {model['objective']['name']}")
+
+    trees = model['gradient_booster']['model']['trees']
+    children, feature, threshold, missing_right, value, roots = [], [], [], [], [], []
+    cat_row, cat_sets = [], []
+    start = 0
+    for tree in trees:
+        n = len(tree['left_children'])
+        # categorical nodes send the codes listed in `categories` right
+        rows = np.full(n, -1, dtype=np.int32)
+        for node, segment, size in zip(tree['categories_nodes'], tree['categories_segments'],
+                                       tree['categories_sizes']):
+            rows[node] = len(cat_sets)
+            cat_sets.append(tree['categories'][segment:segment + size])
+        cat_row.append(rows)
+        tree_left = np.asarray(tree['left_children'], dtype=np.int32)
+        tree_right = np.asarray(tree['right_children'], dtype=np.int32)
+        leaf = tree_left == -1
+        # leaves point at themselves so every row can take the same number of steps;
+        # children are interleaved so node i goes to children[2 * i + go_right]
+        left = np.where(leaf, np.arange(n), tree_left) + start
+        right = np.where(leaf, np.arange(n), tree_right) + start
+        children.append(np.stack([left, right], axis=1).ravel())
+        feature.append(np.where(leaf, 0, tree['split_indices']))
+        threshold.append(np.where(leaf, 0.0, tree['split_conditions']))
+        missing_right.append(~np.asarray(tree['default_left'], dtype=bool))
+        # xgboost stores the leaf weight in split_conditions
+        value.append(np.where(leaf, tree['split_conditions'], 0.0))
+        roots.append(start)
+        start += n
+
+    base_score = float(str(model['learner_model_param']['base_score']).strip('[]'))
+    arrays = {
+        'children': np.concatenate(children).astype(np.int32),
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float32),
+        'missing_right': np.concatenate(missing_right),
+        'value': np.concatenate(value).astype(np.float32),
+        'roots': np.asarray(roots, dtype=np.int32),
+    }
+    if cat_sets:
+        width = max((max(cats) for cats in cat_sets if cats), default=0) + 1
+        cat_bits = np.zeros((len(cat_sets), width), dtype=bool)
+        for i, cats in enumerate(cat_sets):
+            cat_bits[i, cats] = True
+        arrays.update(cat_row=np.concatenate(cat_row), cat_bits=cat_bits)
+    return arrays, base_score, _max_depth(trees)
+
+
+def _max_depth(trees):
+    depth = 0
+    for tree in trees:
+        stack = [(0, 0)]
+        while stack:
+            node, d = stack.pop()
+            depth = max(depth, d)
+            if tree['left_children'][node] != -1:
+                stack.append((tree['left_children'][node], d + 1))
+                stack.append((tree['right_children'][node], d + 1))
+    return depth
+
+
+class NativePredictor:
+
+    def __init__(self, arrays, meta):
+        self.meta = meta
+        self.numeric = meta['numeric']
+        self.categorical = meta['categorical']
+        self.n_features = meta['n_features']
+        self.zero_as_missing = meta['zero_as_missing']
+        # artifacts written before ordinal support carry no encoding key
+        self.encoding = meta.get('encoding', 'onehot')
+        self.base_score = meta['base_score']
+        self.max_depth = meta['max_depth']
+
+        self.center = arrays['center']
+        self.scale = arrays['scale']
+        self.offsets = arrays['offsets']
+        self.categories = [arrays[f'categories_{i}'] for i in range(len(self.categorical))]
+        # what each (sorted) category encodes to: its one-hot column, or its ordinal code; categories added
+        # by an incremental retrain get slots after the existing ones, so trained splits never move
+        self.slots = [
+            arrays.get(f'slots_{i}', np.arange(len(cats)) + (0 if self.encoding == 'ordinal' else offset))
+            for i, (cats, offset) in enumerate(zip(self.categories, self.offsets))
+        ]
+        self._category_index = [dict(zip(cats, slots.tolist())) for cats, slots in zip(self.categories, self.slots)]
+        for name in TREE_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.cat_row = arrays.get('cat_row')
+        self.cat_bits = arrays.get('cat_bits')
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        pre = _flatten_preprocessing(pipeline.named_steps['preprocessing'])
+        trees, base_score, max_depth = _flatten_booster(pipeline.named_steps['model'].get_booster())
+
+        arrays = dict(trees, center=pre['center'], scale=pre['scale'], offsets=pre['offsets'])
+        for i, cats in enumerate(pre['categories']):
+            arrays[f'categories_{i}'] = cats
+        meta = {
+            'numeric': pre['numeric'],
+            'categorical': pre['categorical'],
+            'n_features': pre['n_features'],
+            'encoding': pre['encoding'],
+            'zero_as_missing': pre['zero_as_missing'],
+            'base_score': base_score,
+            'max_depth': max_depth,
+        }
+        return cls(arrays, meta)
+
+    def tree_arrays(self):
+        names = TREE_ARRAYS + (CATEGORICAL_ARRAYS if self.cat_row is not None else [])
+        return {name: getattr(self, name) for name in names}
+
+    def arrays(self):
+        arrays = self.tree_arrays()
+        arrays.update(center=self.center, scale=self.scale, offsets=self.offsets)
+        for i, (cats, slots) in enumerate(zip(self.categories, self.slots)):
+            arrays[f'categories_{i}'] = cats
+            arrays[f'slots_{i}'] = slots
+        return arrays
+
+    def grow(self, data):
+        # returns a predictor whose vocabularies also cover the categories in `data`, and what was added
+        arrays, added = self.arrays(), {}
+        n_features = self.n_features
+        for i, (column, cats, slots) in enumerate(zip(self.categorical, self.categories, self.slots)):
+            new = np.setdiff1d(np.unique(np.asarray(data[column]).astype(str)), cats)
+            if not len(new):
+                continue
+            if self.encoding == 'ordinal':
+                new_slots = len(cats) + np.arange(len(new))
+            else:
+                new_slots = n_features + np.arange(len(new))
+                n_features += len(new)
+            merged = np.concatenate([cats, new])
+            order = np.argsort(merged, kind='stable')
+            arrays[f'categories_{i}'] = merged[order]
+            arrays[f'slots_{i}'] = np.concatenate([slots, new_slots])[order]
+            added[column] = new.tolist()
+        return NativePredictor(arrays, dict(self.meta, n_features=n_features)), added
+
+    def with_booster(self, booster):
+        # same preprocessing, new trees
+        trees, base_score, max_depth = _flatten_booster(booster)
+        arrays = {name: array for name, array in self.arrays().items() if name not in TREE_ARRAYS + CATEGORICAL_ARRAYS}
+        return NativePredictor(dict(arrays, **trees), dict(self.meta, base_score=base_score, max_depth=max_depth))
+
+    def save(self, path=NATIVE_PATH):
+        np.savez(path, meta=np.asarray(json.dumps(self.meta)), **self.arrays())
+
+    @classmethod
+    def load(cls, path=NATIVE_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files if name != 'meta'}
+            meta = json.loads(str(data['meta']))
+        return cls(arrays, meta)
+
+    def transform(self, data):
+        n = len(np.asarray(data[self.numeric[0]] if self.numeric else data[self.categorical[0]]))
+        x = np.zeros((n, self.n_features), dtype=np.float32)
+
+        for i, column in enumerate(self.numeric):
+            x[:, i] = (np.asarray(data[column], dtype=np.float64) - self.center[i]) / self.scale[i]
+
+        rows = np.arange(n)
+        for column, cats, slots, offset in zip(self.categorical, self.categories, self.slots, self.offsets):
+            values = np.asarray(data[column]).astype(str)
+            codes = np.searchsorted(cats, values)
+            codes = np.minimum(codes, len(cats) - 1)
+            known = cats[codes] == values
+            if self.encoding == 'ordinal':
+                x[:, offset] = np.where(known, slots[codes], np.nan)
+            else:
+                x[rows[known], slots[codes[known]]] = 1.0
+
+        if self.zero_as_missing:
+            x[x == 0] = np.nan
+        return x
+
+    def transform_one(self, row):
+        x = np.zeros(self.n_features, dtype=np.float32)
+        for i, column in enumerate(self.numeric):
+            x[i] = (float(row[column]) - self.center[i]) / self.scale[i]
+        for column, index, offset in zip(self.categorical, self._category_index, self.offsets):
+            slot = index.get(str(row[column]))
+            if self.encoding == 'ordinal':
+                x[offset] = np.nan if slot is None else slot
+            elif slot is not None:
+                x[slot] = 1.0
+        if self.zero_as_missing:
+            x[x == 0] = np.nan
+        return x
+
+    def predict_transformed(self, x):
+        x = np.atleast_2d(x)
+        n, n_trees = len(x), len(self.roots)
+        flat = x.ravel()
+        row_start = np.repeat(np.arange(n, dtype=np.int64) * x.shape[1], n_trees)
+        node = np.tile(self.roots, n)
+
+        for _ in range(self.max_depth):
+            values = flat[row_start + self.feature[node]]
+            # NaN fails both comparisons, so only nodes whose default is right send it right
+            go_right = (values >= self.threshold[node]) | (np.isnan(values) & self.missing_right[node])
+            if self.cat_row is not None:
+                go_right = self._categorical_decisions(node, values, go_right)
+            node = self.children[2 * node + go_right]
+
+        return self.base_score + self.value[node].reshape(n, n_trees).sum(axis=1, dtype=np.float64)
+
+    def _categorical_decisions(self, node, values, go_right):
+        rows = self.cat_row[node]
+        is_cat = rows >= 0
+        if not is_cat.any():
+            return go_right
+        codes = values[is_cat]
+        missing = np.isnan(codes)
+        # codes the split never saw go left, as in xgboost
+        codes = np.where(missing, -1, codes).astype(np.int64)
+        valid = (codes >= 0) & (codes < self.cat_bits.shape[1])
+        listed = np.zeros(len(codes), dtype=bool)
+        listed[valid] = self.cat_bits[rows[is_cat][valid], codes[valid]]
+        go_right[is_cat] = np.where(missing, self.missing_right[node][is_cat], listed)
+        return go_right
+
+    def predict(self, data, chunk_size=CHUNK_SIZE):
+        x = self.transform(data)
+        out = np.empty(len(x), dtype=np.float64)
+        for start in range(0, len(x), chunk_size):
+            out[start:start + chunk_size] = self.predict_transformed(x[start:start + chunk_size])
+        return out
+
+    def predict_one(self, row):
+        return float(self.predict_transformed(self.transform_one(row))[0])
+
+
+def export_native(pipeline, path=NATIVE_PATH):
+    predictor = NativePredictor.from_pipeline(pipeline)
+    predictor.save(path)
+    return predictor
+
+
+def main():
+    from batch import FEATURES, read_table
+
+    parser = argparse.ArgumentParser(description='Flatten model.pkl into a NumPy-only predictor')
+    parser.add_argument('--model', default=PICKLE_PATH)
+    parser.add_argument('--output', default=NATIVE_PATH)
+    parser.add_argument('--check', default=None, help='CSV to compare native and pickled predictions on')
+    args = parser.parse_args()
+
+    with open(args.model, 'rb') as f:
+        pipeline = pickle.load(f)
+    predictor = export_native(pipeline, args.output)
+    print(f"exported {len(predictor.roots)} trees to {args.output}")
+
+    if args.check:
+        df = read_table(args.check)
+        x = df[FEATURES]
+
+        start = time.perf_counter()
+        expected = pipeline.predict(x)
+        pipeline_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = predictor.predict(x)
+        native_time = time.perf_counter() - start
+
+        one = x.iloc[:1]
+        row = one.iloc[0].to_dict()
+        start = time.perf_counter()
+        for _ in range(100):
+            pipeline.predict(one)
+        pipeline_one = (time.perf_counter() - start) / 100
+        start = time.perf_counter()
+        for _ in range(100):
+            predictor.predict_one(row)
+        native_one = (time.perf_counter() - start) / 100
+
+        print(f"max abs diff: {np.max(np.abs(actual - expected)):.6f}")
+        print(f"batch ({len(x):,} rows): pipeline {pipeline_time:.3f}s, native {native_time:.3f}s")
+        print(f"single row: pipeline {pipeline_one * 1e3:.2f}ms, native {native_one * 1e3:.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(PROJECT_DIR, 'app.py')
+
+ROUNDS = 20
+MANUFACTURERS = ['Toyota', 'Ford', 'Porsche', 'VW', 'BMW']
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _cpu_seconds(pid):
+    # user + system time of the Streamlit server process (Linux)
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except OSError:
+        return float('nan')
+
+
+class Session:
+    """A bare websocket client speaking Streamlit's protocol: enough to rerun the script with widget values,
+    the way the browser does, and to time each round trip."""
+
+    def __init__(self, ws, pid):
+        self.ws = ws
+        self.pid = pid
+        self.widgets = {}
+        self.page_script_hash = ''
+
+    async def rerun(self, widgets=(), fragment_id=''):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.page_script_hash = self.page_script_hash
+        state.fragment_id = fragment_id
+        state.widget_states.widgets.extend(widgets)
+
+        cpu = _cpu_seconds(self.pid)
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        n_messages = n_bytes = 0
+        while True:
+            raw = await self.ws.recv()
+            n_messages += 1
+            n_bytes += len(raw)
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session':
+                self.page_script_hash = forward.new_session.page_script_hash
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                widget = getattr(element, element.WhichOneof('type'))
+                if hasattr(widget, 'id') and '-' in getattr(widget, 'id', ''):
+                    self.widgets[widget.id.rsplit('-', 1)[1]] = (widget.id, forward.delta.fragment_id)
+            elif kind == 'script_finished':
+                break
+        return {
+            'ms': (time.perf_counter() - start) * 1000,
+            'cpu_ms': (_cpu_seconds(self.pid) - cpu) * 1000,
+            'messages': n_messages,
+            'kb': n_bytes / 1024,
+        }
+
+    def widget(self, key, **value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widget_id, fragment_id = self.widgets[key]
+        return WidgetState(id=widget_id, **value), fragment_id
+
+
+async def _bench(url, pid, rounds):
+    import websockets
+
+    async with websockets.connect(url, subprotocols=['streamlit'], max_size=None) as ws:
+        session = Session(ws, pid)
+        results = {'first load': [await session.rerun()]}
+        # a fragment rerun when the widget was drawn inside one, a full rerun otherwise, as in the browser
+        for i in range(rounds):
+            state, fragment_id = session.widget('manufacturer', string_value=MANUFACTURERS[i % len(MANUFACTURERS)])
+            results.setdefault('change manufacturer', []).append(await session.rerun([state], fragment_id))
+            manufacturer = state
+            state, fragment_id = session.widget('predict_btn', trigger_value=True)
+            results.setdefault('predict', []).append(await session.rerun([manufacturer, state], fragment_id))
+        return results
+
+
+def bench(app_path=APP_PATH, rounds=ROUNDS):
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', app_path, '--server.headless', 'true',
+         '--server.port', str(port), '--browser.gatherUsageStats', 'false'],
+        cwd=os.path.dirname(os.path.abspath(app_path)), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+        return asyncio.run(_bench(f'ws://127.0.0.1:{port}/_stcore/stream', server.pid, rounds))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-interaction render time of the Streamlit app, measured '
+                                                 'over its websocket like a browser session')
+    parser.add_argument('app', nargs='?', default=APP_PATH)
+    parser.add_argument('--rounds', type=int, default=ROUNDS)
+    args = parser.parse_args()
+
+    results = bench(args.app, args.rounds)
+    print(f"{'interaction':22} {'runs':>5} {'p50 ms':>8} {'p95 ms':>8} {'server CPU ms':>14} {'KB sent':>8}")
+    for name, runs in results.items():
+        ms = np.array([run['ms'] for run in runs])
+        print(f"{name:22} {len(runs):5d} {np.percentile(ms, 50):8.1f} {np.percentile(ms, 95):8.1f} "
+              f"{np.mean([run['cpu_ms'] for run in runs]):14.1f} {np.mean([run['kb'] for run in runs]):8.1f}")
+
+
+if __name__ == '__main__':
+    main()
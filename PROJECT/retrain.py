@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from aggregates import head_hash, iter_blocks
+from artifact import ARTIFACT_ROOT, load_artifact, publish
+from batch import DTYPES, FEATURES, TARGET, prepare_features, read_table
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(PROJECT_DIR, 'car_sales_data.csv')
+
+# each refresh adds a few trees at a lower learning rate than the from-scratch fit, so one batch of
+# new sales nudges the model instead of rewriting it
+ROUNDS = 20
+LEARNING_RATE = 0.1
+
+
+def source_key(path):
+    # manifests are committed, so sources are recorded relative to the project directory
+    return os.path.relpath(os.path.abspath(path), PROJECT_DIR).replace(os.sep, '/')
+
+
+def source_record(path, rows):
+    # what a from-scratch fit on the whole of `path` covers; written into the artifact's training metadata
+    return {source_key(path): {'offset': os.path.getsize(path), 'rows': rows, 'head_sha256': head_hash(path)}}
+
+
+def read_delta(model, path=DATA_PATH):
+    # rows appended to `path` since `model` was trained, plus the updated source record
+    key = source_key(path)
+    source = model.manifest['training'].get('sources', {}).get(key)
+    if source is None:
+        raise ValueError(f"Artifact {model.version} doesn't record how much of {key} it was trained on; "
+                         f"pass the new rows as files instead")
+    if os.path.getsize(path) < source['offset'] or head_hash(path) != source['head_sha256']:
+        raise ValueError(f"{key} was rewritten since {model.version}; retrain from scratch with model.py")
+
+    frames, offset = [], source['offset']
+    for frame, offset in iter_blocks(path, offset, FEATURES + [TARGET], dict(DTYPES, **{TARGET: 'float64'})):
+        frames.append(frame)
+    delta = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=FEATURES + [TARGET])
+    return delta, {key: dict(source, offset=offset, rows=source['rows'] + len(delta))}
+
+
+def widen(booster, n_features):
+    # new one-hot columns sit after the existing ones and no trained split reads them, so raising the
+    # booster's feature count is enough to keep boosting (and predicting) on the wider rows
+    if booster.num_features() >= n_features:
+        return booster
+    model = json.loads(booster.save_raw('json'))
+    model['learner']['learner_model_param']['num_feature'] = str(n_features)
+    wide = xgb.Booster()
+    wide.load_model(bytearray(json.dumps(model).encode()))
+    return wide
+
+
+def _feature_order(model, added):
+    # names for the appended one-hot columns, in slot order, following the existing naming
+    order = list(model.manifest['feature_order'])
+    if model.native.encoding == 'ordinal':
+        return order
+    for column, offset in zip(model.native.categorical, model.native.offsets):
+        head, sep, _ = order[offset].partition('__')
+        order.extend(f"{head}{sep}{column}_{cat}" for cat in added.get(column, []))
+    return order
+
+
+def _scores(predictor, booster, x, y):
+    pred = booster.inplace_predict(predictor.transform(x), missing=np.nan)
+    error = np.asarray(y, dtype=np.float64) - pred
+    return {
+        'mae': float(np.mean(np.abs(error))),
+        'rmse': float(np.sqrt(np.mean(error ** 2))),
+        'r2': float(1 - np.sum(error ** 2) / np.sum((y - np.mean(y)) ** 2)),
+    }
+
+
+def update(model, delta, rounds=ROUNDS, learning_rate=LEARNING_RATE):
+    # continues boosting from the published trees on `delta` only; the scalers stay as fitted, unseen
+    # categories get new columns (or codes), so cost follows the size of the delta, not the history
+    if TARGET not in delta.columns:
+        raise ValueError(f"New rows need a '{TARGET}' column to train on")
+    x = prepare_features(delta)
+    y = delta[TARGET].to_numpy(dtype=np.float64)
+    predictor, added = model.native.grow(x)
+    booster = widen(model.booster, predictor.n_features)
+    categorical = predictor.encoding == 'ordinal'
+
+    params = {
+        'objective': json.loads(booster.save_config())['learner']['objective']['name'],
+        'tree_method': 'hist',
+        'learning_rate': learning_rate,
+        **({'max_cat_to_onehot': 1} if categorical else {}),
+    }
+    dtrain = xgb.DMatrix(predictor.transform(x), label=y, missing=np.nan,
+                         feature_types=booster.feature_types, enable_categorical=categorical)
+    before = _scores(predictor, booster, x, y)
+    booster = xgb.train(params, dtrain, num_boost_round=rounds, xgb_model=booster)
+
+    stats = {
+        'rows': len(delta),
+        'rounds': rounds,
+        'learning_rate': learning_rate,
+        'n_trees': booster.num_boosted_rounds(),
+        'added_categories': added,
+        # the old model had never seen these rows, so 'before' is an honest out-of-sample check
+        'before': before,
+        'after': _scores(predictor, booster, x, y),
+    }
+    return predictor.with_booster(booster), booster, stats
+
+
+def retrain(model, delta, root=ARTIFACT_ROOT, sources=None, rounds=ROUNDS, learning_rate=LEARNING_RATE,
+            eval_data=None):
+    start = time.perf_counter()
+    predictor, booster, stats = update(model, delta, rounds, learning_rate)
+
+    interval = None
+    if model.interval is not None:
+        # the scale model only reads the columns it was trained on; its calibration is carried over
+        info = {key: value for key, value in model.interval.items() if key != 'native'}
+        interval = (model.scale_native, widen(model.scale_booster, predictor.n_features), info)
+
+    metrics = dict(model.metrics, n_train=model.metrics.get('n_train', 0) + len(delta))
+    if eval_data is not None:
+        x = prepare_features(eval_data)
+        metrics.update(_scores(predictor, booster, x, eval_data[TARGET].to_numpy(dtype=np.float64)),
+                       n_test=len(eval_data))
+    stats['seconds'] = time.perf_counter() - start
+
+    training = dict(model.manifest['training'], parent=model.version, retrain=stats)
+    if sources:
+        training['sources'] = dict(training.get('sources', {}), **sources)
+    path = publish(predictor, booster, _feature_order(model, stats['added_categories']), root,
+                   metrics, training, interval)
+    return path, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Continue boosting the published model on new sales rows')
+    parser.add_argument('inputs', nargs='*', help='files of new rows; default: rows appended to --source')
+    parser.add_argument('--source', default=DATA_PATH, help='append-only sales CSV the model was trained on')
+    parser.add_argument('--root', default=ARTIFACT_ROOT)
+    parser.add_argument('--rounds', type=int, default=ROUNDS)
+    parser.add_argument('--learning-rate', type=float, default=LEARNING_RATE)
+    parser.add_argument('--eval', default=None, help='held-out CSV to recompute the published metrics on')
+    args = parser.parse_args()
+
+    model = load_artifact(args.root)
+    if args.inputs:
+        delta, sources = pd.concat([read_table(path) for path in args.inputs], ignore_index=True), None
+    else:
+        delta, sources = read_delta(model, args.source)
+    if not len(delta):
+        print(f"no new rows since {model.version}")
+        return
+
+    path, stats = retrain(model, delta, args.root, sources, args.rounds, args.learning_rate,
+                          read_table(args.eval) if args.eval else None)
+    print(f"published {path} from {model.version}: +{stats['rows']:,} rows, {stats['rounds']} rounds "
+          f"in {stats['seconds']:.2f}s ({stats['n_trees']} trees)")
+    for column, cats in stats['added_categories'].items():
+        print(f"new {column}: {', '.join(cats)}")
+    print(f"MAE on the new rows: {stats['before']['mae']:,.1f} before, {stats['after']['mae']:,.1f} after")
+
+
+if __name__ == '__main__':
+    main()
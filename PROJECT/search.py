@@ -0,0 +1,225 @@
+import argparse
+import json
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.metrics import mean_absolute_error, root_mean_squared_error
+from sklearn.model_selection import KFold, ParameterSampler, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, RobustScaler
+from xgboost import XGBRegressor
+
+from artifact import save_trained
+from batch import DTYPES, FEATURES, TARGET
+
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'car_sales_data.csv')
+
+PARAM_SPACE = {
+    'max_depth': [3, 4, 5, 6, 8, 10],
+    'learning_rate': [0.03, 0.05, 0.1, 0.2, 0.3],
+    'subsample': [0.6, 0.8, 1.0],
+    'colsample_bytree': [0.6, 0.8, 1.0],
+    'min_child_weight': [1, 3, 5, 10],
+    'reg_lambda': [0.1, 1.0, 10.0],
+}
+
+N_CANDIDATES = 27
+MIN_ESTIMATORS = 50
+MAX_ESTIMATORS = 450
+ETA = 3
+N_FOLDS = 3
+
+
+def build_preprocessing(num, cat):
+    num_pipleline = Pipeline(steps=[('num_scaling', RobustScaler())])
+    cat_pipleline = Pipeline(steps=[('car_encoding', OneHotEncoder(handle_unknown='ignore'))])
+    return ColumnTransformer(transformers=[
+        ('num_pipleline', num_pipleline, num),
+        ('cat_pipleline', cat_pipleline, cat)
+    ])
+
+
+def load_data(path=DATA_PATH):
+    df = pd.read_csv(path, dtype=DTYPES)
+    x_train, x_test, y_train, y_test = train_test_split(df[FEATURES], df[TARGET], train_size=0.8, random_state=42)
+    return x_train, x_test, y_train, y_test
+
+
+def cache_folds(x, y, preprocessing, n_folds, cache_dir):
+    # the ColumnTransformer is fitted once per fold; every candidate reuses the cached matrices
+    folds = []
+    start = time.perf_counter()
+    for i, (train_idx, val_idx) in enumerate(KFold(n_folds, shuffle=True, random_state=42).split(x)):
+        pre = clone(preprocessing).fit(x.iloc[train_idx])
+        paths = {}
+        for part, idx in [('x_train', train_idx), ('x_val', val_idx)]:
+            paths[part] = os.path.join(cache_dir, f'fold{i}_{part}.npz')
+            sparse.save_npz(paths[part], sparse.csr_matrix(pre.transform(x.iloc[idx])))
+        for part, idx in [('y_train', train_idx), ('y_val', val_idx)]:
+            paths[part] = os.path.join(cache_dir, f'fold{i}_{part}.npy')
+            np.save(paths[part], y.iloc[idx].to_numpy())
+        folds.append(paths)
+    seconds_per_fold = (time.perf_counter() - start) / n_folds
+    return folds, seconds_per_fold
+
+
+_fold_cache = {}
+
+
+def _load_fold(paths):
+    key = paths['x_train']
+    if key not in _fold_cache:
+        _fold_cache[key] = (
+            sparse.load_npz(paths['x_train']), np.load(paths['y_train']),
+            sparse.load_npz(paths['x_val']), np.load(paths['y_val']),
+        )
+    return _fold_cache[key]
+
+
+def evaluate_candidate(task):
+    candidate, params, n_estimators, fold, paths = task
+    x_train, y_train, x_val, y_val = _load_fold(paths)
+
+    start = time.perf_counter()
+    model = XGBRegressor(**params, n_estimators=n_estimators, n_jobs=1, random_state=42)
+    model.fit(x_train, y_train)
+    rmse = root_mean_squared_error(y_val, model.predict(x_val))
+    return candidate, fold, rmse, time.perf_counter() - start
+
+
+def successive_halving(candidates, folds, n_jobs, min_estimators=MIN_ESTIMATORS,
+                       max_estimators=MAX_ESTIMATORS, eta=ETA, time_budget=None):
+    results = {i: {'params': params, 'rounds': []} for i, params in enumerate(candidates)}
+    alive = list(results)
+    n_estimators = min_estimators
+    task_seconds = 0.0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        while alive:
+            tasks = [(i, results[i]['params'], n_estimators, f, paths)
+                     for i in alive for f, paths in enumerate(folds)]
+            scores = {i: [] for i in alive}
+            seconds = {i: 0.0 for i in alive}
+            for candidate, fold, rmse, elapsed in pool.map(evaluate_candidate, tasks):
+                scores[candidate].append(rmse)
+                seconds[candidate] += elapsed
+                task_seconds += elapsed
+
+            for i in alive:
+                results[i]['rounds'].append({
+                    'n_estimators': n_estimators,
+                    'rmse': float(np.mean(scores[i])),
+                    'seconds': seconds[i],
+                })
+            print(f"  {len(alive):3d} candidates x {len(folds)} folds at {n_estimators} trees "
+                  f"({time.perf_counter() - start:.1f}s elapsed)")
+
+            out_of_time = time_budget is not None and time.perf_counter() - start > time_budget
+            if len(alive) == 1 or n_estimators >= max_estimators or out_of_time:
+                break
+            alive = sorted(alive, key=lambda i: results[i]['rounds'][-1]['rmse'])[:max(1, math.ceil(len(alive) / eta))]
+            n_estimators = min(n_estimators * eta, max_estimators)
+
+    best = min(alive, key=lambda i: results[i]['rounds'][-1]['rmse'])
+    return results, best, time.perf_counter() - start, task_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Successive-halving XGBoost search for the car price pipeline')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--candidates', type=int, default=N_CANDIDATES)
+    parser.add_argument('--folds', type=int, default=N_FOLDS)
+    parser.add_argument('--min-estimators', type=int, default=MIN_ESTIMATORS)
+    parser.add_argument('--max-estimators', type=int, default=MAX_ESTIMATORS)
+    parser.add_argument('--eta', type=int, default=ETA)
+    parser.add_argument('--time-budget', type=float, default=None, help='stop halving after this many seconds')
+    parser.add_argument('--n-jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--serial-baseline', action='store_true',
+                        help='rerun the same search with n_jobs=1 and report the measured speedup')
+    parser.add_argument('--report', default=None, help='write the per-candidate results as JSON')
+    parser.add_argument('--publish', action='store_true', help='refit the best candidate and publish an artifact')
+    args = parser.parse_args()
+
+    x_train, x_test, y_train, y_test = load_data(args.data)
+    num = x_train.select_dtypes(include='number').columns
+    cat = x_train.select_dtypes(exclude='number').columns
+    preprocessing = build_preprocessing(num, cat)
+
+    candidates = list(ParameterSampler(PARAM_SPACE, n_iter=args.candidates, random_state=42))
+
+    with tempfile.TemporaryDirectory(prefix='search-') as cache_dir:
+        folds, preprocess_seconds = cache_folds(x_train, y_train, preprocessing, args.folds, cache_dir)
+        print(f"cached {args.folds} folds ({preprocess_seconds * 1e3:.0f}ms of preprocessing per fold)")
+        results, best, wall_seconds, task_seconds = successive_halving(
+            candidates, folds, args.n_jobs, args.min_estimators, args.max_estimators, args.eta, args.time_budget)
+        serial_seconds = None
+        if args.serial_baseline:
+            print('serial baseline (n_jobs=1):')
+            serial_seconds = successive_halving(
+                candidates, folds, 1, args.min_estimators, args.max_estimators, args.eta, args.time_budget)[2]
+
+    print()
+    print(f"{'#':>3}  {'rounds':>6}  {'trees':>5}  {'cv rmse':>9}  {'seconds':>8}  params")
+    ranked = sorted(results.items(), key=lambda item: (-len(item[1]['rounds']), item[1]['rounds'][-1]['rmse']))
+    for i, result in ranked:
+        last = result['rounds'][-1]
+        seconds = sum(r['seconds'] for r in result['rounds'])
+        print(f"{i:3d}  {len(result['rounds']):6d}  {last['n_estimators']:5d}  {last['rmse']:9.1f}  "
+              f"{seconds:8.2f}  {result['params']}")
+
+    n_fits = sum(len(r['rounds']) for r in results.values()) * args.folds
+    print()
+    print(f"best candidate: #{best} {results[best]['params']}")
+    print(f"wall clock: {wall_seconds:.1f}s on {args.n_jobs} workers for {n_fits} fits")
+    # timed inside workers that share the CPU, so this is not what one worker alone would take
+    print(f"fit time summed over workers: {task_seconds:.1f}s, plus {n_fits * preprocess_seconds:.1f}s of "
+          f"preprocessing the fold cache saved")
+    if serial_seconds is not None:
+        print(f"measured n_jobs=1 run: {serial_seconds:.1f}s (speedup {serial_seconds / wall_seconds:.1f}x)")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({
+                'best': best,
+                'candidates': results,
+                'wall_seconds': wall_seconds,
+                'worker_seconds': task_seconds,
+                'serial_seconds': serial_seconds,
+                'preprocess_seconds_per_fold': preprocess_seconds,
+            }, f, indent=2)
+
+    if args.publish:
+        best_params = dict(results[best]['params'], n_estimators=results[best]['rounds'][-1]['n_estimators'])
+        main_pipeline = Pipeline(steps=[
+            ("preprocessing", preprocessing),
+            ('model', XGBRegressor(**best_params, random_state=42))
+        ])
+        main_pipeline.fit(x_train, y_train)
+        y_pred = main_pipeline.predict(x_test)
+        metrics = {
+            'mae': float(mean_absolute_error(y_test, y_pred)),
+            'rmse': float(root_mean_squared_error(y_test, y_pred)),
+            'r2': float(main_pipeline.score(x_test, y_test)),
+            'n_train': len(x_train),
+            'n_test': len(x_test),
+        }
+        path, interval_info = save_trained(main_pipeline, x_train, y_train, x_test, y_test, args.data,
+                                           len(x_train) + len(x_test), metrics=metrics,
+                                           training={'source': 'search.py', 'params': best_params})
+        print(f"MAE: {metrics['mae']:.1f}  RMSE: {metrics['rmse']:.1f}")
+        print(f"{interval_info['coverage']:.0%} band coverage: {interval_info['metrics']['empirical_coverage']:.3f}")
+        print(f"published {path}")
+
+
+if __name__ == '__main__':
+    main()
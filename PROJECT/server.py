@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from artifact import ARTIFACT_ROOT, latest_path, load_artifact
+from batch import DTYPES, FEATURES, MIN_PRICE
+from cache import model_fingerprint
+
+
+HOST = '127.0.0.1'
+PORT = 8000
+MAX_BATCH_SIZE = 256
+MAX_WAIT_MS = 2.0
+MAX_BODY_BYTES = 50 * 1024 * 1024
+# how often each worker checks whether a new model version was published
+RELOAD_INTERVAL = 1.0
+
+
+class MicroBatcher:
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        future = Future()
+        self._queue.put((row, future))
+        return future
+
+    def _collect(self):
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            # one model per batch, even if a reload swaps it mid-way
+            model = self.model
+            try:
+                result = predict_rows(model, [row for row, _ in items])
+            except Exception:
+                result = None
+            if result is not None:
+                for i, (_, future) in enumerate(items):
+                    future.set_result(_price(result, i, model))
+            else:
+                # one bad row must not fail the requests it was coalesced with: price them one by one
+                for row, future in items:
+                    try:
+                        future.set_result(_price(predict_rows(model, [row]), 0, model))
+                    except Exception as e:
+                        future.set_exception(e)
+            with self._lock:
+                self.batches += 1
+                self.requests += len(items)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+            }
+
+
+def _price(result, i, model):
+    return {
+        'price': result['prices'][i],
+        **({'lower': result['lower'][i], 'upper': result['upper'][i]} if 'lower' in result else {}),
+        'model_version': model.version,
+    }
+
+
+def validate(row):
+    # a clean copy of the model's fields: numbers as finite floats, categories as strings, nothing null
+    if not isinstance(row, dict):
+        raise ValueError('each vehicle must be a JSON object')
+    missing = [col for col in FEATURES if col not in row]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    clean = {}
+    for col in FEATURES:
+        value = row[col]
+        if value is None:
+            raise ValueError(f"'{col}' must not be null")
+        if DTYPES[col] == 'category':
+            if isinstance(value, (dict, list, bool)):
+                raise ValueError(f"'{col}' must be a string")
+            clean[col] = str(value)
+            continue
+        if isinstance(value, (dict, list, bool)):
+            raise ValueError(f"'{col}' must be a number")
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{col}' must be a number, got {value!r}") from None
+        if not np.isfinite(number):
+            raise ValueError(f"'{col}' must be a finite number")
+        clean[col] = number
+    return clean
+
+
+def predict_rows(model, rows):
+    columns = {col: [row[col] for row in rows] for col in FEATURES}
+    if model.interval is None:
+        return {'prices': np.maximum(model.predict(columns), MIN_PRICE).tolist()}
+    prices, lower, upper = np.maximum(model.predict_interval(columns), MIN_PRICE)
+    return {'prices': prices.tolist(), 'lower': lower.tolist(), 'upper': upper.tolist()}
+
+
+class PriceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'AutoValueAI'
+    # headers and body go out as separate writes; with Nagle on, keep-alive clients stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise ValueError('request body too large')
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, {
+                'status': 'ok',
+                'model_version': self.server.model.version,
+                'pid': os.getpid(),
+                'batcher': self.server.batcher.stats(),
+            })
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+            if self.path == '/predict':
+                self._send(200, self.server.batcher.submit(validate(payload)).result())
+            elif self.path == '/predict/batch':
+                rows = payload.get('vehicles') if isinstance(payload, dict) else payload
+                if not isinstance(rows, list):
+                    raise ValueError("expected a list of vehicles or {'vehicles': [...]}")
+                model = self.server.model
+                result = predict_rows(model, [validate(row) for row in rows]) if rows else {'prices': []}
+                self._send(200, dict(result, model_version=model.version))
+            else:
+                self._send(404, {'error': 'not found'})
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            self._send(500, {'error': str(e)})
+
+
+class PriceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, model_path=ARTIFACT_ROOT, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=MAX_WAIT_MS, bind_and_activate=True):
+        super().__init__(address, PriceHandler, bind_and_activate)
+        self.model_path = model_path
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.model = None
+        self.batcher = None
+        self._fingerprint = None
+        self._next_check = 0.0
+        self._reloading = False
+
+    def _load_warm(self):
+        # the artifact's arrays are memory-mapped so workers share them
+        model = load_artifact(self.model_path)
+        model.booster
+        if model.interval is not None:
+            model.scale_booster
+        predict_rows(model, [dict(zip(FEATURES, ['Ford', 'Fiesta', 1.0, 'Petrol', 2015, 50000]))])
+        return model
+
+    def load(self):
+        self._fingerprint = model_fingerprint(latest_path(self.model_path))
+        self.model = self._load_warm()
+
+    def start(self):
+        # per worker: threads don't survive fork
+        self.batcher = MicroBatcher(self.model, self.max_batch_size, self.max_wait_ms)
+
+    def service_actions(self):
+        # called by serve_forever between requests; a newly published version is loaded and warmed on a
+        # side thread while the old one keeps serving, then swapped in with a single assignment
+        now = time.monotonic()
+        if self._reloading or now < self._next_check:
+            return
+        self._next_check = now + RELOAD_INTERVAL
+        fingerprint = model_fingerprint(latest_path(self.model_path))
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._reloading = True
+            threading.Thread(target=self._reload, name='model-reload', daemon=True).start()
+
+    def _reload(self):
+        try:
+            model = self._load_warm()
+            self.model = self.batcher.model = model
+            print(f"[{os.getpid()}] now serving model {model.version}")
+        except Exception as e:
+            print(f"[{os.getpid()}] keeping model {self.model.version}: {e}")
+        finally:
+            self._reloading = False
+
+
+def serve(host=HOST, port=PORT, workers=1, model_path=ARTIFACT_ROOT,
+          max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+    start = time.perf_counter()
+    server = PriceServer((host, port), model_path, max_batch_size, max_wait_ms)
+    # loaded and warmed once, before forking: workers share the parent's booster, imports and page-cache
+    # mapped arrays copy-on-write instead of each loading its own
+    server.load()
+
+    # pre-fork: every worker accepts on the same listening socket
+    children = []
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = None
+            break
+        children.append(pid)
+
+    server.start()
+    if children is not None:
+        print(f"serving model {server.model.version} on http://{host}:{port} with {workers} worker(s), "
+              f"ready {(time.perf_counter() - start) * 1000:.0f}ms after start")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for pid in children or []:
+            os.waitpid(pid, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON/HTTP price service with micro-batching')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=1, help='pre-forked worker processes')
+    parser.add_argument('--model', default=ARTIFACT_ROOT, help='artifact root or version directory')
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, args.model, args.max_batch_size, args.max_wait_ms)
+
+
+if __name__ == '__main__':
+    main()
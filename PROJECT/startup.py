@@ -0,0 +1,169 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# stdlib only above this line: app.py imports this module before anything heavy
+
+# taken at first import; under the launcher below that is process start, under a plain
+# `streamlit run` it is the first page load
+PROCESS_START = time.perf_counter()
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(PROJECT_DIR, 'app.py')
+
+WARMUP_ROW = {'Manufacturer': 'Ford', 'Model': 'Fiesta', 'Engine size': 1.0, 'Fuel type': 'Petrol',
+              'Year of manufacture': 2015, 'Mileage': 50000}
+# big enough to go through the xgboost path as well as the NumPy tree walk
+WARMUP_BATCH = 128
+
+
+class Warmup:
+    """Loads the published model on a background thread and runs it once through every path the app
+    uses, so the first click doesn't pay for imports, booster loading or first-call allocations."""
+
+    def __init__(self, root=None):
+        self.root = root
+        self.model = None
+        self.fingerprint = None
+        self.error = None
+        self.timings = {}
+        self.ready_after = None
+        self.first_prediction_after = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='model-warmup', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _stage(self, name, start):
+        now = time.perf_counter()
+        self.timings[name] = (now - start) * 1000
+        return now
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            import pandas as pd
+            from artifact import ARTIFACT_ROOT, latest_path, load_artifact
+            from cache import model_fingerprint
+            from explain import explain_one
+            start = self._stage('imports', start)
+
+            root = self.root or ARTIFACT_ROOT
+            self.fingerprint = model_fingerprint(latest_path(root))
+            model = load_artifact(root)
+            start = self._stage('load', start)
+
+            model.booster
+            if model.interval is not None:
+                model.scale_booster
+            start = self._stage('booster', start)
+
+            batch = pd.DataFrame([WARMUP_ROW] * WARMUP_BATCH)
+            if model.interval is not None:
+                model.predict_interval_one(WARMUP_ROW)
+                model.predict_interval(batch)
+            else:
+                model.predict_one(WARMUP_ROW)
+                model.predict(batch)
+            explain_one(model, WARMUP_ROW)
+            self._stage('warm', start)
+            self.model = model
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready_after = time.perf_counter() - PROCESS_START
+            self._done.set()
+
+    def wait(self, fingerprint=None, timeout=None):
+        # the warmed model, or None if warming failed or a newer version has been published since
+        self._done.wait(timeout)
+        if self.model is None or (fingerprint is not None and fingerprint != self.fingerprint):
+            return None
+        return self.model
+
+    def record_prediction(self):
+        with self._lock:
+            if self.first_prediction_after is None:
+                self.first_prediction_after = time.perf_counter() - PROCESS_START
+
+    def summary(self):
+        return {
+            'ready': self._done.is_set(),
+            'error': str(self.error) if self.error else None,
+            'ready_after_s': self.ready_after,
+            'first_prediction_after_s': self.first_prediction_after,
+            'stages_ms': dict(self.timings),
+        }
+
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def start_warmup(root=None):
+    # one warm-up per process, however many sessions or threads ask for it
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = Warmup(root).start()
+        return _warmup
+
+
+def measure(repeats=3):
+    # each run is a new process, so the import and load costs are really paid
+    script = (
+        "import sys, time\n"
+        "t0 = time.perf_counter()\n"
+        "import startup\n"
+        "if sys.argv[1] == 'warm':\n"
+        "    startup.start_warmup().wait()\n"
+        "t1 = time.perf_counter()\n"
+        "from artifact import ARTIFACT_ROOT, load_artifact\n"
+        "from explain import explain_one\n"
+        "model = startup.start_warmup().wait() if sys.argv[1] == 'warm' else load_artifact(ARTIFACT_ROOT)\n"
+        "model.predict_interval_one(startup.WARMUP_ROW) if model.interval else model.predict_one(startup.WARMUP_ROW)\n"
+        "explain_one(model, startup.WARMUP_ROW)\n"
+        "t2 = time.perf_counter()\n"
+        "print((t1 - t0) * 1000, (t2 - t1) * 1000)\n"
+    )
+    results = {}
+    for mode in ['cold', 'warm']:
+        runs = []
+        for _ in range(repeats):
+            out = subprocess.run([sys.executable, '-W', 'ignore', '-c', script, mode], cwd=PROJECT_DIR,
+                                 capture_output=True, text=True, check=True).stdout.split()
+            runs.append((float(out[0]), float(out[1])))
+        startup_ms, click_ms = min(runs, key=lambda run: run[1])
+        results[mode] = {'startup_ms': startup_ms, 'first_click_ms': click_ms}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Start the Streamlit app with the model loaded and warmed up front')
+    parser.add_argument('--measure', action='store_true',
+                        help='report time-to-first-prediction with and without the warm-up, then exit')
+    args, streamlit_args = parser.parse_known_args()
+
+    if args.measure:
+        for mode, result in measure().items():
+            print(f"{mode}: startup {result['startup_ms']:,.0f}ms, first prediction + explanation "
+                  f"{result['first_click_ms']:,.1f}ms")
+        return
+
+    # warming runs alongside the Streamlit server start-up, in the same process the app script runs in;
+    # app.py's `import startup` must find this module rather than load a second copy
+    sys.modules.setdefault('startup', sys.modules[__name__])
+    start_warmup()
+    from streamlit.web import cli
+    sys.argv = ['streamlit', 'run', APP_PATH, *streamlit_args]
+    sys.exit(cli.main())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import SGDClassifier
+from sklearn.svm import SVC
+from sklearn.utils.validation import check_array, check_is_fitted
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from datasets import load_csv
+
+
+APPROXIMATIONS = ['nystroem', 'rff']
+
+# landmark rows (Nystroem) or random Fourier features (rff) the RBF kernel is approximated with
+N_COMPONENTS = 500
+ALPHA = 1e-4
+EPOCHS = 2
+CHUNK_SIZE = 10_000
+
+# sample the 'scale' gamma is estimated on
+GAMMA_SAMPLE = 10_000
+
+SCALES = [1, 10, 100]
+# exact SVC is timed only up to this many training rows; beyond, its quadratic growth is extrapolated
+SVC_MAX_ROWS = 30_000
+
+
+def scale_gamma(X, n=GAMMA_SAMPLE):
+    # SVC's gamma='scale', 1 / (n_features * X.var()), on a sample
+    X = X[:n]
+    if sp.issparse(X):
+        var = X.multiply(X).mean() - X.mean() ** 2
+    else:
+        var = np.asarray(X, dtype=np.float64).var()
+    return 1.0 / (X.shape[1] * var) if var > 0 else 1.0
+
+
+class KernelApproxSVM(ClassifierMixin, BaseEstimator):
+    """RBF-kernel SVM in time linear in rows: the kernel is approximated by an explicit feature map
+    (Nystroem landmarks or random Fourier features) and a linear SVM is trained on it by SGD, chunk by
+    chunk, so neither the kernel matrix nor the mapped training set is ever held in memory.
+
+    Chunks are mapped on `n_jobs` threads (the kernel products run in BLAS, outside the GIL) a few ahead
+    of the SGD updates, which stay in order on the calling thread."""
+
+    def __init__(self, approximation='nystroem', n_components=N_COMPONENTS, gamma='scale', alpha=ALPHA,
+                 epochs=EPOCHS, chunk_size=CHUNK_SIZE, n_jobs=None, random_state=0):
+        self.approximation = approximation
+        self.n_components = n_components
+        self.gamma = gamma
+        self.alpha = alpha
+        self.epochs = epochs
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def _mapped(self, X, chunks):
+        # (rows, mapped chunk) in the order given, at most n_jobs chunks in flight
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else (self.n_jobs or 1)
+        if n_jobs == 1:
+            for rows in chunks:
+                yield rows, self.approximation_.transform(X[rows])
+            return
+        with ThreadPoolExecutor(n_jobs) as pool:
+            pending = deque()
+            for rows in chunks:
+                pending.append((rows, pool.submit(self.approximation_.transform, X[rows])))
+                if len(pending) > n_jobs:
+                    rows, future = pending.popleft()
+                    yield rows, future.result()
+            while pending:
+                rows, future = pending.popleft()
+                yield rows, future.result()
+
+    def _chunks(self, n):
+        return [slice(start, start + self.chunk_size) for start in range(0, n, self.chunk_size)]
+
+    def fit(self, X, y):
+        if self.approximation not in APPROXIMATIONS:
+            raise ValueError(f"Unknown approximation '{self.approximation}', expected one of "
+                             f"{', '.join(APPROXIMATIONS)}")
+        X = check_array(X, accept_sparse='csr', dtype=np.float64)
+        y = np.asarray(y)
+        self.classes_ = np.unique(y)
+        self.n_features_in_ = X.shape[1]
+        self.gamma_ = scale_gamma(X) if self.gamma == 'scale' else self.gamma
+
+        if self.approximation == 'nystroem':
+            self.approximation_ = Nystroem(kernel='rbf', gamma=self.gamma_,
+                                           n_components=min(self.n_components, len(y)),
+                                           random_state=self.random_state)
+        else:
+            self.approximation_ = RBFSampler(gamma=self.gamma_, n_components=self.n_components,
+                                             random_state=self.random_state)
+        # Nystroem only keeps n_components sampled rows; RBFSampler only needs the width
+        self.approximation_.fit(X)
+
+        self.model_ = SGDClassifier(loss='hinge', alpha=self.alpha, random_state=self.random_state)
+        rng = np.random.default_rng(self.random_state)
+        chunks = self._chunks(len(y))
+        for _ in range(self.epochs):
+            order = [chunks[i] for i in rng.permutation(len(chunks))]
+            for rows, mapped in self._mapped(X, order):
+                self.model_.partial_fit(mapped, y[rows], classes=self.classes_)
+        return self
+
+    def decision_function(self, X):
+        check_is_fitted(self, 'model_')
+        X = check_array(X, accept_sparse='csr', dtype=np.float64)
+        return np.concatenate([self.model_.decision_function(mapped)
+                               for _, mapped in self._mapped(X, self._chunks(X.shape[0]))])
+
+    def predict(self, X):
+        scores = self.decision_function(X)
+        if scores.ndim == 1:
+            return self.classes_[(scores > 0).astype(int)]
+        return self.classes_[scores.argmax(axis=1)]
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def compare(scales=SCALES, svc_max_rows=SVC_MAX_ROWS, n_jobs=None):
+    from benchmarks import WORKLOADS, scale_up, split
+
+    path, read_kwargs, setup = WORKLOADS['adult_svc']
+    # categories keep the 100x copies small; the held-out rows are never part of a scaled copy
+    x, y, build = setup(load_csv(path, categories=True, **read_kwargs))
+    x_train, x_test, y_train, y_test = split(x, y)
+    train = x_train.assign(income=y_train)
+
+    results = []
+    svc_fit = None
+    for scale in scales:
+        big = scale_up(train, scale)
+        xs, ys = big.drop(columns='income'), big['income']
+        for name, model in [('SVC (exact RBF)', SVC()),
+                            ('Nystroem + linear SVM', KernelApproxSVM(n_jobs=n_jobs)),
+                            ('random features + linear SVM', KernelApproxSVM('rff', n_jobs=n_jobs))]:
+            row = {'scale': scale, 'model': name, 'train_rows': len(xs)}
+            if isinstance(model, SVC) and len(xs) > svc_max_rows:
+                # kernel SVC fit time grows with the square of the rows
+                if svc_fit is not None:
+                    row['fit_s_estimated'] = svc_fit[1] * (len(xs) / svc_fit[0]) ** 2
+                results.append(row)
+                continue
+            pipeline = build(xs).set_params(model=model)
+            fit_s, _ = _timed(lambda: pipeline.fit(xs, ys))
+            predict_s, y_pred = _timed(lambda: pipeline.predict(x_test))
+            if isinstance(model, SVC):
+                svc_fit = (len(xs), fit_s)
+            row.update(fit_s=fit_s, predict_s=predict_s, accuracy=float(np.mean(y_pred == y_test.to_numpy())))
+            results.append(row)
+    return {'test_rows': len(x_test), 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kernel-approximation linear SVMs against exact SVC on '
+                                                 'adult.csv, at growing dataset sizes')
+    parser.add_argument('--scale', type=int, nargs='+', default=SCALES)
+    parser.add_argument('--svc-max-rows', type=int, default=SVC_MAX_ROWS,
+                        help='largest training set exact SVC is run on; bigger ones are extrapolated')
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--report', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    report = compare(args.scale, args.svc_max_rows, args.n_jobs)
+    print(f"accuracy on {report['test_rows']:,} held-out rows")
+    print(f"{'scale':>5}  {'model':30}  {'train rows':>10}  {'fit s':>9}  {'predict s':>9}  {'accuracy':>8}")
+    for row in report['results']:
+        if 'fit_s' in row:
+            print(f"{row['scale']:5d}  {row['model']:30}  {row['train_rows']:10,}  {row['fit_s']:9.1f}  "
+                  f"{row['predict_s']:9.2f}  {row['accuracy']:8.4f}")
+        else:
+            estimate = f"~{row['fit_s_estimated']:,.0f}" if 'fit_s_estimated' in row else 'n/a'
+            print(f"{row['scale']:5d}  {row['model']:30}  {row['train_rows']:10,}  {estimate:>9}  (not run)")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, RobustScaler, StandardScaler, TargetEncoder
+from sklearn.svm import SVC
+from xgboost import XGBRegressor
+
+from datasets import ROOT, load_csv, resolve_path
+from profiling import Trace, instrument
+
+sys.path.insert(0, os.path.join(ROOT, 'PROJECT'))
+from categorical import build_pipeline
+
+
+# one workload per notebook pipeline: the CSV it reads, the notebook's own cleaning into (x, y), and the
+# pipeline it fits; each runs in a fresh process, and its RSS is reported past what this module's imports
+# (xgboost and every workload's estimators) already hold, so it belongs to that workload alone
+WORKLOADS = {}
+
+SCALES = [1]
+SPLIT_SEED = 42
+SCALE_SEED = 0
+# relative noise on float columns of the scaled-up copies, so the extra rows aren't exact duplicates
+JITTER = 0.01
+
+BATCH_ROWS = 10_000
+ONE_ROW_REPEATS = 50
+TIMEOUT = 1800
+
+# a phase only counts as a regression when it is this much slower and by at least this many seconds;
+# single timings of sub-millisecond phases are too noisy for a ratio alone
+TOLERANCE = 0.10
+MIN_DELTA_S = 0.005
+
+PHASES = ['load_s', 'prepare_s', 'preprocess_fit_s', 'preprocess_transform_s', 'model_fit_s',
+          'predict_one_ms', 'predict_batch_ms', 'workload_rss_mb']
+
+
+def workload(name, path, **read_kwargs):
+    def register(fn):
+        WORKLOADS[name] = (path, read_kwargs, fn)
+        return fn
+    return register
+
+
+def split(x, y):
+    return train_test_split(x, y, train_size=0.8, random_state=SPLIT_SEED)
+
+
+def _columns(x):
+    return x.select_dtypes(include='number').columns, x.select_dtypes(exclude='number').columns
+
+
+@workload('car_price', 'PROJECT/car_sales_data.csv')
+def car_price(df):
+    cat_col = df.select_dtypes(exclude='number').columns
+    df[cat_col] = df[cat_col].astype('category')
+    x, y = df.drop(columns='Price'), df['Price']
+
+    def build(x_train):
+        num, cat = _columns(x_train)
+        return build_pipeline(num, cat, mode=os.environ.get('PIPELINE_MODE', 'onehot'))
+    return x, y, build
+
+
+@workload('diamonds_knn', 'KNN/diamonds.csv')
+def diamonds_knn(df):
+    df = df.drop(columns='Unnamed: 0')
+    x, y = df.drop(columns='price'), df['price']
+
+    def build(x_train):
+        num, cat = _columns(x_train)
+        return Pipeline(steps=[
+            ('preprocessing', ColumnTransformer(transformers=[
+                ('num_pipleline', Pipeline(steps=[('num_scaling', RobustScaler())]), num),
+                # the notebook's TargetEncoder() reads the integer prices as a multiclass target
+                ('cat_pipleline', Pipeline(steps=[
+                    ('car_encoding', TargetEncoder(target_type='continuous'))
+                ]), cat),
+            ])),
+            ('model', KNeighborsRegressor(metric='manhattan', n_neighbors=5)),
+        ])
+    return x, y, build
+
+
+@workload('mail_svc', 'Vectorizer/mail_data.csv')
+def mail_svc(df):
+    x, y = df.drop(columns='Category'), df['Category']
+
+    def build(x_train):
+        return Pipeline(steps=[
+            ('preprocessing', ColumnTransformer(transformers=[
+                ('cat_pipleline', Pipeline(steps=[('vectorizing', CountVectorizer(stop_words='english'))]),
+                 'Message'),
+            ])),
+            ('model', SVC(class_weight='balanced')),
+        ])
+    return x, y, build
+
+
+@workload('adult_svc', 'SVM/SVC/adult.csv')
+def adult_svc(df):
+    # adult.ipynb stops after loading the data; this is the scaled-features RBF SVC its imports set up
+    x, y = df.drop(columns='income'), df['income']
+
+    def build(x_train):
+        num, cat = _columns(x_train)
+        return Pipeline(steps=[
+            ('preprocessing', ColumnTransformer(transformers=[
+                ('num_pipleline', Pipeline(steps=[('num_scaling', StandardScaler())]), num),
+                ('cat_pipleline', Pipeline(steps=[('encoding', OneHotEncoder(handle_unknown='ignore'))]), cat),
+            ])),
+            ('model', SVC()),
+        ])
+    return x, y, build
+
+
+@workload('loan_approval_logistic',
+          'logistic regression/research_grid(hyperparameter_tuning)/loan_approval_dataset.csv')
+def loan_approval_logistic(df):
+    cat_col = ['Loan_Term', 'Employment_Status', 'Residence_Type', 'Previous_Default']
+    num_cols = df.select_dtypes(include='number').columns.drop('Loan_Approved', errors='ignore')
+    x, y = df.drop(columns='Loan_Approved'), df['Loan_Approved']
+
+    def build(x_train):
+        return Pipeline(steps=[
+            ('preprocessing', ColumnTransformer(transformers=[
+                ('num_pipelines', Pipeline(steps=[('scaling-for_num_cols', StandardScaler())]), num_cols),
+                ('cat_pipelines', Pipeline(steps=[
+                    ('encoding_for_cat_cols', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1))
+                ]), cat_col),
+            ])),
+            ('model', LogisticRegression(max_iter=1000)),
+        ])
+    return x, y, build
+
+
+@workload('restaurant_random_forest', 'decision tree/ensemble methods/BAGGING METHODS/train.csv')
+def restaurant_random_forest(df):
+    df = df.drop(columns='Open Date')
+    x, y = df.drop(columns='revenue'), df['revenue']
+
+    def build(x_train):
+        num, cat = _columns(x_train)
+        return Pipeline(steps=[
+            ('preprocessing', ColumnTransformer(transformers=[
+                ('num_pipeline', Pipeline(steps=[('num_col', StandardScaler())]), num),
+                ('city_group', Pipeline(steps=[
+                    ('city_encodeing', OrdinalEncoder(categories=[['Other', 'Big Cities']],
+                                                      handle_unknown='use_encoded_value', unknown_value=-1))
+                ]), ['City Group']),
+                ('cat_pipeline', Pipeline(steps=[
+                    ('cat_col', OneHotEncoder(handle_unknown='ignore', sparse_output=False))
+                ]), cat.drop(labels='City Group')),
+            ])),
+            ('model', RandomForestRegressor(random_state=SPLIT_SEED)),
+        ])
+    return x, y, build
+
+
+@workload('flight_xgboost', 'decision tree/ensemble methods/FLIGHT/Data_Train.csv')
+def flight_xgboost(df):
+    # the notebook's feature engineering, date parsing included: it is part of what the workload costs
+    journey = pd.to_datetime(df['Date_of_Journey'], dayfirst=True)
+    departure = pd.to_datetime(df['Dep_Time'], format='mixed')
+    arrival = pd.to_datetime(df['Arrival_Time'], format='mixed')
+    duration = df['Duration'].str.extract(r'(?:(\d+)h)?\s*(?:(\d+)m)?').fillna(0).astype(int)
+    df = df.assign(day_of_journey=journey.dt.day, month_of_journey=journey.dt.month,
+                   year_of_journey=journey.dt.year, departed_time_hr=departure.dt.hour,
+                   departed_time_min=departure.dt.minute, arrival_hr=arrival.dt.hour,
+                   arrival_min=arrival.dt.minute, Duration_Hr=duration[0], Duration_min=duration[1])
+    df['Route'] = df['Route'].fillna(df['Route'].mode()[0])
+    df['Total_Stops'] = df['Total_Stops'].fillna(df['Total_Stops'].mode()[0])
+    x = df[['Airline', 'Source', 'Destination', 'Route', 'Total_Stops', 'day_of_journey', 'month_of_journey',
+            'year_of_journey', 'departed_time_hr', 'departed_time_min', 'arrival_hr', 'arrival_min',
+            'Duration_Hr', 'Duration_min']]
+
+    def build(x_train):
+        num, _ = _columns(x_train)
+        return Pipeline(steps=[
+            ('preprocessing', ColumnTransformer(transformers=[
+                ('num_pipleline', Pipeline(steps=[('num_scaling', StandardScaler())]), num),
+                ('airline_route', Pipeline(steps=[
+                    ('airline_route_encoding', TargetEncoder(target_type='continuous'))
+                ]), ['Airline', 'Route']),
+                ('source_destination_totalroute', Pipeline(steps=[
+                    ('source_encoding', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1))
+                ]), ['Source', 'Destination', 'Total_Stops']),
+            ])),
+            ('model', XGBRegressor()),
+        ])
+    return x, df['Price'], build
+
+
+@workload('telco_logistic', 'column_transformer _imputer _pipeline/telco_data.csv')
+def telco_logistic(df):
+    df['TotalCharges'] = df['TotalCharges'].str.strip().replace('', None).astype(float)
+    x, y = df.drop(columns=['Churn', 'customerID']), df['Churn']
+
+    def build(x_train):
+        num, cat = _columns(x_train)
+        return Pipeline(steps=[
+            ('preprocessing', ColumnTransformer(transformers=[
+                ('num_pipelines', Pipeline(steps=[
+                    ('imputer_for_num_cols', SimpleImputer(strategy='mean')),
+                    ('scaling-for_num_cols', StandardScaler()),
+                ]), num),
+                ('cat_pipelines', Pipeline(steps=[
+                    ('imputer_for_cat_cols', SimpleImputer(strategy='constant', fill_value='Unknown')),
+                    ('encoding_for_cat_cols', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)),
+                ]), cat),
+            ])),
+            ('model', LogisticRegression()),
+        ])
+    return x, y, build
+
+
+def scale_up(df, factor, seed=SCALE_SEED):
+    # `factor` stacked copies; float columns get a little multiplicative noise so the copies
+    # don't collapse into the same rows (and tree splits / neighbour searches) as the original
+    if factor == 1:
+        return df
+    rng = np.random.default_rng(seed)
+    big = pd.concat([df] * factor, ignore_index=True)
+    for col in big.select_dtypes(include='float').columns:
+        big[col] = big[col] * (1 + JITTER * rng.standard_normal(len(big)))
+    return big
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def run_workload(name, scale=1, workdir=None, steps=False):
+    path, read_kwargs, setup = WORKLOADS[name]
+    # everything imported so far is shared by all workloads; the peak past it is this one's
+    import_rss_mb = _peak_rss_mb()
+    source = resolve_path(path)
+    if scale != 1:
+        # the scaled copy is written once per run and read back as a plain CSV, like the original
+        source = os.path.join(workdir, f'{name}-x{scale}.csv')
+        if not os.path.exists(source):
+            scale_up(load_csv(path, use_cache=False, **read_kwargs), scale).to_csv(source, index=False)
+
+    df, load_s = _timed(lambda: load_csv(source, use_cache=False, **read_kwargs))
+    (x, y, build), prepare_s = _timed(lambda: setup(df))
+    x_train, x_test, y_train, y_test = split(x, y)
+
+    pipeline = build(x_train)
+    if steps:
+        # the wrapped pipeline itself, so the phases below still slice it into preprocessing and model
+        trace = Trace()
+        pipeline = instrument(pipeline, trace).estimator
+    preprocessing, model = pipeline[:-1], pipeline[-1]
+    xt_train, fit_s = _timed(lambda: preprocessing.fit_transform(x_train, y_train))
+    _, transform_s = _timed(lambda: preprocessing.transform(x_test))
+    _, model_fit_s = _timed(lambda: model.fit(xt_train, y_train))
+
+    one = x_test.iloc[:1]
+    pipeline.predict(one)
+    one_ms = []
+    for _ in range(ONE_ROW_REPEATS):
+        _, seconds = _timed(lambda: pipeline.predict(one))
+        one_ms.append(seconds * 1e3)
+    batch = x_test.iloc[:BATCH_ROWS]
+    _, batch_s = _timed(lambda: pipeline.predict(batch))
+    peak_rss_mb = _peak_rss_mb()
+
+    result = {
+        'workload': name,
+        'scale': scale,
+        'rows': len(df),
+        'train_rows': len(x_train),
+        'batch_rows': len(batch),
+        'load_s': load_s,
+        'prepare_s': prepare_s,
+        'preprocess_fit_s': fit_s,
+        'preprocess_transform_s': transform_s,
+        'model_fit_s': model_fit_s,
+        'predict_one_ms': float(np.median(one_ms)),
+        'predict_batch_ms': batch_s * 1e3,
+        'score': float(pipeline.score(x_test.iloc[:BATCH_ROWS], y_test.iloc[:BATCH_ROWS])),
+        'import_rss_mb': import_rss_mb,
+        'peak_rss_mb': peak_rss_mb,
+        'workload_rss_mb': peak_rss_mb - import_rss_mb,
+    }
+    if steps:
+        result['steps'] = trace.summary()
+    return result
+
+
+def _run_isolated(name, scale, workdir, timeout, steps=False):
+    cmd = [sys.executable, '-W', 'ignore', os.path.abspath(__file__), '--worker', name, '--scale', str(scale),
+           '--workdir', workdir] + (['--steps'] if steps else [])
+    try:
+        proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'workload': name, 'scale': scale, 'error': f'timed out after {timeout}s'}
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines() or [f'exit status {proc.returncode}']
+        return {'workload': name, 'scale': scale, 'error': lines[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'scikit-learn': sklearn.__version__,
+    }
+
+
+def run(names=None, scales=SCALES, timeout=TIMEOUT, progress=None, steps=False):
+    workdir = tempfile.mkdtemp(prefix='benchmarks-')
+    results = []
+    try:
+        for name in names or WORKLOADS:
+            for scale in scales:
+                result = _run_isolated(name, scale, workdir, timeout, steps)
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'environment': environment(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+
+
+def compare(baseline, current, tolerance=TOLERANCE, min_delta_s=MIN_DELTA_S):
+    # phases that got slower (or heavier) than the baseline run, plus workloads that stopped running
+    before = {(r['workload'], r['scale']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = before.get((result['workload'], result['scale']))
+        if old is None or 'error' in old:
+            continue
+        if 'error' in result:
+            regressions.append((result['workload'], result['scale'], 'error', None, None))
+            continue
+        for phase in PHASES:
+            if phase not in old:
+                # a baseline from before the phase was recorded
+                continue
+            # RSS compared in MB, millisecond phases in ms, the rest in seconds
+            floor = {'_ms': min_delta_s * 1e3, '_mb': 1.0}.get(phase[-3:], min_delta_s)
+            if result[phase] > old[phase] * (1 + tolerance) and result[phase] - old[phase] > floor:
+                regressions.append((result['workload'], result['scale'], phase, old[phase], result[phase]))
+    return regressions
+
+
+def _print_result(result):
+    label = f"{result['workload']} x{result['scale']}"
+    if 'error' in result:
+        print(f"{label:32}  {result['error']}")
+        return
+    print(f"{label:32}  {result['rows']:10,}  {result['load_s']:7.2f}  {result['prepare_s']:7.2f}  "
+          f"{result['preprocess_fit_s']:7.2f}  {result['preprocess_transform_s']:7.2f}  "
+          f"{result['model_fit_s']:8.2f}  {result['predict_one_ms']:7.2f}  {result['predict_batch_ms']:9.1f}  "
+          f"{result['workload_rss_mb']:7,.0f}  {result['peak_rss_mb']:7,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every notebook pipeline in the repo end to end, '
+                                                 'optionally on scaled-up copies of its data')
+    parser.add_argument('workloads', nargs='*', help=f"default: all of {', '.join(WORKLOADS)}")
+    parser.add_argument('--scale', type=int, nargs='+', default=SCALES,
+                        help='row multipliers to run each workload at, e.g. --scale 1 10 100')
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON from an earlier run; exit with status 1 if any phase regressed')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--timeout', type=int, default=TIMEOUT, help='seconds per workload and scale')
+    parser.add_argument('--steps', action='store_true',
+                        help='add a per-step fit/predict breakdown of each pipeline to the JSON (profiling.py)')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_workload(args.worker, args.scale[0], args.workdir, args.steps)))
+        return
+
+    unknown = [name for name in args.workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"unknown workload {', '.join(unknown)}; expected one of {', '.join(WORKLOADS)}")
+
+    print(f"{'workload':32}  {'rows':>10}  {'load s':>7}  {'prep s':>7}  {'pre fit':>7}  {'pre tf':>7}  "
+          f"{'model s':>8}  {'1 row ms':>7}  {'batch ms':>9}  {'RSS +MB':>7}  {'RSS MB':>7}")
+    report = run(args.workloads, args.scale, args.timeout, _print_result, args.steps)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        for name, scale, phase, old, new in regressions:
+            if phase == 'error':
+                print(f"REGRESSION {name} x{scale}: ran in the baseline, fails now")
+            else:
+                print(f"REGRESSION {name} x{scale} {phase}: {old:,.3f} -> {new:,.3f} ({new / old - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
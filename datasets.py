@@ -0,0 +1,156 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import time
+
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ROOT, '.dataset_cache')
+
+# notebooks were written against this checkout location
+LEGACY_ROOT = 'C:\\Users\\pavan\\Desktop\\data science\\'
+
+# object columns with at most this share of distinct values are stored dictionary-encoded
+CATEGORY_RATIO = 0.5
+
+# below this size parsing the CSV is as fast as reading the cache back
+MIN_CACHE_BYTES = 256 * 1024
+
+
+def resolve_path(path):
+    path = str(path)
+    if path.lower().startswith(LEGACY_ROOT.lower()):
+        path = path[len(LEGACY_ROOT):]
+    if not os.path.isabs(path):
+        path = os.path.join(ROOT, path.replace('\\', os.sep))
+    return os.path.normpath(path)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_paths(source, read_kwargs):
+    rel = os.path.relpath(source, ROOT)
+    key = hashlib.sha256(json.dumps([rel, read_kwargs], sort_keys=True, default=str).encode()).hexdigest()[:16]
+    name = ''.join(c if c.isalnum() else '_' for c in os.path.splitext(rel)[0]) + '-' + key
+    base = os.path.join(CACHE_DIR, name)
+    return base + '.parquet', base + '.json'
+
+
+def _typed(df):
+    for col in df.select_dtypes(include='object').columns:
+        if df[col].nunique() <= CATEGORY_RATIO * len(df):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _load(source, read_kwargs):
+    cache_path, meta_path = _cache_paths(source, read_kwargs)
+    stat = os.stat(source)
+    meta = _read_meta(meta_path)
+
+    if meta is not None and os.path.exists(cache_path):
+        if (meta['size'], meta['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+            return pd.read_parquet(cache_path)
+        # touched but maybe not changed: only the content hash decides
+        if meta['size'] == stat.st_size and meta['sha256'] == file_sha256(source):
+            meta['mtime_ns'] = stat.st_mtime_ns
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f, indent=2)
+            return pd.read_parquet(cache_path)
+
+    start = time.perf_counter()
+    df = pd.read_csv(source, **read_kwargs)
+    csv_seconds = time.perf_counter() - start
+
+    # parquet stores the string columns dictionary-encoded; they come back as the same pandas dtypes
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    with open(meta_path, 'w') as f:
+        json.dump({
+            'source': os.path.relpath(source, ROOT).replace(os.sep, '/'),
+            'sha256': file_sha256(source),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'rows': len(df),
+            'csv_seconds': csv_seconds,
+            'read_kwargs': read_kwargs,
+        }, f, indent=2, default=str)
+    return df
+
+
+def load_csv(path, categories=False, use_cache=True, **read_kwargs):
+    source = resolve_path(path)
+    if not use_cache or os.path.getsize(source) < MIN_CACHE_BYTES:
+        df = pd.read_csv(source, **read_kwargs)
+    else:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            df = pd.read_csv(source, **read_kwargs)
+        else:
+            df = _load(source, read_kwargs)
+    return _typed(df) if categories else df
+
+
+def clear_cache():
+    if os.path.isdir(CACHE_DIR):
+        for name in os.listdir(CACHE_DIR):
+            os.remove(os.path.join(CACHE_DIR, name))
+
+
+def repo_csvs():
+    try:
+        out = subprocess.run(['git', 'ls-files', '*.csv'], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        return [line for line in out.splitlines() if line]
+    except (OSError, subprocess.CalledProcessError):
+        return sorted(os.path.relpath(os.path.join(d, f), ROOT)
+                      for d, _, files in os.walk(ROOT) for f in files if f.endswith('.csv'))
+
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the columnar cache for the repo CSVs and report load times')
+    parser.add_argument('paths', nargs='*', help='repo-relative CSV paths (default: every tracked CSV)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'dataset':60}  {'rows':>8}  {'csv ms':>8}  {'cache ms':>8}  {'speedup':>7}")
+    for path in args.paths or repo_csvs():
+        load_csv(path)
+        csv_seconds = _best_of(lambda: pd.read_csv(resolve_path(path)), args.repeat)
+        cache_seconds = _best_of(lambda: load_csv(path), args.repeat)
+        rows = len(load_csv(path))
+        print(f"{path:60}  {rows:8,}  {csv_seconds * 1e3:8.1f}  {cache_seconds * 1e3:8.1f}  "
+              f"{csv_seconds / cache_seconds:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.stats import rankdata
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import GridSearchCV, ParameterGrid, check_cv, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OrdinalEncoder, StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from datasets import load_csv
+
+
+# the notebook's grid
+PARAM_GRID = {
+    'model__C': [0.01, 0.1, 1.0, 10],
+    'model__penalty': ['l1', 'l2'],
+    'model__solver': ['liblinear'],
+    'model__class_weight': ['balanced', None],
+}
+CV = 5
+SCORING = 'f1_macro'
+
+# the notebook's l2 candidates on a solver that can start from the previous C's solution; liblinear
+# can't, so warm starts change nothing on the notebook's own grid
+LBFGS_GRID = {
+    'model__C': [0.01, 0.1, 1.0, 10],
+    'model__penalty': ['l2'],
+    'model__solver': ['lbfgs'],
+    'model__class_weight': ['balanced', None],
+}
+GRIDS = {'notebook grid (liblinear)': PARAM_GRID, 'l2 grid (lbfgs)': LBFGS_GRID}
+
+# solvers that honour warm_start; each keeps its own objective, so a warm-started fit converges to the
+# same model as a cold one, within the solver's tolerance
+WARM_START_SOLVERS = {'lbfgs', 'newton-cg', 'newton-cholesky', 'sag', 'saga'}
+
+DATASETS = {
+    'loan_approval_dataset.csv': (
+        'logistic regression/research_grid(hyperparameter_tuning)/loan_approval_dataset.csv', 'Loan_Approved'),
+    'loan_data.csv': ('logistic regression/loan_data.csv', 'loan_status'),
+}
+
+
+def build_pipeline(num, cat):
+    # loan_approval_pipline.ipynb's pipeline, for any numeric / categorical column split
+    num_pipelines = Pipeline(steps=[('scaling-for_num_cols', StandardScaler())])
+    cat_pipelines = Pipeline(steps=[
+        ('encoding_for_cat_cols', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1))
+    ])
+    preprocessing = ColumnTransformer(transformers=[
+        ('num_pipelines', num_pipelines, list(num)),
+        ('cat_pipelines', cat_pipelines, list(cat)),
+    ])
+    return Pipeline(steps=[('preprocessing', preprocessing), ('model', LogisticRegression(max_iter=1000))])
+
+
+def _fold_scores(preprocessing, model, paths, x, y, train, test, scorer, warm_start):
+    # the fold's preprocessing is fitted once; each path then walks its Cs from strongest
+    # regularization up, starting every solve from the previous coefficients
+    preprocessing = clone(preprocessing)
+    x_train = preprocessing.fit_transform(x.iloc[train], y.iloc[train])
+    x_test = preprocessing.transform(x.iloc[test])
+    y_train, y_test = y.iloc[train], y.iloc[test]
+
+    scores = {}
+    for fixed, steps in paths:
+        estimator = clone(model).set_params(**fixed)
+        if warm_start and estimator.solver in WARM_START_SOLVERS:
+            estimator.set_params(warm_start=True)
+        for index, C in steps:
+            estimator.set_params(C=C).fit(x_train, y_train)
+            scores[index] = scorer(estimator, x_test, y_test)
+    return scores
+
+
+class PathSearchCV:
+    """GridSearchCV for a preprocessing + LogisticRegression pipeline, with the grid walked as
+    regularization paths. Preprocessing is fitted once per fold and the folds run in parallel.
+
+    The grid may only vary the final step. cv_results_, best_params_ and best_estimator_ follow
+    GridSearchCV, including candidate order and tie-breaking, and every candidate is fitted exactly as
+    configured: the CV scores are GridSearchCV's (up to liblinear's own random shuffling) and
+    best_estimator_ is refit from the pipeline as given.
+
+    With `warm_start`, each C of a path starts from the previous C's coefficients, for candidates whose
+    solver supports it (lbfgs, newton-cg, newton-cholesky, sag, saga; liblinear candidates are still
+    solved cold). The objective is unchanged, but a warm-started solve stops at its tolerance from a
+    different starting point, so CV scores can differ from GridSearchCV's in the last digits and a
+    near-tie between candidates may rank differently."""
+
+    def __init__(self, estimator, param_grid, cv=CV, scoring=SCORING, n_jobs=None, warm_start=False, refit=True):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.warm_start = warm_start
+        self.refit = refit
+
+    def _paths(self, candidates):
+        # candidates that differ only in C form one path, in ascending C
+        step = self.estimator.steps[-1][0] + '__'
+        paths = {}
+        for index, params in enumerate(candidates):
+            if any(not key.startswith(step) for key in params) or step + 'C' not in params:
+                raise ValueError(f"PathSearchCV needs a grid over {step}C and other {step}* parameters only")
+            fixed = {key[len(step):]: value for key, value in params.items() if key != step + 'C'}
+            key = tuple(sorted((name, repr(value)) for name, value in fixed.items()))
+            paths.setdefault(key, (fixed, []))[1].append((index, params[step + 'C']))
+        return [(fixed, sorted(steps, key=lambda item: item[1])) for fixed, steps in paths.values()]
+
+    def fit(self, x, y):
+        candidates = list(ParameterGrid(self.param_grid))
+        cv = check_cv(self.cv, y, classifier=True)
+        splits = list(cv.split(x, y))
+        scorer = get_scorer(self.scoring)
+        preprocessing, model = self.estimator[:-1], self.estimator[-1]
+
+        folds = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fold_scores)(preprocessing, model, self._paths(candidates), x, y, train, test, scorer,
+                                  self.warm_start)
+            for train, test in splits)
+
+        scores = np.array([[fold[i] for i in range(len(candidates))] for fold in folds])
+        mean = scores.mean(axis=0)
+        self.cv_results_ = {
+            'params': candidates,
+            'mean_test_score': mean,
+            'std_test_score': scores.std(axis=0),
+            'rank_test_score': rankdata(-mean, method='min').astype(np.int32),
+            **{f'split{i}_test_score': fold_scores for i, fold_scores in enumerate(scores)},
+        }
+        self.best_index_ = int(np.argmin(self.cv_results_['rank_test_score']))
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = float(mean[self.best_index_])
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(x, y)
+        return self
+
+
+def _load(name):
+    path, target = DATASETS[name]
+    df = load_csv(path)
+    x, y = df.drop(columns=target), df[target]
+    x_train, _, y_train, _ = train_test_split(x, y, train_size=0.8, random_state=42)
+    num = x_train.select_dtypes(include='number').columns
+    cat = x_train.select_dtypes(exclude='number').columns
+    return build_pipeline(num, cat), x_train, y_train
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def compare(names=tuple(DATASETS), n_jobs=None, grids=GRIDS):
+    results = {}
+    for name in names:
+        pipeline, x_train, y_train = _load(name)
+        results[name] = {'rows': len(x_train), 'grids': {}}
+        for grid_name, param_grid in grids.items():
+            grid_s, grid = _timed(lambda: GridSearchCV(pipeline, param_grid, cv=CV, scoring=SCORING,
+                                                       n_jobs=n_jobs).fit(x_train, y_train))
+            runs = {'GridSearchCV': {'seconds': grid_s, 'best_params': grid.best_params_,
+                                     'best_score': float(grid.best_score_)}}
+            for label, warm_start in [('path', False), ('path, warm-started', True)]:
+                seconds, search = _timed(lambda: PathSearchCV(pipeline, param_grid, n_jobs=n_jobs,
+                                                              warm_start=warm_start).fit(x_train, y_train))
+                runs[label] = {
+                    'seconds': seconds,
+                    'speedup': grid_s / seconds,
+                    'best_params': search.best_params_,
+                    'best_score': search.best_score_,
+                    'same_best': search.best_params_ == grid.best_params_,
+                    'max_score_diff': float(np.max(np.abs(search.cv_results_['mean_test_score']
+                                                          - grid.cv_results_['mean_test_score']))),
+                    # liblinear shuffles with random_state=None, so two refits agree only to its tolerance
+                    'max_coef_diff': float(np.max(np.abs(search.best_estimator_[-1].coef_
+                                                         - grid.best_estimator_[-1].coef_))),
+                }
+            results[name]['grids'][grid_name] = {'candidates': len(ParameterGrid(param_grid)), 'runs': runs}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regularization-path search against GridSearchCV '
+                                                 'for the loan-approval logistic pipeline')
+    parser.add_argument('datasets', nargs='*', help=f"default: {', '.join(DATASETS)}")
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--report', default=None, help='write the comparison as JSON')
+    args = parser.parse_args()
+    unknown = [name for name in args.datasets if name not in DATASETS]
+    if unknown:
+        parser.error(f"unknown dataset {', '.join(unknown)}; expected one of {', '.join(DATASETS)}")
+
+    results = compare(args.datasets or list(DATASETS), args.n_jobs)
+    for name, result in results.items():
+        print(f"{name}: {result['rows']:,} training rows")
+        for grid_name, grid in result['grids'].items():
+            print(f"  {grid_name}: {grid['candidates']} candidates x {CV} folds")
+            for label, run in grid['runs'].items():
+                line = f"    {label:20} {run['seconds']:7.2f}s  best {SCORING} {run['best_score']:.5f}"
+                if 'speedup' in run:
+                    line += (f"  {run['speedup']:5.1f}x  same best params: {run['same_best']}, max CV score diff "
+                             f"{run['max_score_diff']:.1e}, max coef diff {run['max_coef_diff']:.1e}")
+                print(line)
+            print(f"    best params: {grid['runs']['GridSearchCV']['best_params']}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+import argparse
+import copy
+import itertools
+import json
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator
+from sklearn.compose import ColumnTransformer
+from sklearn.exceptions import NotFittedError
+from sklearn.pipeline import Pipeline
+from sklearn.utils.metaestimators import available_if
+from sklearn.utils.validation import check_is_fitted
+
+
+ROOT_NAME = 'pipeline'
+
+# events kept per trace; older ones fall off, so a trace left on in a server stays bounded
+WINDOW = 10_000
+
+# the wrapper's own parameters; everything else passed to set_params goes to the wrapped estimator
+OWN_PARAMS = ('estimator', 'name', 'trace')
+
+
+class Trace:
+    """Collects one event per instrumented call. Every step wrapper of a pipeline shares one trace,
+    including the clones ColumnTransformer makes while fitting.
+
+    Recording costs a few tens of microseconds per step, cheap enough to leave on in serving; `every`
+    records only every n-th top-level call. `allocations` (tracemalloc) and `density` (a nonzero count of dense outputs)
+    are too slow for serving and are off by default."""
+
+    def __init__(self, window=WINDOW, every=1, allocations=False, density=False):
+        self.window = window
+        self.every = every
+        self.allocations = allocations
+        self.density = density
+        self.events = deque(maxlen=window)
+        self._calls = itertools.count()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # sampled calls in flight on any thread, and whether this trace turned tracemalloc on
+        self._active = 0
+        self._started_tracing = False
+
+    def __deepcopy__(self, memo):
+        # sklearn's clone deep-copies non-estimator parameters; the clones must keep writing here
+        return self
+
+    def __reduce__(self):
+        # a pickled profiled pipeline comes back with an empty trace of the same settings
+        return Trace, (self.window, self.every, self.allocations, self.density)
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+
+    def call(self, name, method, fn, X, *args, **kwargs):
+        local = self._local
+        stack = getattr(local, 'stack', None)
+        if stack is None:
+            stack = local.stack = []
+            local.skipped = 0
+        # only a true top-level call draws from the counter; the steps it runs inherit its decision,
+        # so an unsampled call counts its depth instead of pushing frames
+        if local.skipped or (not stack and next(self._calls) % self.every):
+            local.skipped += 1
+            try:
+                return fn(X, *args, **kwargs)
+            finally:
+                local.skipped -= 1
+
+        if self.allocations:
+            self._start_tracing()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+        frame = {'label': f'{name}.{method}', 'children_ms': 0.0, 'peak': 0,
+                 'base': current if self.allocations else 0}
+        stack.append(frame)
+        cpu = time.process_time()
+        start = time.perf_counter()
+        try:
+            result = fn(X, *args, **kwargs)
+        finally:
+            wall_ms = (time.perf_counter() - start) * 1000
+            cpu_ms = (time.process_time() - cpu) * 1000
+            stack.pop()
+            alloc_kb = None
+            if self.allocations:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                alloc_kb = (peak - frame['base']) / 1024
+                if stack:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            if stack:
+                stack[-1]['children_ms'] += wall_ms
+            path = ';'.join([parent['label'] for parent in stack] + [frame['label']])
+            if self.allocations:
+                self._stop_tracing()
+
+        shape, density = _output_stats(result, self.density)
+        event = {
+            'step': path,
+            'name': name,
+            'method': method,
+            'depth': len(stack),
+            'wall_ms': wall_ms,
+            'self_ms': wall_ms - frame['children_ms'],
+            # process-wide: includes BLAS/OpenMP worker threads, and other requests in a threaded server
+            'cpu_ms': cpu_ms,
+            'alloc_kb': alloc_kb,
+            'rows': _n_rows(X),
+            'shape': shape,
+            'density': density,
+        }
+        # summary() and folded() iterate the deque under the lock; an unlocked append could mutate it mid-way
+        with self._lock:
+            self.events.append(event)
+        return result
+
+    def _start_tracing(self):
+        with self._lock:
+            if self._active == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._active += 1
+
+    def _stop_tracing(self):
+        # tracing that was on before the first call is left on; ours stops with the last call in flight
+        with self._lock:
+            self._active -= 1
+            if self._active == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def summary(self):
+        # one row per step and method, in the order the steps first ran
+        with self._lock:
+            events = list(self.events)
+        groups = {}
+        for event in events:
+            groups.setdefault(event['step'], []).append(event)
+
+        rows = []
+        for step, group in groups.items():
+            wall = np.array([event['wall_ms'] for event in group])
+            allocs = [event['alloc_kb'] for event in group if event['alloc_kb'] is not None]
+            last = group[-1]
+            rows.append({
+                'step': step,
+                'depth': last['depth'],
+                'calls': len(group),
+                'wall_ms': float(wall.sum()),
+                'p50_ms': float(np.percentile(wall, 50)),
+                'p95_ms': float(np.percentile(wall, 95)),
+                'self_ms': float(sum(event['self_ms'] for event in group)),
+                'cpu_ms': float(sum(event['cpu_ms'] for event in group)),
+                'alloc_kb': max(allocs) if allocs else None,
+                'rows': last['rows'],
+                'shape': last['shape'],
+                'density': last['density'],
+            })
+        return rows
+
+    def folded(self):
+        # Brendan Gregg's collapsed-stack format, self time in microseconds: feed it to flamegraph.pl,
+        # speedscope or inferno to get the flame graph
+        totals = {}
+        with self._lock:
+            for event in self.events:
+                totals[event['step']] = totals.get(event['step'], 0.0) + event['self_ms']
+        return '\n'.join(f'{step} {round(ms * 1000)}' for step, ms in totals.items()) + '\n'
+
+    def write_folded(self, path):
+        with open(path, 'w') as f:
+            f.write(self.folded())
+
+
+def _n_rows(X):
+    shape = getattr(X, 'shape', None)
+    if shape is not None and len(shape):
+        return int(shape[0])
+    try:
+        return len(X)
+    except TypeError:
+        return None
+
+
+def _output_stats(result, dense_density):
+    shape = getattr(result, 'shape', None)
+    if shape is None or isinstance(result, BaseEstimator):
+        return None, None
+    shape = [int(n) for n in shape]
+    size = int(np.prod(shape))
+    if sp.issparse(result):
+        return shape, result.nnz / size if size else None
+    if dense_density and size:
+        return shape, float(np.count_nonzero(np.asarray(result)) / size)
+    return shape, None
+
+
+def _has(method):
+    return lambda self: hasattr(self.estimator, method)
+
+
+class Profiled(BaseEstimator):
+    """Stands in for one estimator of a pipeline and times its calls into `trace`. Fitted attributes,
+    parameters (`model__C` still reaches the model) and tags all come from the wrapped estimator."""
+
+    def __init__(self, estimator, name, trace):
+        self.estimator = estimator
+        self.name = name
+        self.trace = trace
+
+    def __getattr__(self, attr):
+        estimator = self.__dict__.get('estimator')
+        if estimator is None or attr.startswith('__'):
+            raise AttributeError(attr)
+        return getattr(estimator, attr)
+
+    def __sklearn_tags__(self):
+        return self.estimator.__sklearn_tags__()
+
+    def __sklearn_is_fitted__(self):
+        try:
+            check_is_fitted(self.estimator)
+        except NotFittedError:
+            return False
+        return True
+
+    def get_params(self, deep=True):
+        params = {'estimator': self.estimator, 'name': self.name, 'trace': self.trace}
+        if deep:
+            params.update(self.estimator.get_params(deep=True))
+        return params
+
+    def set_params(self, **params):
+        for key in OWN_PARAMS:
+            if key in params:
+                setattr(self, key, params.pop(key))
+        if params:
+            self.estimator.set_params(**params)
+        return self
+
+    def _call(self, method, X, *args, **kwargs):
+        return self.trace.call(self.name, method, getattr(self.estimator, method), X, *args, **kwargs)
+
+    def fit(self, X, y=None, **params):
+        self._call('fit', X, y, **params)
+        return self
+
+    @available_if(lambda self: hasattr(self.estimator, 'fit_transform') or hasattr(self.estimator, 'transform'))
+    def fit_transform(self, X, y=None, **params):
+        if hasattr(self.estimator, 'fit_transform'):
+            return self._call('fit_transform', X, y, **params)
+        return self.fit(X, y, **params).transform(X)
+
+    @available_if(_has('transform'))
+    def transform(self, X, **params):
+        return self._call('transform', X, **params)
+
+    @available_if(_has('predict'))
+    def predict(self, X, **params):
+        return self._call('predict', X, **params)
+
+    @available_if(_has('predict_proba'))
+    def predict_proba(self, X, **params):
+        return self._call('predict_proba', X, **params)
+
+    @available_if(_has('decision_function'))
+    def decision_function(self, X, **params):
+        return self._call('decision_function', X, **params)
+
+    @available_if(_has('score'))
+    def score(self, X, y=None, **params):
+        return self._call('score', X, y, **params)
+
+
+def _wrap(estimator, name, trace):
+    if estimator is None or isinstance(estimator, str):
+        # 'drop' / 'passthrough'
+        return estimator
+    if isinstance(estimator, Pipeline):
+        estimator = copy.copy(estimator)
+        estimator.steps = [(step, _wrap(est, step, trace)) for step, est in estimator.steps]
+    elif isinstance(estimator, ColumnTransformer):
+        estimator = copy.copy(estimator)
+        estimator.transformers = [(n, _wrap(est, n, trace), cols) for n, est, cols in estimator.transformers]
+        if hasattr(estimator, 'transformers_'):
+            estimator.transformers_ = [(n, _wrap(est, n, trace), cols) for n, est, cols in estimator.transformers_]
+    return Profiled(estimator, name, trace)
+
+
+def instrument(estimator, trace=None, name=ROOT_NAME):
+    """A profiled stand-in for `estimator`: every step of every (nested) Pipeline and ColumnTransformer
+    is wrapped, fitted or not. The original is left untouched; the wrappers share its fitted steps."""
+    return _wrap(estimator, name, trace if trace is not None else Trace())
+
+
+def uninstrument(estimator):
+    # the plain estimator back, e.g. before handing a profiled, fitted pipeline to save_artifact
+    if isinstance(estimator, Profiled):
+        estimator = estimator.estimator
+    if isinstance(estimator, Pipeline):
+        estimator = copy.copy(estimator)
+        estimator.steps = [(step, uninstrument(est)) for step, est in estimator.steps]
+    elif isinstance(estimator, ColumnTransformer):
+        estimator = copy.copy(estimator)
+        estimator.transformers = [(n, uninstrument(est), cols) for n, est, cols in estimator.transformers]
+        if hasattr(estimator, 'transformers_'):
+            estimator.transformers_ = [(n, uninstrument(est), cols) for n, est, cols in estimator.transformers_]
+    return estimator
+
+
+def print_summary(rows):
+    print(f"{'step':48}  {'calls':>5}  {'wall ms':>9}  {'self ms':>9}  {'cpu ms':>9}  {'alloc KB':>9}  "
+          f"{'output':>14}  {'density':>7}")
+    for row in rows:
+        label = '  ' * row['depth'] + row['step'].rsplit(';', 1)[-1]
+        alloc = f"{row['alloc_kb']:9,.0f}" if row['alloc_kb'] is not None else f"{'':9}"
+        shape = 'x'.join(map(str, row['shape'])) if row['shape'] else ''
+        density = f"{row['density']:7.3f}" if row['density'] is not None else ''
+        print(f"{label:48}  {row['calls']:5d}  {row['wall_ms']:9.2f}  {row['self_ms']:9.2f}  {row['cpu_ms']:9.2f}  "
+              f"{alloc}  {shape:>14}  {density:>7}")
+
+
+def main():
+    from benchmarks import BATCH_ROWS, ONE_ROW_REPEATS, WORKLOADS, load_csv, scale_up, split
+
+    parser = argparse.ArgumentParser(description="Per-step fit and predict breakdown of a notebook pipeline")
+    parser.add_argument('workload', choices=list(WORKLOADS))
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--allocations', action='store_true', help='also trace peak allocations (slow)')
+    parser.add_argument('--density', action='store_true', help='also count nonzeros of dense outputs')
+    parser.add_argument('--folded', default=None, help='write collapsed stacks for a flame graph')
+    parser.add_argument('--json', default=None, help='write the summary and raw events as JSON')
+    args = parser.parse_args()
+
+    path, read_kwargs, setup = WORKLOADS[args.workload]
+    x, y, build = setup(scale_up(load_csv(path, **read_kwargs), args.scale))
+    x_train, x_test, y_train, y_test = split(x, y)
+    trace = Trace(allocations=args.allocations, density=args.density)
+    profiled = instrument(build(x_train), trace)
+
+    profiled.fit(x_train, y_train)
+    profiled.predict(x_test.iloc[:BATCH_ROWS])
+    for _ in range(ONE_ROW_REPEATS):
+        profiled.predict(x_test.iloc[:1])
+    print_summary(trace.summary())
+
+    # what leaving the hooks on costs a single-row prediction, against the same fitted steps unwrapped
+    pipeline = uninstrument(profiled)
+    one = x_test.iloc[:1]
+    plain, hooked = [], []
+    for _ in range(ONE_ROW_REPEATS):
+        for target, times in ((pipeline, plain), (profiled, hooked)):
+            start = time.perf_counter()
+            target.predict(one)
+            times.append((time.perf_counter() - start) * 1000)
+    print(f"1-row predict p50: {np.median(plain):.3f}ms plain, {np.median(hooked):.3f}ms profiled")
+
+    if args.folded:
+        trace.write_folded(args.folded)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': trace.summary(), 'events': list(trace.events)}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import os
+import pickle
+import sys
+import warnings
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the modules under test import their neighbours by bare name, as the notebooks and scripts do
+for directory in [ROOT, os.path.join(ROOT, 'PROJECT'), os.path.join(ROOT, 'KNN'),
+                  os.path.join(ROOT, 'column_transformer _imputer _pipeline')]:
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+
+@pytest.fixture(scope='session')
+def pipeline():
+    with warnings.catch_warnings():
+        # xgboost warns about unpickling a booster; it's the model the app ships
+        warnings.simplefilter('ignore')
+        with open(os.path.join(ROOT, 'PROJECT', 'model.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+
+@pytest.fixture(scope='session')
+def x_test():
+    # model.py's test split, with a few rows of categories the model never saw
+    from artifact import split
+
+    _, x_test, _, _ = split(os.path.join(ROOT, 'PROJECT', 'car_sales_data.csv'))
+    x_test = x_test.iloc[:2000].astype({'Manufacturer': str, 'Model': str, 'Fuel type': str})
+    x_test.iloc[:5, x_test.columns.get_loc('Manufacturer')] = 'Lada'
+    x_test.iloc[5:10, x_test.columns.get_loc('Model')] = 'Niva'
+    x_test.iloc[10:15, x_test.columns.get_loc('Fuel type')] = 'Hydrogen'
+    return x_test.reset_index(drop=True)
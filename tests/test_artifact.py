@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pytest
+
+from artifact import NATIVE_MAX_ROWS, load_artifact, save_artifact, save_trained, split
+from native import NativePredictor
+
+TOLERANCE = 0.5
+
+
+@pytest.fixture
+def artifact(pipeline, tmp_path):
+    save_artifact(pipeline, root=str(tmp_path), metrics={'mae': 0.0})
+    return load_artifact(str(tmp_path))
+
+
+def test_round_trip_reproduces_predictions(pipeline, x_test, artifact):
+    expected = pipeline.predict(x_test)
+    # both sides of the size switch: the NumPy walk for small batches, the booster for large ones
+    small = x_test.iloc[:NATIVE_MAX_ROWS]
+    assert np.abs(artifact.predict(small) - expected[:NATIVE_MAX_ROWS]).max() < TOLERANCE
+    assert np.abs(artifact.predict(x_test) - expected).max() < TOLERANCE
+    np.testing.assert_array_equal(artifact.predict(small), NativePredictor.from_pipeline(pipeline).predict(small))
+    row = x_test.iloc[0].to_dict()
+    assert abs(artifact.predict_one(row) - expected[0]) < TOLERANCE
+
+
+def test_manifest_hashes_are_verified(pipeline, tmp_path):
+    path = save_artifact(pipeline, root=str(tmp_path))
+    assert load_artifact(str(tmp_path)).version == path.rsplit('/', 1)[-1]
+
+    with open(f'{path}/arrays/value.npy', 'r+b') as f:
+        f.seek(-4, 2)
+        f.write(b'\x00\x00\x80\x7f')
+    with pytest.raises(ValueError, match='does not match its manifest hash'):
+        load_artifact(str(tmp_path))
+
+
+def test_trained_artifact_has_a_band_and_a_source_record(pipeline, tmp_path):
+    # what the app's price band and retrain.py's append-only continuation read back
+    from retrain import read_delta
+
+    data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PROJECT',
+                             'car_sales_data.csv')
+    x_train, x_test, y_train, y_test = split(data_path)
+    path, info = save_trained(pipeline, x_train[:2000], y_train[:2000], x_test[:1000], y_test[:1000], data_path,
+                              len(x_train) + len(x_test), root=str(tmp_path), training={'source': 'tests'})
+    model = load_artifact(path)
+    assert model.interval['coverage'] == info['coverage']
+    assert model.half_width_transformed(model.transform_one(x_test.iloc[0].to_dict()))[0] > 0
+    assert model.manifest['training']['source'] == 'tests'
+    delta, _ = read_delta(model, data_path)
+    assert len(delta) == 0
@@ -0,0 +1,27 @@
+import json
+
+import numpy as np
+import pytest
+
+from compact import export_compact
+from native import NativePredictor
+
+
+@pytest.fixture(scope='module')
+def native(pipeline):
+    return NativePredictor.from_pipeline(pipeline)
+
+
+def test_lossless_export_matches_the_native_walk(pipeline, x_test, native, tmp_path):
+    compact = export_compact(pipeline, str(tmp_path / 'compact.npz'), max_error=0)
+    np.testing.assert_array_equal(compact.predict(x_test), native.predict(x_test))
+
+
+def test_quantized_export_stays_within_its_bound(pipeline, x_test, native, tmp_path):
+    path = tmp_path / 'compact.npz'
+    compact = export_compact(pipeline, str(path))
+    with np.load(path, allow_pickle=False) as data:
+        bound = json.loads(str(data['meta']))['compact']['max_error_bound']
+    assert 0 < bound
+    # float32 accumulation in the walk adds a little on top of the quantization bound
+    assert np.abs(compact.predict(x_test) - native.predict(x_test)).max() <= bound + 0.01
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import MinMaxScaler, OrdinalEncoder, StandardScaler
+
+from fused import FusedColumnTransformer, fuse
+
+NUMERIC = ['a', 'b']
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'a': rng.normal(50, 10, 40),
+        'b': rng.normal(-3, 2, 40),
+        'c': rng.choice(['x', 'y', 'z'], 40).astype(object),
+        'd': rng.integers(0, 5, 40).astype(float),
+    })
+    df.loc[::7, 'a'] = np.nan
+    df.loc[::5, 'c'] = np.nan
+    return df
+
+
+BRANCHES = {
+    'standard': [StandardScaler()],
+    'no mean': [StandardScaler(with_mean=False)],
+    'no std': [StandardScaler(with_std=False)],
+    'neither': [StandardScaler(with_mean=False, with_std=False)],
+    'min-max': [MinMaxScaler()],
+    'min-max range': [MinMaxScaler(feature_range=(-1, 3))],
+    'scaled twice': [StandardScaler(with_mean=False), MinMaxScaler()],
+}
+
+
+@pytest.mark.parametrize('steps', BRANCHES.values(), ids=BRANCHES.keys())
+def test_affine_branches_match_column_transformer(frame, steps):
+    stock = ColumnTransformer([
+        ('numeric', make_pipeline(SimpleImputer(strategy='median'), *steps), NUMERIC),
+        ('counts', 'passthrough', ['d']),
+    ]).fit(frame)
+    assert all(plan[0] == 'affine' for plan in fuse(stock).branches_[0][3])
+    np.testing.assert_allclose(fuse(stock, np.float64).transform(frame), stock.transform(frame), atol=1e-9)
+
+
+def test_ordinal_branch_matches_column_transformer(frame):
+    encoder = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)
+    stock = ColumnTransformer([
+        ('categories', make_pipeline(SimpleImputer(strategy='most_frequent'), encoder), ['c']),
+        ('numeric', StandardScaler(with_mean=False), NUMERIC),
+    ]).fit(frame)
+    fused = fuse(stock, np.float64)
+    assert fused.branches_[0][3][0][0] == 'ordinal'
+
+    unseen = frame.copy()
+    unseen.loc[:3, 'c'] = 'w'
+    for data in (frame, unseen):
+        np.testing.assert_allclose(fused.transform(data), stock.transform(data), equal_nan=True, atol=1e-9)
+
+
+def test_fit_matches_fuse(frame):
+    stock = ColumnTransformer([('numeric', StandardScaler(with_mean=False), NUMERIC)], remainder='drop')
+    fitted = FusedColumnTransformer(stock, dtype=np.float64).fit(frame)
+    np.testing.assert_allclose(fitted.transform(frame), stock.fit(frame).transform(frame), equal_nan=True)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from knn_index import IndexedKNNRegressor
+
+
+def _clustered(seed=0):
+    # 20 tight pairs: one IVF cell per pair, so a single probe holds 2 points
+    rng = np.random.default_rng(seed)
+    X = np.repeat(rng.normal(size=(20, 3)) * 10, 2, axis=0) + rng.normal(size=(40, 3)) * 0.01
+    return X, rng.normal(size=40)
+
+
+def test_ivf_probes_more_cells_when_the_probed_ones_are_short():
+    X, y = _clustered()
+    model = IndexedKNNRegressor(n_neighbors=5, algorithm='ivf', n_lists=20, n_probe=1, random_state=0).fit(X, y)
+    dist, ind = model.kneighbors(X)
+
+    assert np.isfinite(dist).all()
+    # five distinct real neighbours per row, none of them the placeholder row 0 padding
+    assert all(len(set(row)) == 5 for row in ind.tolist())
+    assert np.isfinite(model.predict(X)).all()
+
+
+def test_kneighbors_rejects_more_neighbours_than_samples():
+    X, y = _clustered()
+    for algorithm in ['ivf', 'kd_tree']:
+        model = IndexedKNNRegressor(n_neighbors=5, algorithm=algorithm, n_lists=20, random_state=0).fit(X, y)
+        with pytest.raises(ValueError, match='n_neighbors <= n_samples_fit'):
+            model.kneighbors(X, n_neighbors=41)
@@ -0,0 +1,25 @@
+import numpy as np
+
+from native import NativePredictor
+
+# float32 inputs and leaf sums against xgboost's own float32 accumulation
+TOLERANCE = 0.5
+
+
+def test_tree_walk_matches_the_pipeline(pipeline, x_test):
+    native = NativePredictor.from_pipeline(pipeline)
+    assert np.abs(native.predict(x_test) - pipeline.predict(x_test)).max() < TOLERANCE
+
+
+def test_single_row_path_matches_the_batch_path(pipeline, x_test):
+    native = NativePredictor.from_pipeline(pipeline)
+    batch = native.predict(x_test.iloc[:20])
+    one = [native.predict_one(row) for row in x_test.iloc[:20].to_dict('records')]
+    np.testing.assert_allclose(one, batch, rtol=0, atol=1e-6)
+
+
+def test_save_load_round_trip(pipeline, x_test, tmp_path):
+    native = NativePredictor.from_pipeline(pipeline)
+    native.save(tmp_path / 'model_native.npz')
+    loaded = NativePredictor.load(tmp_path / 'model_native.npz')
+    np.testing.assert_array_equal(loaded.predict(x_test), native.predict(x_test))
@@ -0,0 +1,29 @@
+import numpy as np
+
+from profiling import Trace, instrument, uninstrument
+
+
+def _predict(pipeline, x_test, trace, calls):
+    profiled = instrument(pipeline, trace)
+    for i in range(calls):
+        profiled.predict(x_test.iloc[i:i + 1])
+    return profiled
+
+
+def test_instrumented_pipeline_predicts_the_same(pipeline, x_test):
+    profiled = _predict(pipeline, x_test, Trace(), 1)
+    np.testing.assert_array_equal(profiled.predict(x_test), pipeline.predict(x_test))
+    np.testing.assert_array_equal(uninstrument(profiled).predict(x_test), pipeline.predict(x_test))
+
+
+def test_sampling_records_whole_call_trees(pipeline, x_test):
+    full = Trace()
+    _predict(pipeline, x_test, full, 1)
+    tree = [event['step'] for event in full.events]
+
+    sampled = Trace(every=2)
+    _predict(pipeline, x_test, sampled, 4)
+    roots = [event for event in sampled.events if event['depth'] == 0]
+    assert [event['step'] for event in roots] == ['pipeline.predict'] * 2
+    assert all(event['step'].startswith('pipeline.predict') for event in sampled.events)
+    assert [event['step'] for event in sampled.events] == tree * 2